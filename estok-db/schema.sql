@@ -1,5 +1,13 @@
 -- Extension: pg_trgm
 CREATE EXTENSION IF NOT EXISTS pg_trgm;
+-- Extension: unaccent (accent-insensitive search: "pao" finds "Pão")
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() is only STABLE, so it cannot be used in an index; this IMMUTABLE
+-- wrapper (with the dictionary fixed) backs index_descricao_normalizada_trigram.
+CREATE OR REPLACE FUNCTION public.estok_normalizar(texto TEXT) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT lower(public.unaccent('public.unaccent'::regdictionary, texto)) $$;
 
 -- Table: produtos
 CREATE TABLE IF NOT EXISTS public.produtos (
@@ -38,7 +46,8 @@ CREATE TABLE IF NOT EXISTS public.itens_venda (
     quantidade NUMERIC(10,3),
     preco_custo NUMERIC(10,2),
     valor_unitario NUMERIC(10,2),
-    valor_total NUMERIC(10,2)
+    valor_total NUMERIC(10,2),
+    data_venda TIMESTAMP WITHOUT TIME ZONE
 );
 
 -- Table: movimentacoes_estoque
@@ -54,14 +63,143 @@ CREATE TABLE IF NOT EXISTS public.movimentacoes_estoque (
     observacao TEXT
 );
 
+-- Upgrade: itens_venda.data_venda (copy of vendas.data_venda, partition key for partition_tool.py)
+ALTER TABLE public.itens_venda ADD COLUMN IF NOT EXISTS data_venda TIMESTAMP WITHOUT TIME ZONE;
+UPDATE public.itens_venda i SET data_venda = v.data_venda
+FROM public.vendas v
+WHERE i.id_venda = v.id AND i.data_venda IS NULL;
+
+-- Table: vendas_idempotencia (keys of sales sent by offline terminals via /sales/batch)
+CREATE TABLE IF NOT EXISTS public.vendas_idempotencia (
+    chave VARCHAR(64) PRIMARY KEY,
+    id_venda INTEGER,
+    data_registro TIMESTAMP WITHOUT TIME ZONE
+);
+
+-- Table: vendas_resumo_hora (hourly sales rollup read by /reports/aggregate)
+-- Rows with id_produto NULL are the totals of the (hour, payment method).
+CREATE TABLE IF NOT EXISTS public.vendas_resumo_hora (
+    id SERIAL PRIMARY KEY,
+    hora TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    id_forma_pagamento INTEGER,
+    id_produto INTEGER,
+    receita NUMERIC(14,2),
+    lucro NUMERIC(14,2),
+    quantidade NUMERIC(14,3),
+    vendas INTEGER
+);
+
+-- Table: vendas_resumo_controle (single row: the rollup holds the sales with id <= ultimo_id_venda)
+CREATE TABLE IF NOT EXISTS public.vendas_resumo_controle (
+    id INTEGER PRIMARY KEY,
+    ultimo_id_venda INTEGER NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMP WITHOUT TIME ZONE
+);
+
 -- Indexes for produtos
 CREATE INDEX IF NOT EXISTS index_codigo_auxiliar ON public.produtos (codigo_auxiliar);
 CREATE INDEX IF NOT EXISTS index_ean13 ON public.produtos (ean13);
 CREATE INDEX IF NOT EXISTS index_descricao_trigram ON public.produtos USING gin (descricao gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS index_descricao_normalizada_trigram ON public.produtos USING gin (public.estok_normalizar(descricao) gin_trgm_ops);
 
 -- Indexes for itens_venda (Primary Key index is implicit, but good to have explicit FK indexes for performance if needed, though not strictly in original schema observation. I will stick to observed indexes only + implicit PKs)
 -- Observed indexes were mainly PKs and the specific ones on produtos.
 
+-- Indexes for reports (date-range filters and per-sale item lookups)
+CREATE INDEX IF NOT EXISTS index_vendas_data_venda ON public.vendas (data_venda);
+CREATE INDEX IF NOT EXISTS index_itens_venda_id_venda ON public.itens_venda (id_venda);
+-- Covering index for per-product reports (profitability/ABC): period scans read only the index
+CREATE INDEX IF NOT EXISTS index_itens_venda_data_venda ON public.itens_venda (data_venda) INCLUDE (id_produto, quantidade, valor_total, preco_custo);
+
+-- Index for point-in-time stock (Kardex): per-product top-1 lookups before/after a date
+CREATE INDEX IF NOT EXISTS index_movimentacoes_produto_data ON public.movimentacoes_estoque (id_produto, data_movimentacao, id) INCLUDE (quantidade_anterior, quantidade_nova);
+
+-- Index for the sales rollup
+CREATE INDEX IF NOT EXISTS index_vendas_resumo_hora_hora ON public.vendas_resumo_hora (hora);
+
+-- Folds the sales registered since the last run into vendas_resumo_hora. Every hour
+-- touched by a new sale (offline terminals may send old dates) is rebuilt from the raw
+-- tables. Returns the number of hours rebuilt (0 when another refresh is running).
+--
+-- Sales keep committing meanwhile: nothing locks vendas. The new watermark is the
+-- last id handed out by vendas_id_seq, taken BEFORE listing the transactions that
+-- hold ROW EXCLUSIVE on vendas (an INSERT takes that lock before calling nextval),
+-- so any id up to the watermark belongs to a finished transaction or to one of
+-- those. The function waits up to p_espera for them to end; if some are still
+-- running it keeps the old watermark, so an id below it can never commit later.
+-- Refreshes are serialized by a transaction-level advisory lock.
+DROP FUNCTION IF EXISTS public.estok_atualizar_resumo_vendas();
+CREATE OR REPLACE FUNCTION public.estok_atualizar_resumo_vendas(p_espera INTERVAL DEFAULT '5 seconds') RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_ultimo INTEGER;
+    v_maximo INTEGER;
+    v_horas INTEGER;
+    v_pendentes TEXT[];
+    v_limite TIMESTAMPTZ := clock_timestamp() + p_espera;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('estok_atualizar_resumo_vendas')) THEN
+        RETURN 0;
+    END IF;
+
+    INSERT INTO public.vendas_resumo_controle (id, ultimo_id_venda) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+    SELECT ultimo_id_venda INTO v_ultimo FROM public.vendas_resumo_controle WHERE id = 1;
+
+    v_maximo := COALESCE(pg_sequence_last_value('public.vendas_id_seq'), 0);
+    IF v_maximo <= v_ultimo THEN
+        UPDATE public.vendas_resumo_controle SET atualizado_em = now() WHERE id = 1;
+        RETURN 0;
+    END IF;
+
+    SELECT array_agg(virtualtransaction) INTO v_pendentes
+    FROM pg_locks
+    WHERE locktype = 'relation' AND relation = 'public.vendas'::regclass
+      AND mode = 'RowExclusiveLock' AND pid <> pg_backend_pid();
+
+    WHILE v_pendentes IS NOT NULL AND EXISTS (
+        SELECT 1 FROM pg_locks
+        WHERE locktype = 'relation' AND relation = 'public.vendas'::regclass
+          AND virtualtransaction = ANY (v_pendentes)
+    ) LOOP
+        IF clock_timestamp() >= v_limite THEN
+            RETURN 0;  -- a long transaction (e.g. a large /sales/batch) may still commit ids below v_maximo
+        END IF;
+        PERFORM pg_sleep(0.01);
+    END LOOP;
+
+    CREATE TEMP TABLE estok_horas_resumo ON COMMIT DROP AS
+        SELECT DISTINCT date_trunc('hour', data_venda) AS hora
+        FROM public.vendas
+        WHERE id > v_ultimo AND id <= v_maximo AND data_venda IS NOT NULL;
+    GET DIAGNOSTICS v_horas = ROW_COUNT;
+
+    DELETE FROM public.vendas_resumo_hora r USING estok_horas_resumo h WHERE r.hora = h.hora;
+
+    -- Split by product
+    INSERT INTO public.vendas_resumo_hora (hora, id_forma_pagamento, id_produto, receita, lucro, quantidade, vendas)
+    SELECT h.hora, v.id_forma_pagamento, i.id_produto,
+           SUM(i.valor_total), SUM((i.valor_unitario - i.preco_custo) * i.quantidade), SUM(i.quantidade), COUNT(DISTINCT v.id)
+    FROM estok_horas_resumo h
+    JOIN public.vendas v ON v.data_venda >= h.hora AND v.data_venda < h.hora + INTERVAL '1 hour' AND v.id <= v_maximo
+    JOIN public.itens_venda i ON i.id_venda = v.id AND i.data_venda = v.data_venda
+                             AND i.data_venda >= h.hora AND i.data_venda < h.hora + INTERVAL '1 hour'
+    GROUP BY h.hora, v.id_forma_pagamento, i.id_produto;
+
+    -- Totals per (hour, payment method)
+    INSERT INTO public.vendas_resumo_hora (hora, id_forma_pagamento, id_produto, receita, lucro, quantidade, vendas)
+    SELECT h.hora, v.id_forma_pagamento, NULL,
+           SUM(i.valor_total), SUM((i.valor_unitario - i.preco_custo) * i.quantidade), SUM(i.quantidade), COUNT(DISTINCT v.id)
+    FROM estok_horas_resumo h
+    JOIN public.vendas v ON v.data_venda >= h.hora AND v.data_venda < h.hora + INTERVAL '1 hour' AND v.id <= v_maximo
+    JOIN public.itens_venda i ON i.id_venda = v.id AND i.data_venda = v.data_venda
+                             AND i.data_venda >= h.hora AND i.data_venda < h.hora + INTERVAL '1 hour'
+    GROUP BY h.hora, v.id_forma_pagamento;
+
+    UPDATE public.vendas_resumo_controle SET ultimo_id_venda = v_maximo, atualizado_em = now() WHERE id = 1;
+    RETURN v_horas;
+END;
+$$;
+
 -- Seeds for formas_pagamento
 INSERT INTO public.formas_pagamento (nome, atalho, ativo)
 VALUES 
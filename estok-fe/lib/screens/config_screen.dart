@@ -3,6 +3,7 @@ import 'package:flutter/services.dart';
 import '../utils/app_config.dart';
 import '../models/payment_method.dart';
 import '../services/payment_method_service.dart';
+import '../services/event_service.dart';
 
 class ConfigScreen extends StatefulWidget {
   const ConfigScreen({super.key});
@@ -59,6 +60,7 @@ class _ConfigScreenState extends State<ConfigScreen> {
 
     try {
       await AppConfig.save(_hostController.text, _portController.text);
+      EventService().reconnect();
       if (mounted) {
         ScaffoldMessenger.of(context).showSnackBar(
           const SnackBar(
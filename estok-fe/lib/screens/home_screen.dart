@@ -1,7 +1,9 @@
 import 'package:flutter/material.dart';
 import 'package:http/http.dart' as http;
+import 'dart:async';
 import 'dart:convert';
 import 'package:intl/intl.dart';
+import '../services/event_service.dart';
 import 'product_screen.dart';
 import 'stock_screen.dart';
 import 'sales_screen.dart';
@@ -274,18 +276,34 @@ class _DashboardTabState extends State<DashboardTab> {
   List<dynamic> _topProducts = [];
   List<dynamic> _smartAlerts = [];
   String? _error;
+  StreamSubscription? _updateSubscription;
 
   @override
   void initState() {
     super.initState();
     _fetchDashboardData();
-  }
 
-  Future<void> _fetchDashboardData() async {
-    setState(() {
-      _isLoading = true;
-      _error = null;
+    // Refresh only when the server reports a change (no polling)
+    _updateSubscription = EventService().productUpdatedStream.listen((_) {
+      if (mounted) {
+        _fetchDashboardData(silent: true);
+      }
     });
+  }
+
+  @override
+  void dispose() {
+    _updateSubscription?.cancel();
+    super.dispose();
+  }
+
+  Future<void> _fetchDashboardData({bool silent = false}) async {
+    if (!silent) {
+      setState(() {
+        _isLoading = true;
+        _error = null;
+      });
+    }
 
     try {
       final summaryRes = await http.get(Uri.parse('http://localhost:5000/dashboard/summary'));
@@ -293,6 +311,7 @@ class _DashboardTabState extends State<DashboardTab> {
       final alertRes = await http.get(Uri.parse('http://localhost:5000/dashboard/smart-alerts'));
       final recentRes = await http.get(Uri.parse('http://localhost:5000/dashboard/recent-sales'));
       final topRes = await http.get(Uri.parse('http://localhost:5000/dashboard/top-products'));
+      if (!mounted) return;
 
       if (summaryRes.statusCode == 200 && inventoryRes.statusCode == 200) {
         setState(() {
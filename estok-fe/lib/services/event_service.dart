@@ -1,4 +1,7 @@
 import 'dart:async';
+import 'dart:convert';
+import 'package:http/http.dart' as http;
+import '../utils/app_config.dart';
 
 class EventService {
   static final EventService _instance = EventService._internal();
@@ -13,11 +16,93 @@ class EventService {
 
   Stream<void> get productUpdatedStream => _productUpdateController.stream;
 
+  static const _minRetryDelay = Duration(seconds: 3);
+  static const _maxRetryDelay = Duration(minutes: 1);
+
+  http.Client? _client;
+  bool _connected = false;
+  String? _lastEventId;
+
   void notifyProductUpdate() {
+    // While subscribed to /events the server announces our own changes too
+    if (_connected) return;
     _productUpdateController.add(null);
   }
 
+  /// Subscribes to the server's /events stream (Server-Sent Events).
+  /// Changes made by any terminal (sale-created, stock-moved, product-updated)
+  /// refresh the screens, so nothing needs to poll. Reconnects automatically,
+  /// backing off (3 s doubling up to a minute, or the server's Retry-After)
+  /// while the server is unreachable or refuses the stream.
+  Future<void> connect() async {
+    if (_client != null) return;
+    final client = http.Client();
+    _client = client;
+    var retryDelay = _minRetryDelay;
+
+    while (_client == client) {
+      Duration? retryAfter;
+      try {
+        final request = http.Request('GET', Uri.parse('${AppConfig.apiUrl}/events'));
+        request.headers['Accept'] = 'text/event-stream';
+        if (_lastEventId != null) {
+          request.headers['Last-Event-ID'] = _lastEventId!;
+        }
+        final response = await client.send(request);
+
+        if (response.statusCode == 200) {
+          _connected = true;
+          retryDelay = _minRetryDelay;
+          String? eventType;
+          await for (final line in response.stream.transform(utf8.decoder).transform(const LineSplitter())) {
+            if (line.isEmpty) {
+              if (eventType != null) {
+                _productUpdateController.add(null);
+              }
+              eventType = null;
+            } else if (line.startsWith('event:')) {
+              eventType = line.substring(6).trim();
+            } else if (line.startsWith('id:')) {
+              _lastEventId = line.substring(3).trim();
+            }
+          }
+        } else {
+          // e.g. 503 when the server has too many subscribers
+          final seconds = int.tryParse(response.headers['retry-after'] ?? '');
+          if (seconds != null) retryAfter = Duration(seconds: seconds);
+          await response.stream.drain<void>();
+        }
+      } catch (_) {
+        // Server unreachable or connection dropped: retry below
+      }
+
+      if (_connected) {
+        _connected = false;
+        // Changes may have happened while disconnected
+        _productUpdateController.add(null);
+      }
+      final delay = retryAfter != null && retryAfter > retryDelay ? retryAfter : retryDelay;
+      await Future.delayed(delay);
+      final doubled = retryDelay * 2;
+      retryDelay = doubled < _maxRetryDelay ? doubled : _maxRetryDelay;
+    }
+  }
+
+  /// Closes the current stream and subscribes again (e.g. after the API host changes).
+  void reconnect() {
+    disconnect();
+    connect();
+  }
+
+  void disconnect() {
+    _client?.close();
+    _client = null;
+    _connected = false;
+    _lastEventId = null;
+  }
+
   void dispose() {
+    disconnect();
     _productUpdateController.close();
   }
 }
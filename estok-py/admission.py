@@ -0,0 +1,111 @@
+import threading
+import time
+from fnmatch import fnmatchcase
+
+DEFAULT_LANE = 'default'
+
+
+class Lane:
+    """
+    Concurrency limit with a bounded wait queue. A request that finds the lane
+    full waits (up to `timeout` seconds) only if fewer than `queue` requests are
+    already waiting; otherwise it is rejected at once.
+    """
+
+    def __init__(self, name, limit, queue=0, timeout=0, retry_after=1):
+        self.name = name
+        self.limit = max(1, int(limit))
+        self.queue = max(0, int(queue))
+        self.timeout = float(timeout)
+        self.retry_after = int(retry_after)
+        self.active = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+        # Counters for /health
+        self.admitted = 0
+        self.rejected = 0   # wait queue full
+        self.timed_out = 0  # waited `timeout` without a free slot
+        self.peak_active = 0
+        self.wait_seconds = 0.0  # total queue wait of admitted requests
+
+    def acquire(self):
+        with self._condition:
+            if self.active >= self.limit:
+                if self.waiting >= self.queue:
+                    self.rejected += 1
+                    return False
+                self.waiting += 1
+                start = time.monotonic()
+                try:
+                    admitted = self._condition.wait_for(lambda: self.active < self.limit, self.timeout)
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    self.timed_out += 1
+                    return False
+                self.wait_seconds += time.monotonic() - start
+            self.active += 1
+            self.admitted += 1
+            self.peak_active = max(self.peak_active, self.active)
+            return True
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def stats(self):
+        return {
+            'limit': self.limit,
+            'queue': self.queue,
+            'active': self.active,
+            'waiting': self.waiting,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+            'peak_active': self.peak_active,
+            'avg_wait_ms': round(self.wait_seconds / self.admitted * 1000, 2) if self.admitted else 0.0,
+        }
+
+
+class AdmissionController:
+    """
+    Assigns every route (Flask endpoint) to a lane:
+        lanes:  {name: {limit, queue, timeout, retry_after}}
+        routes: {lane name: [endpoint patterns, e.g. 'estok.get_reports_*']}
+        exempt: endpoint patterns never limited (e.g. the /events stream, /health)
+    Endpoints matching no pattern use the 'default' lane.
+
+    Lanes are independent: a lane's limit plus its queue is the most server
+    threads / DB connections its requests can hold, so the capacity left over by
+    the capped lanes stays reserved for the others (checkout).
+    """
+
+    def __init__(self, lanes, routes=None, exempt=()):
+        self.lanes = {name: Lane(name, **settings) for name, settings in lanes.items()}
+        if DEFAULT_LANE not in self.lanes:
+            raise ValueError(f"Admission lanes must include '{DEFAULT_LANE}'")
+        self.routes = routes or {}
+        self.exempt = list(exempt)
+        self._by_endpoint = {}
+
+    def lane_for(self, endpoint):
+        """The Lane for a Flask endpoint, or None if the endpoint is exempt."""
+        try:
+            return self._by_endpoint[endpoint]
+        except KeyError:
+            pass
+        lane = self._resolve(endpoint or '')
+        self._by_endpoint[endpoint] = lane
+        return lane
+
+    def _resolve(self, endpoint):
+        if any(fnmatchcase(endpoint, pattern) for pattern in self.exempt):
+            return None
+        for name, patterns in self.routes.items():
+            if name in self.lanes and any(fnmatchcase(endpoint, pattern) for pattern in patterns):
+                return self.lanes[name]
+        return self.lanes[DEFAULT_LANE]
+
+    def stats(self):
+        return {name: lane.stats() for name, lane in self.lanes.items()}
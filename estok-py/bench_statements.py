@@ -0,0 +1,132 @@
+"""
+Microbenchmark for the prebuilt search / payment-method statements.
+
+Compares building the query on every request (how get_products used to work)
+against executing the prebuilt statements from main.py. Reports, per request,
+the statement cost (construction + cache-key generation), the full execute time
+and how many executions had to compile SQL. By default it runs against an
+in-memory SQLite copy of `produtos` and `formas_pagamento` (no server needed);
+--db uses the configured PostgreSQL.
+
+Usage:
+    python bench_statements.py [--db] [--rows 20000] [--iterations 2000]
+"""
+import argparse
+import time
+
+from sqlalchemy import create_engine, case, or_, event
+from sqlalchemy.engine import default
+
+import config_manager
+import main
+from main import db, produtos_table, formas_pagamento_table, PRODUTO_COLUMNS, FORMA_PAGAMENTO_COLUMNS
+
+TERMS = ['coca', 'agua', 'pao', '7890000000001', 'TST01', 'refri']
+
+
+def legacy_search(term):
+    """The per-request query construction get_products used before the prebuilt statements."""
+    query = db.select(*PRODUTO_COLUMNS).where(produtos_table.c.ativo == True)
+    query = query.where(
+        or_(
+            produtos_table.c.descricao.ilike(f"%{term}%"),
+            produtos_table.c.ean13 == term,
+            produtos_table.c.codigo_auxiliar == term
+        )
+    )
+    query = query.order_by(
+        case(
+            (produtos_table.c.ean13 == term, 1),
+            (produtos_table.c.codigo_auxiliar == term, 1),
+            (produtos_table.c.descricao.ilike(f"{term}%"), 2),
+            else_=3
+        ),
+        produtos_table.c.descricao
+    )
+    return query.limit(20), {}
+
+
+def prebuilt_search(term):
+    return main.SEARCH_STMT, {'term': term, 'contains': f"%{term}%", 'prefix': f"{term}%"}
+
+
+def legacy_payment_methods(_):
+    query = db.select(*FORMA_PAGAMENTO_COLUMNS).where(formas_pagamento_table.c.ativo == True)
+    return query.order_by(formas_pagamento_table.c.atalho, formas_pagamento_table.c.nome), {}
+
+
+def prebuilt_payment_methods(_):
+    return main.ACTIVE_PAYMENT_METHODS_STMT, {}
+
+
+def sqlite_engine(rows):
+    engine = create_engine('sqlite://')
+    main.db.metadata.create_all(engine, tables=[produtos_table, formas_pagamento_table])
+    with engine.begin() as conn:
+        conn.execute(produtos_table.insert(), [
+            {'descricao': f"Produto {i} {TERMS[i % len(TERMS)]}", 'ean13': f"{7890000000000 + i}",
+             'codigo_auxiliar': f"A{i % 100000}", 'quantidade': 10, 'preco_custo': 1, 'preco_venda': 2, 'ativo': True}
+            for i in range(rows)
+        ])
+        conn.execute(formas_pagamento_table.insert(), [
+            {'nome': 'Dinheiro', 'atalho': 'D', 'ativo': True},
+            {'nome': 'Cartão', 'atalho': 'C', 'ativo': True},
+            {'nome': 'Pix', 'atalho': 'P', 'ativo': True},
+        ])
+    return engine
+
+
+def count_compilations(engine):
+    """Count statements SQLAlchemy had to compile (compiled cache misses)."""
+    counter = {'compiled': 0}
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if context.cache_hit is not default.CACHE_HIT:
+            counter['compiled'] += 1
+    return counter
+
+
+def bench(label, engine, make, iterations, counter):
+    # Statement construction + the cache key SQLAlchemy derives from it to find the
+    # compiled SQL (the per-request statement cost the prebuilt statements remove)
+    start = time.perf_counter()
+    for i in range(iterations):
+        stmt, _ = make(TERMS[i % len(TERMS)])
+        stmt._generate_cache_key()
+    build_us = (time.perf_counter() - start) / iterations * 1e6
+
+    counter['compiled'] = 0
+    with engine.connect() as conn:
+        start = time.perf_counter()
+        for i in range(iterations):
+            stmt, params = make(TERMS[i % len(TERMS)])
+            conn.execute(stmt, params).mappings().all()
+        execute_us = (time.perf_counter() - start) / iterations * 1e6
+    print(f"{label:<36} statement {build_us:8.1f} us   execute {execute_us:8.1f} us   "
+          f"compiled {counter['compiled']}/{iterations}")
+    return execute_us
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark prebuilt vs per-request statements.")
+    parser.add_argument('--db', action='store_true', help="use the configured PostgreSQL database (read-only queries)")
+    parser.add_argument('--rows', type=int, default=20000, help="products in the SQLite dataset")
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    engine = create_engine(config_manager.get_db_uri()) if args.db else sqlite_engine(args.rows)
+    counter = count_compilations(engine)
+    print(f"Database: {engine.url.render_as_string(hide_password=True)}  iterations: {args.iterations}")
+
+    for name, legacy, prebuilt in (('search', legacy_search, prebuilt_search),
+                                   ('payment methods', legacy_payment_methods, prebuilt_payment_methods)):
+        # Warm both paths (first compilation of the prebuilt statement)
+        bench(f"{name} (warm-up)", engine, prebuilt, 10, counter)
+        before = bench(f"{name} per-request build", engine, legacy, args.iterations, counter)
+        after = bench(f"{name} prebuilt", engine, prebuilt, args.iterations, counter)
+        print(f"{'':<36} saved {before - after:.1f} us per request ({(before - after) / before:.0%})\n")
+
+
+if __name__ == '__main__':
+    main_cli()
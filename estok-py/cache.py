@@ -0,0 +1,212 @@
+import json
+import logging
+import select
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+CHANNEL = 'estok_cache'
+ALL = '*'
+# NOTIFY payloads must stay below 8000 bytes; larger invalidations evict everything
+MAX_PAYLOAD = 7000
+
+logger = logging.getLogger('estok.cache')
+
+
+class TaggedCache:
+    """
+    In-process LRU cache with a TTL where every entry carries tags
+    (e.g. 'products', 'product:12', 'sales'). invalidate(tags) evicts every
+    entry holding any of them; '*' evicts everything.
+    """
+
+    def __init__(self, max_entries=2048, ttl=300):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, tags, value)
+        self._keys_by_tag = {}
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, so a value loaded meanwhile is not stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, tags, loader, ttl=None):
+        """
+        Return the cached value for `key`, or call loader() and store its result
+        under `tags`. `tags` may be a callable taking the loaded value; returning
+        None there means "do not cache this value".
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            generation = self._generation
+
+        value = loader()
+        tags = tags(value) if callable(tags) else tags
+        if tags is None:
+            return value
+        with self._lock:
+            # An invalidation ran while loading: the value may already be stale
+            if generation == self._generation:
+                self._store(key, frozenset(tags), value, self.ttl if ttl is None else ttl)
+        return value
+
+    def _store(self, key, tags, value, ttl):
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, tags, value)
+        for tag in tags:
+            self._keys_by_tag.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[1]:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def invalidate(self, tags):
+        with self._lock:
+            self._generation += 1
+            if ALL in tags:
+                count = len(self._entries)
+                self._entries.clear()
+                self._keys_by_tag.clear()
+            else:
+                keys = set()
+                for tag in tags:
+                    keys |= self._keys_by_tag.get(tag, set())
+                for key in keys:
+                    self._remove(key)
+                count = len(keys)
+            self.evictions += count
+        return count
+
+    def clear(self):
+        return self.invalidate((ALL,))
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class SharedCache(TaggedCache):
+    """
+    TaggedCache kept consistent across worker processes and servers sharing one
+    PostgreSQL database, with no external broker:
+
+    - Writers call notify(session, tags) inside their transaction; it runs
+      pg_notify('estok_cache', ...), which PostgreSQL delivers only if (and when)
+      the transaction commits.
+    - Every process runs a listener thread (LISTEN estok_cache on a dedicated
+      connection) that evicts the announced tags.
+
+    Until the listener is connected, or while it reconnects, the cache is
+    bypassed (usable() is False), since notifications could be missed. On other
+    databases (e.g. SQLite) there is no channel: the cache is local to the process.
+    """
+
+    def __init__(self, max_entries=2048, ttl=300):
+        super().__init__(max_entries, ttl)
+        self.origin = uuid.uuid4().hex  # skips our own notifications (evicted locally on commit)
+        self.listening = False
+        self.notifications = 0
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    @staticmethod
+    def shared(engine):
+        return engine.dialect.name == 'postgresql' and engine.dialect.driver == 'psycopg2'
+
+    def usable(self, engine):
+        if not self.shared(engine):
+            return True
+        self._ensure_listening(engine)
+        return self.listening
+
+    def notify(self, session, tags):
+        """Announce `tags` to the other processes when the session's transaction commits."""
+        if not self.shared(session.get_bind()):
+            return
+        payload = json.dumps({'origin': self.origin, 'tags': sorted(tags)})
+        if len(payload) > MAX_PAYLOAD:
+            payload = json.dumps({'origin': self.origin, 'tags': [ALL]})
+        session.execute(text('SELECT pg_notify(:channel, :payload)'), {'channel': CHANNEL, 'payload': payload})
+
+    def _ensure_listening(self, engine):
+        if self._listener is not None:
+            return
+        with self._start_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, args=(engine,),
+                                                  name='cache-invalidation-listener', daemon=True)
+                self._listener.start()
+
+    def _apply(self, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            message = {'tags': [ALL]}
+        if message.get('origin') == self.origin:
+            return
+        self.notifications += 1
+        self.invalidate(message.get('tags') or [ALL])
+
+    def _listen(self, engine):
+        backoff = 1
+        while True:
+            connection = None
+            try:
+                # A dedicated connection, taken out of the pool for good
+                connection = engine.raw_connection()
+                connection.detach()
+                dbapi_connection = connection.driver_connection
+                dbapi_connection.rollback()  # e.g. the pool's pre-ping may have opened a transaction
+                dbapi_connection.autocommit = True
+                with dbapi_connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL}')
+                # Anything cached before this point may have missed notifications
+                self.clear()
+                self.listening = True
+                backoff = 1
+                logger.info("Listening for cache invalidations")
+                while True:
+                    if select.select([dbapi_connection], [], [], 5.0) == ([], [], []):
+                        continue
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        self._apply(dbapi_connection.notifies.pop(0).payload)
+            except Exception as e:
+                if self.listening:
+                    logger.warning(f"Cache invalidation listener disconnected: {e}")
+                self.listening = False
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(listening=self.listening, notifications=self.notifications)
+        return stats
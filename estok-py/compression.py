@@ -0,0 +1,126 @@
+import gzip
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # Optional: br is only offered when installed
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'text/html',
+    'text/plain',
+    'text/csv',
+}
+
+DEFAULTS = {
+    'COMPRESS_ENABLED': True,
+    'COMPRESS_MIN_SIZE': 1024,           # bytes; smaller bodies are sent as-is
+    'COMPRESS_LEVEL': 6,                 # gzip/deflate level (1-9)
+    'COMPRESS_BR_LEVEL': 5,              # brotli quality (0-11)
+    'COMPRESS_CACHE_MAX_BYTES': 32 * 1024 * 1024,
+}
+
+
+class CompressedBodyCache:
+    """
+    LRU of compressed bodies keyed by (encoding, level, digest of the raw body).
+    Hashing is far cheaper than compressing, so an unchanged catalog is only
+    compressed once no matter how many clients load it.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+def _compress(body, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(body, quality=config['COMPRESS_BR_LEVEL'])
+    if encoding == 'gzip':
+        # mtime=0 keeps the output deterministic for identical bodies
+        return gzip.compress(body, compresslevel=config['COMPRESS_LEVEL'], mtime=0)
+    return zlib.compress(body, config['COMPRESS_LEVEL'])
+
+
+def init_app(app):
+    """Register negotiated response compression on the Flask app."""
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+
+    offered = (['br'] if brotli is not None else []) + ['gzip', 'deflate']
+    cache = CompressedBodyCache(app.config['COMPRESS_CACHE_MAX_BYTES'])
+    app.extensions['compression_cache'] = cache
+
+    @app.after_request
+    def compress_response(response):
+        config = app.config
+        if not config['COMPRESS_ENABLED']:
+            return response
+        if response.direct_passthrough or response.is_streamed:
+            return response
+        if response.status_code < 200 or response.status_code >= 300 or response.status_code == 204:
+            return response
+        if 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(offered)
+        if not encoding:
+            return response
+
+        body = response.get_data()
+        if len(body) < config['COMPRESS_MIN_SIZE']:
+            return response
+
+        cacheable = (
+            request.method == 'GET'
+            and response.status_code == 200
+            and not response.cache_control.no_store
+        )
+        level = config['COMPRESS_BR_LEVEL'] if encoding == 'br' else config['COMPRESS_LEVEL']
+
+        compressed = None
+        if cacheable:
+            key = (encoding, level, hashlib.blake2b(body, digest_size=16).digest())
+            compressed = cache.get(key)
+        if compressed is None:
+            compressed = _compress(body, encoding, config)
+            if cacheable:
+                cache.put(key, compressed)
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
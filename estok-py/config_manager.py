@@ -5,6 +5,7 @@ import sys
 
 # Default Configuration
 DEFAULT_CONFIG = {
+    'backend': 'postgresql',  # or 'sqlite': embedded database file, for single-terminal stores
     'host': 'localhost',
     'port': '5432',
     'user': 'postgres',
@@ -30,6 +31,15 @@ def get_user_config_path():
     
     return os.path.join(estok_dir, 'db_config.json')
 
+def get_sqlite_path(config=None):
+    """SQLite database file: 'sqlite_path' from config, else estok.db next to the user config."""
+    config = config if config is not None else load_config()
+    return config.get('sqlite_path') or os.path.join(os.path.dirname(get_user_config_path()), 'estok.db')
+
+def get_log_dir():
+    """Directory for the server log files (next to the user config)."""
+    return os.path.join(os.path.dirname(get_user_config_path()), 'logs')
+
 def get_install_config_path():
     """Get the path to the bundled reference config file."""
     if getattr(sys, 'frozen', False):
@@ -74,10 +84,10 @@ def save_config(config):
 
 
 
-def get_db_uri():
-    """Construct SQLAlchemy URI from config with URL encoding for credentials."""
-    config = load_config()
-    
+def _build_uri(config):
+    """Build a PostgreSQL (or SQLite) URI from a connection settings dict, URL-encoding credentials."""
+    if config.get('backend') == 'sqlite':
+        return f"sqlite:///{os.path.abspath(get_sqlite_path(config))}"
     user = urllib.parse.quote_plus(config.get('user', ''))
     password = urllib.parse.quote_plus(config.get('password', ''))
     host = config.get('host', 'localhost')
@@ -85,3 +95,20 @@ def get_db_uri():
     dbname = config.get('dbname', 'estok')
     
     return f"postgresql://{user}:{password}@{host}:{port}/{dbname}"
+
+def get_db_uri():
+    """Construct SQLAlchemy URI from config with URL encoding for credentials."""
+    return _build_uri(load_config())
+
+def get_replica_settings():
+    """
+    Read-replica settings from config. Returns (uris, max_lag_seconds).
+    Each entry of 'replicas' accepts the same keys as the primary; missing keys
+    (usually user/password/dbname) are inherited from the primary settings.
+    """
+    config = load_config()
+    if config.get('backend') == 'sqlite':
+        return [], float(config.get('replica_max_lag_seconds', 30))
+    primary = {key: config.get(key) for key in DEFAULT_CONFIG if key in config}
+    uris = [_build_uri({**primary, **replica}) for replica in config.get('replicas', [])]
+    return uris, float(config.get('replica_max_lag_seconds', 30))
@@ -0,0 +1,164 @@
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+# Replay lag in seconds; 0 when the replica streams from the primary and has applied
+# everything it received (an idle primary must not make a healthy replica look stale).
+# NULL when the WAL receiver is not streaming: receive LSN = replay LSN then only means
+# nothing new arrives, so the replica may be arbitrarily behind. Without
+# pg_read_all_stats the view hides `status` (NULL) but still has a row while the
+# receiver runs.
+LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (
+            SELECT 1 FROM pg_stat_wal_receiver WHERE COALESCE(status, 'streaming') = 'streaming'
+        ) THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class ReplicaRouter:
+    """
+    Picks a healthy read replica for read-only routes.
+
+    Each replica is probed at most every `check_interval` seconds (one request does
+    the probe, the others use the last known state). A replica that is unreachable,
+    whose WAL receiver is disconnected or that lags more than `max_lag` seconds is
+    skipped; with none available, reads fall back to the primary. A replica that
+    fails in the middle of a request is marked unhealthy (see mark_failed) until
+    its next probe.
+    """
+
+    def __init__(self, uris, max_lag=30.0, check_interval=5.0, connect_timeout=2):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.replicas = [
+            {
+                'engine': create_engine(uri, pool_pre_ping=True, connect_args={'connect_timeout': connect_timeout}),
+                'healthy': False,
+                'lag': None,
+                'checked_at': None,
+                'error': None,
+                'lock': threading.Lock(),
+            }
+            for uri in uris
+        ]
+        self._next = 0
+
+    @property
+    def enabled(self):
+        return bool(self.replicas)
+
+    def _check(self, replica):
+        try:
+            with replica['engine'].connect() as conn:
+                lag = conn.execute(LAG_SQL).scalar()
+            if lag is None:
+                replica.update(lag=None, healthy=False, error='WAL receiver not streaming')
+            else:
+                lag = float(lag)
+                replica.update(lag=lag, healthy=lag <= self.max_lag, error=None if lag <= self.max_lag else 'lagging')
+        except Exception as e:
+            replica['engine'].dispose()
+            replica.update(healthy=False, lag=None, error=str(e))
+        replica['checked_at'] = time.monotonic()
+
+    def _refresh(self, replica):
+        checked_at = replica['checked_at']
+        if checked_at is not None and time.monotonic() - checked_at < self.check_interval:
+            return
+        if replica['lock'].acquire(blocking=checked_at is None):
+            try:
+                self._check(replica)
+            finally:
+                replica['lock'].release()
+
+    def choose(self):
+        """Return a healthy replica engine (round-robin), or None to use the primary."""
+        count = len(self.replicas)
+        for offset in range(count):
+            replica = self.replicas[(self._next + offset) % count]
+            self._refresh(replica)
+            if replica['healthy']:
+                self._next = (self._next + offset + 1) % count
+                return replica['engine']
+        return None
+
+    def mark_failed(self, engine, error):
+        """Take the replica of `engine` out of rotation until its next probe."""
+        for replica in self.replicas:
+            if replica['engine'] is engine:
+                engine.dispose()
+                replica.update(healthy=False, lag=None, error=str(error), checked_at=time.monotonic())
+
+    def status(self):
+        return [
+            {
+                'url': replica['engine'].url.render_as_string(hide_password=True),
+                'healthy': replica['healthy'],
+                'lag_seconds': replica['lag'],
+                'error': replica['error'],
+            }
+            for replica in self.replicas
+        ]
+
+
+class RoutingSession(Session):
+    """
+    Session that sends SELECTs of read-only routes (see read_only) to the replica
+    chosen for the request. Flushes and any non-SELECT statement always use the primary.
+
+    If the replica fails while executing (connection lost, query cancelled by
+    recovery), it is marked unhealthy and the statement runs again on the primary,
+    which serves the rest of the request.
+    """
+
+    def execute(self, statement, *args, **kwargs):
+        replica = g.get('db_replica') if has_app_context() else None
+        if replica is None or not getattr(statement, 'is_select', False):
+            return super().execute(statement, *args, **kwargs)
+        try:
+            return super().execute(statement, *args, **kwargs)
+        except (OperationalError, InterfaceError) as e:
+            if g.get('db_replica') is not replica:
+                raise
+            current_app.extensions['estok_replica_router'].mark_failed(replica, e.orig or e)
+            current_app.logger.warning(f"Read replica failed, using the primary: {e}")
+            g.db_replica = None
+            self.rollback()  # read-only route: nothing pending is lost
+            return super().execute(statement, *args, **kwargs)
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context():
+            replica = g.get('db_replica')
+            if replica is not None and getattr(clause, 'is_select', False):
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """
+    Route decorator: serve the view's SELECTs from a replica when one is healthy.
+    The router is the app's extensions['estok_replica_router'] (set up by create_app).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        router = current_app.extensions.get('estok_replica_router')
+        if router is not None and router.enabled:
+            g.db_replica = router.choose()
+            g.db_replica_used = g.db_replica is not None
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def used_replica():
+    """True if the current request read from a replica (even if it later fell back to the primary)."""
+    return g.get('db_replica_used', False)
@@ -0,0 +1,120 @@
+import itertools
+import threading
+import time
+from collections import deque
+
+from fast_json import dumps_bytes
+
+
+class Subscription:
+    """Bounded per-client buffer. When full, the oldest events are dropped and a resync is flagged."""
+
+    def __init__(self, buffer_size):
+        self.events = deque(maxlen=buffer_size)
+        self.overflowed = False
+        self.condition = threading.Condition()
+
+    def push(self, event):
+        with self.condition:
+            if len(self.events) == self.events.maxlen:
+                self.overflowed = True
+            self.events.append(event)
+            self.condition.notify()
+
+    def drain(self, timeout):
+        """Wait up to timeout for events. Returns (events, overflowed) and empties the buffer."""
+        with self.condition:
+            if not self.events:
+                self.condition.wait(timeout)
+            events = list(self.events)
+            overflowed = self.overflowed
+            self.events.clear()
+            self.overflowed = False
+        return events, overflowed
+
+
+class EventBroker:
+    """
+    In-process fan-out of change events to Server-Sent Events subscribers.
+
+    Each subscriber is streamed by a WSGI server thread, which stays blocked on
+    the subscription for as long as the client is connected: a stream costs a
+    whole thread (one of its own under pooled_server, which hands /events off
+    its workers), and EVENTS_MAX_SUBSCRIBERS bounds how many. A short history lets clients
+    that reconnect with Last-Event-ID catch up; if they missed more than that
+    (or the server restarted) they receive a 'resync' event instead.
+    """
+
+    def __init__(self, buffer_size=64, history_size=256):
+        self.buffer_size = buffer_size
+        # Event ids are "<epoch>-<seq>" so ids from a previous server run are never matched
+        self.epoch = str(int(time.time()))
+        self._seq = itertools.count(1)
+        self._history = deque(maxlen=history_size)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.closed = False
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, event_type, data):
+        with self._lock:
+            event = (f"{self.epoch}-{next(self._seq)}", event_type, data)
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.push(event)
+
+    def subscribe(self, last_event_id=None):
+        subscription = Subscription(self.buffer_size)
+        with self._lock:
+            if last_event_id:
+                missed = self._missed_since(last_event_id)
+                if missed is None:
+                    subscription.overflowed = True
+                else:
+                    subscription.events.extend(missed[-self.buffer_size:])
+                    subscription.overflowed = len(missed) > self.buffer_size
+            self._subscribers.add(subscription)
+        return subscription
+
+    def close(self):
+        """End every open stream (server shutdown): clients reconnect to the next server."""
+        with self._lock:
+            self.closed = True
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            with subscription.condition:
+                subscription.condition.notify()
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def _missed_since(self, last_event_id):
+        """Events after last_event_id, or None if they are no longer in the history."""
+        epoch, _, seq = last_event_id.partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if self._history and int(self._history[0][0].split('-')[1]) > seq + 1:
+            return None
+        return [event for event in self._history if int(event[0].split('-')[1]) > seq]
+
+    def stream(self, subscription, heartbeat=15.0):
+        """SSE body generator. Sends a comment line as heartbeat so dead connections are noticed."""
+        try:
+            yield 'retry: 3000\n\n'
+            while not self.closed:
+                events, overflowed = subscription.drain(heartbeat)
+                if overflowed:
+                    yield 'event: resync\ndata: {}\n\n'
+                if not events and not overflowed:
+                    yield ': keep-alive\n\n'
+                    continue
+                for event_id, event_type, data in events:
+                    yield f"id: {event_id}\nevent: {event_type}\ndata: {dumps_bytes(data).decode('utf-8')}\n\n"
+        finally:
+            self.unsubscribe(subscription)
@@ -0,0 +1,57 @@
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the stdlib encoder
+    orjson = None
+
+
+def _default(obj):
+    """
+    Encode the types returned by plain database rows.
+    NUMERIC columns are at most 10 digits wide, so converting Decimal to float
+    is exact (float repr round-trips up to 15 significant digits).
+    """
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if hasattr(obj, '_asdict'):
+        return obj._asdict()
+    if hasattr(obj, 'keys'):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj):
+    """Serialize obj straight to UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider used by jsonify().
+    Handles Decimal and datetime natively (ISO 8601, same as to_dict()) and
+    writes the response body as bytes, skipping the intermediate str.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs.get('indent'):
+            return dumps_bytes(obj).decode('utf-8')
+        kwargs.setdefault('default', _default)
+        kwargs.setdefault('ensure_ascii', False)
+        return json.dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if self._app.debug:
+            body = self.dumps(obj, indent=2).encode('utf-8')
+        else:
+            body = dumps_bytes(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -1,22 +1,47 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify, send_file
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import or_, case, func, desc, extract
+from sqlalchemy import or_, and_, case, func, desc, bindparam, text, event, cast, literal, Float, Numeric
+from werkzeug.local import LocalProxy
+import functools
+import hmac
+import io
+import math
 import os
+import pstats
+import threading
+import time
+import uuid
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime, timezone, timedelta
-from dotenv import load_dotenv
+from decimal import Decimal, InvalidOperation
 import config_manager
-
-load_dotenv()
-
-app = Flask(__name__)
-# Load DB URI from config file
-app.config['SQLALCHEMY_DATABASE_URI'] = config_manager.get_db_uri()
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-# app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-#     "connect_args": {"client_encoding": "utf8"}
-# }
-
-db = SQLAlchemy(app)
+import db_tools
+import compression
+from db_routing import RoutingSession, read_only, used_replica
+import report_engine
+import sqlite_backend
+from sql_compat import insert_ignoring_conflicts, word_similar
+from profiling import PROFILE_HEADER
+
+# Importing this module only defines the routes and models; the app itself is
+# built by create_app() (see App Factory), which also imports the heavier pieces.
+bp = Blueprint('estok', __name__)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Per-app services created by create_app(), resolved for the current app
+replica_router = LocalProxy(lambda: current_app.extensions['estok_replica_router'])
+event_broker = LocalProxy(lambda: current_app.extensions['estok_event_broker'])
+sales_writer = LocalProxy(lambda: current_app.extensions['estok_sales_writer'])
+result_cache = LocalProxy(lambda: current_app.extensions['estok_cache'])
+admission = LocalProxy(lambda: current_app.extensions['estok_admission'])
+report_jobs = LocalProxy(lambda: current_app.extensions['estok_report_jobs'])
+profiler = LocalProxy(lambda: current_app.extensions['estok_profiler'])
+memory_tracker = LocalProxy(lambda: current_app.extensions['estok_memory'])
+reorder_suggestions = LocalProxy(lambda: current_app.extensions['estok_reorder'])
+
+# Read replicas (db_config.json "replicas"): dashboards and reports read from a
+# healthy replica; everything else, and all writes, stay on the primary.
+reads_from_replica = read_only
 
 # --- Models ---
 
@@ -119,6 +144,7 @@ class ItemVenda(db.Model):
     preco_custo = db.Column(db.Numeric(10, 2))
     valor_unitario = db.Column(db.Numeric(10, 2), nullable=False)
     valor_total = db.Column(db.Numeric(10, 2), nullable=False)
+    data_venda = db.Column(db.DateTime, nullable=True) # Copy of vendas.data_venda (partition key)
 
     def to_dict(self):
         return {
@@ -131,79 +157,418 @@ class ItemVenda(db.Model):
             'valor_total': float(self.valor_total)
         }
 
+class VendaIdempotencia(db.Model):
+    __tablename__ = 'vendas_idempotencia'
+
+    # Client-generated key of a sale sent through /sales/batch (e.g. a UUID)
+    chave = db.Column(db.String(64), primary_key=True)
+    id_venda = db.Column(db.Integer, nullable=True)
+    data_registro = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class VendaResumoHora(db.Model):
+    __tablename__ = 'vendas_resumo_hora'
+
+    # Hourly sales rollup for /reports/aggregate. Rows with id_produto NULL are
+    # the totals of the (hour, payment method); the others are split by product.
+    id = db.Column(db.Integer, primary_key=True)
+    hora = db.Column(db.DateTime, nullable=False)
+    id_forma_pagamento = db.Column(db.Integer, nullable=True)
+    id_produto = db.Column(db.Integer, nullable=True)
+    receita = db.Column(db.Numeric(14, 2))
+    lucro = db.Column(db.Numeric(14, 2))
+    quantidade = db.Column(db.Numeric(14, 3))
+    vendas = db.Column(db.Integer)
+
+class VendaResumoControle(db.Model):
+    __tablename__ = 'vendas_resumo_controle'
+
+    # Single row (id = 1): the rollup holds exactly the sales with id <= ultimo_id_venda
+    id = db.Column(db.Integer, primary_key=True)
+    ultimo_id_venda = db.Column(db.Integer, nullable=False, default=0)
+    atualizado_em = db.Column(db.DateTime)
+
+# --- Read Columns (Core) ---
+# Read-heavy routes select plain rows instead of ORM objects and hand them
+# straight to the JSON provider. COALESCE mirrors the defaults of to_dict().
+
+produtos_table = Produto.__table__
+vendas_table = Venda.__table__
+itens_venda_table = ItemVenda.__table__
+formas_pagamento_table = FormaPagamento.__table__
+movimentacoes_table = MovimentacaoEstoque.__table__
+vendas_idempotencia_table = VendaIdempotencia.__table__
+vendas_resumo_table = VendaResumoHora.__table__
+vendas_resumo_controle_table = VendaResumoControle.__table__
+
+PRODUTO_COLUMNS = (
+    produtos_table.c.id,
+    produtos_table.c.descricao,
+    produtos_table.c.ean13,
+    produtos_table.c.codigo_auxiliar,
+    func.coalesce(produtos_table.c.quantidade, 0).label('quantidade'),
+    func.coalesce(produtos_table.c.preco_custo, 0).label('preco_custo'),
+    func.coalesce(produtos_table.c.preco_venda, 0).label('preco_venda'),
+    produtos_table.c.data_cadastro,
+    produtos_table.c.ativo,
+)
+
+FORMA_PAGAMENTO_COLUMNS = (
+    formas_pagamento_table.c.id,
+    formas_pagamento_table.c.nome,
+    func.upper(formas_pagamento_table.c.atalho).label('atalho'),
+    formas_pagamento_table.c.ativo,
+)
+
+ITEM_VENDA_COLUMNS = (
+    itens_venda_table.c.id,
+    itens_venda_table.c.id_venda,
+    itens_venda_table.c.id_produto,
+    itens_venda_table.c.quantidade,
+    func.coalesce(itens_venda_table.c.preco_custo, 0).label('preco_custo'),
+    itens_venda_table.c.valor_unitario,
+    itens_venda_table.c.valor_total,
+)
+
+def sale_items_join(start=None, end=None):
+    """
+    Join condition itens_venda -> vendas. With partitioned sales tables the
+    partition key is part of the join, and the period the query filters vendas
+    on (start <= data_venda <= end, either bound optional) is repeated on
+    itens_venda.data_venda: the planner does not carry a range across the join,
+    so without it every itens_venda partition would be scanned.
+    """
+    condition = ItemVenda.id_venda == Venda.id
+    if current_app.config['PARTITIONED_SALES']:
+        condition = and_(condition, ItemVenda.data_venda == Venda.data_venda)
+        if start is not None:
+            condition = and_(condition, ItemVenda.data_venda >= start)
+        if end is not None:
+            condition = and_(condition, ItemVenda.data_venda <= end)
+    return condition
+
+_partitions_checked_at = None
+
+@bp.before_app_request
+def ensure_sales_partitions():
+    """Keep the coming months' partitions created (checked at most every 12h)."""
+    global _partitions_checked_at
+    if not current_app.config['PARTITIONED_SALES']:
+        return
+    now = time.monotonic()
+    if _partitions_checked_at is not None and now - _partitions_checked_at < 12 * 3600:
+        return
+    _partitions_checked_at = now
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(text('SELECT public.estok_garantir_particoes(:months)'),
+                         {'months': current_app.config['PARTITION_MONTHS_AHEAD']})
+    except Exception as e:
+        current_app.logger.error(f"Error creating sales partitions: {e}")
+
+def fetch_rows(stmt, **params):
+    """Execute a Core select and return its rows as mappings (JSON-ready)."""
+    return db.session.execute(stmt, params).mappings().all()
+
+# --- Prebuilt Statements ---
+# Hot-path queries (search-as-you-type, barcode scans, payment methods) are built
+# once with bind parameters. Reusing the same statement object means SQLAlchemy
+# neither rebuilds the expression tree nor recompiles it per request: its cache
+# key is memoized and the compiled SQL comes from the engine's compiled cache.
+# bench_statements.py measures the difference.
+
+def build_search_statement():
+    """
+    ILIKE search. Binds: term (exact EAN13 / aux code, i.e. the barcode lookup),
+    contains ('%term%') and prefix ('term%'). Max 20 rows ordered by:
+    1. Exact match on code, 2. Description starts with term, 3. Description contains term.
+    """
+    term = bindparam('term', type_=db.String)
+    code_match = or_(produtos_table.c.ean13 == term, produtos_table.c.codigo_auxiliar == term)
+    return (
+        db.select(*PRODUTO_COLUMNS)
+        .where(produtos_table.c.ativo == True)
+        .where(or_(produtos_table.c.descricao.ilike(bindparam('contains', type_=db.String)), code_match))
+        .order_by(
+            case(
+                (code_match, 1),
+                (produtos_table.c.descricao.ilike(bindparam('prefix', type_=db.String)), 2),
+                else_=3
+            ),
+            produtos_table.c.descricao # Secondary sort alpha
+        )
+        .limit(20)
+    )
+
+def build_similar_search_statement():
+    """
+    Accent-insensitive, typo-tolerant search (pg_trgm + unaccent). Binds: term.
+    estok_normalizar() (schema.sql) is the immutable lower(unaccent()) wrapper behind
+    index_descricao_normalizada_trigram, so both the substring LIKE and the word
+    similarity operator (<%) are answered from that GIN index. The match threshold is
+    pg_trgm.word_similarity_threshold (default 0.6; tune with ALTER DATABASE ... SET).
+    """
+    raw_term = bindparam('term', type_=db.String)
+    term = func.estok_normalizar(raw_term, type_=db.String)
+    descricao = func.estok_normalizar(produtos_table.c.descricao, type_=db.String)
+    code_match = or_(produtos_table.c.ean13 == raw_term, produtos_table.c.codigo_auxiliar == raw_term)
+    return (
+        db.select(*PRODUTO_COLUMNS)
+        .where(produtos_table.c.ativo == True)
+        .where(
+            or_(
+                code_match,
+                descricao.like('%' + term + '%'),
+                word_similar(term, descricao)
+            )
+        )
+        .order_by(
+            case(
+                (code_match, 1),
+                (descricao.like(term + '%'), 2),
+                else_=3
+            ),
+            func.word_similarity(term, descricao).desc(),
+            produtos_table.c.descricao
+        )
+        .limit(20)
+    )
+
+SEARCH_STMT = build_search_statement()
+SEARCH_SIMILAR_STMT = build_similar_search_statement()
+SEARCH_ALL_STMT = (
+    db.select(*PRODUTO_COLUMNS)
+    .where(produtos_table.c.ativo == True)
+    .order_by(produtos_table.c.descricao)
+    .limit(20)
+)
+
+# Ordered by atalho so shortcuts are in consistent order, then name
+PAYMENT_METHODS_STMT = db.select(*FORMA_PAGAMENTO_COLUMNS).order_by(
+    formas_pagamento_table.c.atalho, formas_pagamento_table.c.nome
+)
+ACTIVE_PAYMENT_METHODS_STMT = PAYMENT_METHODS_STMT.where(formas_pagamento_table.c.ativo == True)
+
+# --- Result Cache ---
+# With CACHE_ENABLED, read routes keep their results in result_cache (cache.py).
+# Entries are tagged with what they depend on:
+#     products         catalog (descriptions, codes, prices, active flag)
+#     product:<id>     one product's row (its stock included)
+#     stock            any stock balance
+#     sales            any sale
+#     payment-methods  payment methods
+# Writes call invalidate_cache(tags) before committing; the tags are evicted in this
+# worker on commit and in every other worker through LISTEN/NOTIFY.
+
+def cache_active():
+    return current_app.config['CACHE_ENABLED'] and result_cache.usable(db.engine)
+
+def cached_rows(key, tags, stmt, **params):
+    """fetch_rows through the result cache (`tags` may be a callable taking the rows)."""
+    if not cache_active():
+        return fetch_rows(stmt, **params)
+    return result_cache.get_or_load(key, tags, lambda: fetch_rows(stmt, **params))
+
+def cached_view(*tags):
+    """
+    Serve a read route's 200 responses from the result cache (key: path, query and UTC date).
+    Responses built from a replica are not stored: the replica may lag behind the
+    invalidations, which are sent on the primary's commits. Cached entries (always
+    from the primary, evicted on commit) are still served to replica routes.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not cache_active():
+                return view(*args, **kwargs)
+
+            def load():
+                response = current_app.make_response(view(*args, **kwargs))
+                return response.status_code, response.get_data(), response.mimetype, used_replica()
+
+            # The date is part of the key so "today" figures roll over at midnight
+            key = ('view', request.full_path, datetime.now(timezone.utc).date())
+            status, body, mimetype, _ = result_cache.get_or_load(
+                key, lambda value: tags if value[0] == 200 and not value[3] else None, load
+            )
+            return Response(body, status=status, mimetype=mimetype)
+        return wrapper
+    return decorator
+
+def invalidate_cache(*tags):
+    """Evict cached results tagged with `tags` in every worker once the current transaction commits."""
+    if not current_app.config['CACHE_ENABLED']:
+        return
+    session = db.session()
+    session.info.setdefault('estok_cache_tags', set()).update(tags)
+    result_cache.notify(session, tags)
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _evict_committed_cache_tags(session):
+    tags = session.info.pop('estok_cache_tags', None)
+    if tags:
+        current_app.extensions['estok_cache'].invalidate(tags)
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_cache_tags(session):
+    session.info.pop('estok_cache_tags', None)
+
+def product_tags(rows):
+    return {'products'} | {f"product:{row['id']}" for row in rows}
+
+# --- Admission Control ---
+# With ADMISSION_ENABLED, each route runs in a lane (admission.py) with its own
+# concurrency limit and bounded wait queue: checkout routes (PDV search, sales)
+# keep their capacity while heavy back-office routes are capped, and requests
+# beyond a lane's queue get a fast 503 with Retry-After instead of piling up.
+
+@bp.before_request
+def admit_request():
+    if not current_app.config['ADMISSION_ENABLED']:
+        return None
+    lane = admission.lane_for(request.endpoint)
+    if lane is None:
+        return None
+    if not lane.acquire():
+        response = jsonify({"message": "Server busy, please retry shortly", "lane": lane.name})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(lane.retry_after)
+        return response
+    g.estok_lane = lane
+    return None
+
+@bp.teardown_request
+def release_admission(exc):
+    lane = g.pop('estok_lane', None)
+    if lane is not None:
+        lane.release()
+
+# --- Admin Guard ---
+# Diagnostic routes (/admin/*) require the X-Admin-Token header to match
+# ADMIN_TOKEN (ESTOK_ADMIN_TOKEN). With no token configured they are disabled.
+
+def is_admin_token(value):
+    token = current_app.config['ADMIN_TOKEN']
+    return bool(token) and hmac.compare_digest((value or '').encode(), token.encode())
+
+def admin_required(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_app.config['ADMIN_TOKEN']:
+            return jsonify({"message": "Admin routes are disabled (set ESTOK_ADMIN_TOKEN)"}), 403
+        if not is_admin_token(request.headers.get('X-Admin-Token')):
+            return jsonify({"message": "Invalid admin token"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+# --- Request Profiling ---
+# With profiling switched on (GUI toggle, PUT /admin/profiling or PROFILING_ENABLED),
+# a PROFILING_SAMPLE_RATE share of requests runs under cProfile; a request whose
+# X-Estok-Profile header carries the admin token is always profiled. Stats files
+# (profiling.py) are listed and downloaded through /admin/profiling.
+
+@bp.before_request
+def start_profiling():
+    forced_by = request.headers.get(PROFILE_HEADER)
+    if not (profiler.enabled or forced_by):
+        return None
+    # The /events stream would hold the profiler for as long as it is open
+    if request.endpoint == 'estok.stream_events':
+        return None
+    profile = profiler.start(forced=forced_by is not None and is_admin_token(forced_by))
+    if profile is not None:
+        g.estok_profile = profile
+    return None
+
+@bp.teardown_request
+def finish_profiling(exc):
+    profile = g.pop('estok_profile', None)
+    if profile is not None:
+        try:
+            profiler.finish(profile, request.endpoint)
+        except Exception as e:
+            current_app.logger.error(f"Error saving request profile: {e}")
+
+# --- Memory Tracking ---
+# memory_tracker.py samples the process RSS in the background. While allocation
+# tracing is on (GUI or PUT /admin/memory), requests to MEMORY_TRACKED_ENDPOINTS
+# (the heavy routes) record their peak allocation and response size, and
+# tracemalloc snapshots can be taken and diffed through /admin/memory.
+
+@bp.before_request
+def start_memory_tracking():
+    memory_tracker.ensure_sampling()
+    if memory_tracker.tracing and memory_tracker.tracks(request.endpoint) and memory_tracker.begin_request():
+        g.estok_memory = True
+    return None
+
+@bp.after_request
+def record_response_size(response):
+    if 'estok_memory' in g:
+        g.estok_response_bytes = response.content_length
+    return response
+
+@bp.teardown_request
+def finish_memory_tracking(exc):
+    if g.pop('estok_memory', False):
+        memory_tracker.end_request(request.endpoint, g.pop('estok_response_bytes', None))
+
 # --- Product Routes ---
 
-@app.route('/products/all', methods=['GET'])
+@bp.route('/products/all', methods=['GET'])
 def get_all_products():
     """
     Get ALL products without pagination or strict limits.
     Designed for management screens (Product Registration/Stock Management).
     """
     try:
-        products = Produto.query.filter(Produto.ativo == True).order_by(Produto.descricao).all()
+        products = cached_rows(
+            ('products', 'all'), ('products', 'stock'),
+            db.select(*PRODUTO_COLUMNS)
+            .where(produtos_table.c.ativo == True)
+            .order_by(produtos_table.c.descricao)
+        )
         return jsonify({
             "message": "All products retrieved",
             "count": len(products),
-            "data": [p.to_dict() for p in products]
+            "data": products
         })
     except Exception as e:
         return jsonify({"message": f"Error retrieving products: {str(e)}"}), 500
 
-@app.route('/products', methods=['GET'])
+@bp.route('/products', methods=['GET'])
 def get_products():
     """
     Search products with optimized 'search-as-you-type' logic.
     Query Params:
         q: Search term (name, ean, or aux code)
+        mode: 'ilike' or 'similar' (default: SEARCH_MODE config)
     Returns:
         Max 20 results ordered by relevance:
         1. Exact match (EAN13 or Aux Code)
         2. Description starts with term
-        3. Description contains term
+        3. Description contains term ('similar': by similarity score, typos tolerated)
     """
     query_term = request.args.get('q', '').strip()
-    
-    query = Produto.query.filter(Produto.ativo == True)
-
-    if query_term:
-        search_pattern = f"%{query_term}%"
-        prefix_pattern = f"{query_term}%"
-
-        # Filter: Matches one of the fields
-        query = query.filter(
-            or_(
-                Produto.descricao.ilike(search_pattern),
-                Produto.ean13 == query_term,
-                Produto.codigo_auxiliar == query_term
-            )
-        )
-        
-        # Ordering Priorities
-        # 1. Exact Match on Code (EAN or Aux)
-        # 2. Description Starts With (Prefix)
-        # 3. Description Contains (implied by previous filter, but we push it to end)
-        query = query.order_by(
-            case(
-                (Produto.ean13 == query_term, 1),
-                (Produto.codigo_auxiliar == query_term, 1),
-                (Produto.descricao.ilike(prefix_pattern), 2),
-                else_=3
-            ),
-            Produto.descricao # Secondary sort alpha
-        )
+    mode = request.args.get('mode', current_app.config['SEARCH_MODE'])
+
+    # Statements are prebuilt (see Prebuilt Statements): only values are bound here
+    # Results are tagged with the products they list, so a sale only evicts the searches showing its products
+    key = ('products', mode, query_term)
+    if query_term and mode == 'similar':
+        products = cached_rows(key, product_tags, SEARCH_SIMILAR_STMT, term=query_term)
+    elif query_term:
+        products = cached_rows(key, product_tags, SEARCH_STMT,
+                               term=query_term, contains=f"%{query_term}%", prefix=f"{query_term}%")
     else:
-        query = query.order_by(Produto.descricao)
-    
-    # Limit results for performance (Sales Screen Optimization)
-    products = query.limit(20).all()
+        products = cached_rows(key, product_tags, SEARCH_ALL_STMT)
     
     return jsonify({
         "message": "Search results",
         "count": len(products),
-        "data": [p.to_dict() for p in products]
+        "data": products
     })
 
-@app.route('/products', methods=['POST'])
+@bp.route('/products', methods=['POST'])
 def create_product():
     """
     Create a new product.
@@ -214,6 +579,7 @@ def create_product():
         return jsonify({"message": "No input data provided"}), 400
 
     try:
+        sqlite_backend.begin_write(db.session)
         new_product = Produto(
             descricao=data.get('descricao'),
             ean13=data.get('ean13'),
@@ -224,7 +590,9 @@ def create_product():
         )
         
         db.session.add(new_product)
+        invalidate_cache('products', 'stock')
         db.session.commit()
+        event_broker.publish('product-updated', {"id_produto": new_product.id})
 
         return jsonify({
             "message": "Product created successfully",
@@ -235,11 +603,12 @@ def create_product():
         db.session.rollback()
         return jsonify({"message": f"Error creating product: {str(e)}"}), 500
 
-@app.route('/products/<int:id>', methods=['PUT'])
+@bp.route('/products/<int:id>', methods=['PUT'])
 def update_product(id):
     """
     Update product details.
     """
+    sqlite_backend.begin_write(db.session)
     product = db.session.get(Produto, id)
     if not product:
          return jsonify({"message": "Product not found"}), 404
@@ -265,7 +634,9 @@ def update_product(id):
         if 'ativo' in data:
             product.ativo = data['ativo']
 
+        invalidate_cache('products', 'stock', f"product:{product.id}")
         db.session.commit()
+        event_broker.publish('product-updated', {"id_produto": product.id})
 
         return jsonify({
             "message": f"Product {id} updated successfully",
@@ -275,9 +646,238 @@ def update_product(id):
         db.session.rollback()
         return jsonify({"message": f"Error updating product: {str(e)}"}), 500
 
+# Fields PATCH /products/batch may change (the same as PUT /products/<id>), by value kind
+PRODUCT_FIELDS = {
+    'descricao': str,
+    'ean13': str,
+    'codigo_auxiliar': str,
+    'quantidade': float,
+    'preco_custo': float,
+    'preco_venda': float,
+    'ativo': bool,
+}
+
+# Up to this many ids are listed in a 'products-updated' event (more: clients reload everything)
+PRODUCTS_EVENT_MAX_IDS = 500
+
+def publish_products_updated(ids):
+    event_broker.publish('products-updated', {
+        "count": len(ids),
+        "ids_produto": ids if len(ids) <= PRODUCTS_EVENT_MAX_IDS else None,
+    })
+
+def _is_finite_number(value):
+    """int or float, not bool, NaN or infinite (Python's JSON parser accepts NaN and Infinity)."""
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return True
+    return isinstance(value, float) and math.isfinite(value)
+
+def _valid_field_value(kind, value):
+    if value is None:
+        return kind is not bool
+    if kind is float:
+        # Stock and prices: finite and not negative
+        return _is_finite_number(value) and value >= 0
+    return isinstance(value, kind)
+
+@bp.route('/products/batch', methods=['PATCH'])
+def update_products_batch():
+    """
+    Update many products in one transaction (e.g. new prices after a supplier increase).
+    Body:
+        updates: List of objects {id, <fields to change>} (same fields as PUT /products/<id>)
+    All or nothing: if an id does not exist nothing is changed (404). The whole batch
+    is a single UPDATE ... RETURNING: each field is set with one CASE over the ids
+    that change it.
+    Returns the updated products.
+    """
+    data = request.json
+    updates = data.get('updates') if isinstance(data, dict) else None
+    if not isinstance(updates, list) or not updates:
+        return jsonify({"message": "Invalid data: 'updates' list is required"}), 400
+    if len(updates) > current_app.config['PRODUCTS_BATCH_MAX']:
+        return jsonify({"message": f"Too many updates in one batch (max {current_app.config['PRODUCTS_BATCH_MAX']})"}), 400
+
+    ids = []
+    seen = set()
+    changes = {}  # field -> {product id: new value}
+    for update in updates:
+        product_id = update.get('id') if isinstance(update, dict) else None
+        if not isinstance(product_id, int) or isinstance(product_id, bool):
+            return jsonify({"message": "Each update needs an integer 'id'"}), 400
+        if product_id in seen:
+            return jsonify({"message": f"Product {product_id} appears more than once"}), 400
+        seen.add(product_id)
+        ids.append(product_id)
+        for field, value in update.items():
+            if field == 'id':
+                continue
+            if field not in PRODUCT_FIELDS:
+                return jsonify({"message": f"Unknown field '{field}' (use {', '.join(PRODUCT_FIELDS)})"}), 400
+            if not _valid_field_value(PRODUCT_FIELDS[field], value):
+                return jsonify({"message": f"Invalid value for '{field}' of product {product_id}"}), 400
+            changes.setdefault(field, {})[product_id] = value
+    if not changes:
+        return jsonify({"message": "No fields to update"}), 400
+
+    try:
+        sqlite_backend.begin_write(db.session)
+        values = {
+            field: case(
+                {product_id: literal(value, produtos_table.c[field].type) for product_id, value in by_id.items()},
+                value=produtos_table.c.id,
+                else_=produtos_table.c[field]
+            )
+            for field, by_id in changes.items()
+        }
+        rows = db.session.execute(
+            db.update(produtos_table)
+            .where(produtos_table.c.id.in_(ids))
+            .values(values)
+            .returning(*PRODUTO_COLUMNS)
+        ).mappings().all()
+
+        if len(rows) != len(ids):
+            db.session.rollback()
+            found = {row['id'] for row in rows}
+            missing = [product_id for product_id in ids if product_id not in found]
+            return jsonify({"message": f"Products not found: {missing}", "missing": missing}), 404
+
+        invalidate_cache('products', 'stock')
+        db.session.commit()
+        publish_products_updated(ids)
+
+        return jsonify({
+            "message": f"{len(rows)} products updated successfully",
+            "count": len(rows),
+            "data": rows
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": f"Error updating products: {str(e)}"}), 500
+
+REPRICE_BASES = ('preco_custo', 'preco_venda')
+
+def _decimal(value, name):
+    if not (_is_finite_number(value) or isinstance(value, str)):
+        raise ValueError(f"'{name}' must be a number")
+    try:
+        number = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f"'{name}' must be a number")
+    if not number.is_finite():
+        raise ValueError(f"'{name}' must be a number")
+    return number
+
+@bp.route('/products/reprice', methods=['POST'])
+def reprice_products():
+    """
+    Set sale prices by rule, in one set-based UPDATE ... RETURNING (one round trip
+    for the whole catalog):
+        preco_venda = round(<base> * (1 + markup_pct / 100), to a multiple of round_to)
+    Body:
+        markup_pct: number (required) - e.g. 40 for cost + 40%, or 8 with base preco_venda for +8%
+        base: 'preco_custo' (default) | 'preco_venda'
+        round_to: number (optional, default 0.01) - e.g. 0.10 for prices ending in 0
+        filter: object (optional) {
+            ids: list of product ids,
+            q: text in the description (or the exact EAN13 / aux code),
+            active_only: bool (default true)
+        }
+        dry_run: bool (optional) - only preview the new prices
+    Products without a base price are skipped; only rows whose price changes are
+    updated and returned.
+    """
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({"message": "No input data provided"}), 400
+
+    try:
+        if 'markup_pct' not in data:
+            raise ValueError("'markup_pct' is required")
+        factor = 1 + _decimal(data['markup_pct'], 'markup_pct') / 100
+        if factor < 0:
+            raise ValueError("'markup_pct' cannot be below -100")
+        base = data.get('base', 'preco_custo')
+        if base not in REPRICE_BASES:
+            raise ValueError(f"'base' must be one of: {', '.join(REPRICE_BASES)}")
+        step = _decimal(data.get('round_to', '0.01'), 'round_to')
+        if step <= 0:
+            raise ValueError("'round_to' must be positive")
+        filters = data.get('filter') or {}
+        if not isinstance(filters, dict):
+            raise ValueError("'filter' must be an object")
+        filter_ids = filters.get('ids')
+        if filter_ids is not None and (not isinstance(filter_ids, list) or
+                                       not all(isinstance(i, int) and not isinstance(i, bool) for i in filter_ids)):
+            raise ValueError("'filter.ids' must be a list of integers")
+        query_term = filters.get('q')
+        if query_term is not None and not isinstance(query_term, str):
+            raise ValueError("'filter.q' must be a string")
+    except ValueError as e:
+        return jsonify({"message": f"Invalid data: {str(e)}"}), 400
+
+    # Numeric binds keep the arithmetic in NUMERIC (exact) on PostgreSQL
+    new_price = func.round(
+        produtos_table.c[base] * literal(factor, Numeric) / literal(step, Numeric)
+    ) * literal(step, Numeric)
+    conditions = [
+        produtos_table.c[base] != None,
+        produtos_table.c.preco_venda.is_distinct_from(new_price),
+    ]
+    if filters.get('active_only', True):
+        conditions.append(produtos_table.c.ativo == True)
+    if filter_ids is not None:
+        conditions.append(produtos_table.c.id.in_(filter_ids))
+    if query_term and query_term.strip():
+        query_term = query_term.strip()
+        conditions.append(or_(
+            produtos_table.c.descricao.ilike(f"%{query_term}%"),
+            produtos_table.c.ean13 == query_term,
+            produtos_table.c.codigo_auxiliar == query_term,
+        ))
+
+    try:
+        if data.get('dry_run'):
+            rows = fetch_rows(
+                db.select(
+                    produtos_table.c.id,
+                    produtos_table.c.descricao,
+                    produtos_table.c.preco_custo,
+                    produtos_table.c.preco_venda,
+                    new_price.label('novo_preco_venda'),
+                ).where(*conditions).order_by(produtos_table.c.id)
+            )
+            return jsonify({"message": "Reprice preview", "dry_run": True, "count": len(rows), "data": rows})
+
+        sqlite_backend.begin_write(db.session)
+        rows = db.session.execute(
+            db.update(produtos_table)
+            .where(*conditions)
+            .values(preco_venda=new_price)
+            .returning(*PRODUTO_COLUMNS)
+        ).mappings().all()
+        if rows:
+            invalidate_cache('products', 'stock')
+        db.session.commit()
+        if rows:
+            publish_products_updated([row['id'] for row in rows])
+
+        return jsonify({
+            "message": f"{len(rows)} products repriced",
+            "dry_run": False,
+            "count": len(rows),
+            "data": rows
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": f"Error repricing products: {str(e)}"}), 500
+
 # --- Stock Routes ---
 
-@app.route('/estok/movement', methods=['POST'])
+@bp.route('/estok/movement', methods=['POST'])
 def stock_movement():
     """
     Register a stock movement (entry, exit, adjustment).
@@ -304,6 +904,7 @@ def stock_movement():
         return jsonify({"message": "Invalid input: id_produto and valid tipo required"}), 400
 
     try:
+        sqlite_backend.begin_write(db.session)
         product = db.session.get(Produto, id_produto)
         if not product:
             return jsonify({"message": "Product not found"}), 404
@@ -337,7 +938,13 @@ def stock_movement():
         )
 
         db.session.add(mov)
+        invalidate_cache('stock', f"product:{product.id}")
         db.session.commit()
+        event_broker.publish('stock-moved', {
+            "id_produto": product.id,
+            "tipo": tipo,
+            "quantidade": qtd_nova
+        })
 
         return jsonify({
             "message": "Stock movement registered successfully",
@@ -353,7 +960,9 @@ def stock_movement():
 
 # --- Dashboard Routes ---
 
-@app.route('/dashboard/summary', methods=['GET'])
+@bp.route('/dashboard/summary', methods=['GET'])
+@cached_view('sales')
+@reads_from_replica
 def get_dashboard_summary():
     """
     Get Sales and Profit summary for Day, Week, and Month.
@@ -377,7 +986,7 @@ def get_dashboard_summary():
             # Profit Total: Sum((price - cost) * qty)
             profit_sum = db.session.query(
                 func.sum((ItemVenda.valor_unitario - ItemVenda.preco_custo) * ItemVenda.quantidade)
-            ).join(Venda).filter(Venda.data_venda >= start_date).scalar() or 0.0
+            ).join(Venda, sale_items_join(start_date)).filter(Venda.data_venda >= start_date).scalar() or 0.0
 
             return float(sales_sum), float(profit_sum), int(sales_count)
 
@@ -406,26 +1015,51 @@ def get_dashboard_summary():
     except Exception as e:
         return jsonify({"message": f"Error loading dashboard summary: {str(e)}"}), 500
 
-@app.route('/dashboard/recent-sales', methods=['GET'])
+@bp.route('/dashboard/recent-sales', methods=['GET'])
+@cached_view('sales', 'payment-methods')
+@reads_from_replica
 def get_recent_sales():
     """
     Get last 5 sales.
     """
     try:
-        recent_sales = Venda.query.order_by(Venda.data_venda.desc()).limit(5).all()
-        # Enrich with item count
+        # Two queries (sales + their items) instead of lazy-loading per sale
+        recent_sales = fetch_rows(
+            db.select(
+                vendas_table.c.id,
+                vendas_table.c.data_venda,
+                func.coalesce(vendas_table.c.valor_total, 0).label('valor_total'),
+                vendas_table.c.id_forma_pagamento,
+                formas_pagamento_table.c.nome.label('forma_pagamento_nome')
+            ).select_from(vendas_table).outerjoin(
+                formas_pagamento_table, vendas_table.c.id_forma_pagamento == formas_pagamento_table.c.id
+            ).order_by(vendas_table.c.data_venda.desc()).limit(5)
+        )
+
+        items_by_sale = {}
+        if recent_sales:
+            items = fetch_rows(
+                db.select(*ITEM_VENDA_COLUMNS)
+                .where(itens_venda_table.c.id_venda.in_([sale['id'] for sale in recent_sales]))
+                .order_by(itens_venda_table.c.id)
+            )
+            for item in items:
+                items_by_sale.setdefault(item['id_venda'], []).append(item)
+
         result = []
         for sale in recent_sales:
-             s_dict = sale.to_dict()
-             s_dict['items_count'] = len(sale.items)
-             # Simplify items for payload size if needed, but keeping full obj is fine for 5 items
+             s_dict = dict(sale)
+             s_dict['items'] = items_by_sale.get(sale['id'], [])
+             s_dict['items_count'] = len(s_dict['items'])
              result.append(s_dict)
         
         return jsonify(result)
     except Exception as e:
          return jsonify({"message": f"Error loading recent sales: {str(e)}"}), 500
 
-@app.route('/dashboard/top-products', methods=['GET'])
+@bp.route('/dashboard/top-products', methods=['GET'])
+@cached_view('sales', 'products')
+@reads_from_replica
 def get_top_products():
     """
     Get top 5 best selling products in the last 7 days.
@@ -440,7 +1074,7 @@ def get_top_products():
             Produto.descricao,
             func.sum(ItemVenda.quantidade).label('total_qty')
         ).join(ItemVenda, Produto.id == ItemVenda.id_produto)\
-         .join(Venda, ItemVenda.id_venda == Venda.id)\
+         .join(Venda, sale_items_join(week_start))\
          .filter(Venda.data_venda >= week_start)\
          .group_by(Produto.id)\
          .order_by(desc('total_qty'))\
@@ -459,7 +1093,9 @@ def get_top_products():
     except Exception as e:
         return jsonify({"message": f"Error loading top products: {str(e)}"}), 500
 
-@app.route('/dashboard/inventory-summary', methods=['GET'])
+@bp.route('/dashboard/inventory-summary', methods=['GET'])
+@cached_view('products', 'stock')
+@reads_from_replica
 def get_inventory_summary():
     """
     Get Total Inventory Value (Cost) and Sale Potential.
@@ -484,7 +1120,9 @@ def get_inventory_summary():
     except Exception as e:
         return jsonify({"message": f"Error loading inventory summary: {str(e)}"}), 500
 
-@app.route('/dashboard/smart-alerts', methods=['GET'])
+@bp.route('/dashboard/smart-alerts', methods=['GET'])
+@cached_view('products', 'stock', 'sales')
+@reads_from_replica
 def get_smart_alerts():
     """
     Get products with low stock based on sales velocity (last 30 days coverage < 7 days).
@@ -498,7 +1136,7 @@ def get_smart_alerts():
         sales_subquery = db.session.query(
             ItemVenda.id_produto,
             func.sum(ItemVenda.quantidade).label('sold_30d')
-        ).join(Venda).filter(Venda.data_venda >= start_30d)\
+        ).join(Venda, sale_items_join(start_30d)).filter(Venda.data_venda >= start_30d)\
          .group_by(ItemVenda.id_produto).subquery()
 
         # 2. Join with Products and Filter
@@ -544,7 +1182,7 @@ def get_smart_alerts():
 
 # --- Sales Routes ---
 
-@app.route('/sales', methods=['POST'])
+@bp.route('/sales', methods=['POST'])
 def create_sale():
     """
     Register a finalized sale.
@@ -553,12 +1191,16 @@ def create_sale():
         valor_total: float
     """
     data = request.json
-    if not data or 'items' not in data:
+    if not isinstance(data, dict) or 'items' not in data:
         return jsonify({"message": "Invalid data: 'items' list is required"}), 400
 
-    items_data = data.get('items', [])
-    if not items_data:
-         return jsonify({"message": "Items list cannot be empty"}), 400
+    try:
+        items = _parse_items(data['items'])
+    except ValueError as ve:
+        return jsonify({"message": str(ve)}), 400
+
+    if current_app.config['GROUP_COMMIT_ENABLED']:
+        return _create_sale_group_commit(data)
 
     try:
         # 1. Create Sale Header
@@ -568,7 +1210,8 @@ def create_sale():
         # For simplicity, let's sum up the items' totals.
         
         calculated_total = 0.0
-        
+        sqlite_backend.begin_write(db.session)
+
         id_forma_pagamento = data.get('id_forma_pagamento')
         if id_forma_pagamento:
             forma = db.session.get(FormaPagamento, id_forma_pagamento)
@@ -590,14 +1233,7 @@ def create_sale():
 
         sale_items = []
 
-        for item in items_data:
-            prod_id = item.get('id_produto')
-            qtd = float(item.get('quantidade', 0))
-            val_unit = float(item.get('valor_unitario', 0))
-            
-            if qtd <= 0:
-                raise ValueError(f"Quantity for product {prod_id} must be positive")
-
+        for prod_id, qtd, val_unit in items:
             product = db.session.get(Produto, prod_id)
             if not product:
                  raise ValueError(f"Product ID {prod_id} not found")
@@ -615,7 +1251,8 @@ def create_sale():
                 quantidade=qtd,
                 preco_custo=cost_price,
                 valor_unitario=val_unit,
-                valor_total=item_total
+                valor_total=item_total,
+                data_venda=new_sale.data_venda
             )
             db.session.add(new_item)
             sale_items.append(new_item)
@@ -645,7 +1282,13 @@ def create_sale():
         # Let's trust logic:
         new_sale.valor_total = calculated_total
 
+        invalidate_cache('sales', 'stock', *{f"product:{item.id_produto}" for item in sale_items})
         db.session.commit()
+        event_broker.publish('sale-created', {
+            "sale_id": new_sale.id,
+            "total_value": calculated_total,
+            "product_ids": sorted({item.id_produto for item in sale_items})
+        })
 
         return jsonify({
             "message": "Sale registered successfully",
@@ -661,9 +1304,367 @@ def create_sale():
         db.session.rollback()
         return jsonify({"message": f"Error registering sale: {str(e)}"}), 500
 
+def _create_sale_group_commit(data):
+    """
+    POST /sales through the group-commit writer: the sale is registered together with
+    other sales arriving in the same window, and this request returns only after the
+    shared transaction has committed.
+
+    Sales without a chave_idempotencia get one from the server, so a request that
+    times out while its sale is being committed can be answered with a key the
+    client resends to learn the outcome, instead of registering the sale twice.
+    """
+    try:
+        key, sale = _parse_sale(data, require_key=False)
+    except ValueError as ve:
+        return jsonify({"message": str(ve)}), 400
+    if key is None:
+        key = sale['chave_idempotencia'] = uuid.uuid4().hex
+
+    future = sales_writer.submit(sale)
+    try:
+        result = future.result(timeout=current_app.config['GROUP_COMMIT_TIMEOUT'])
+    except FutureTimeoutError:
+        if future.cancel():
+            # Still queued: dropped, so the sale was not registered and a retry is safe
+            response = jsonify({"message": "Server busy: sale not registered, please retry"})
+            response.status_code = 503
+            response.headers['Retry-After'] = '1'
+            return response
+        return jsonify({
+            "message": "Sale is still being registered; resend it with this chave_idempotencia to get the result",
+            "chave_idempotencia": key
+        }), 504
+    except Exception as e:
+        return jsonify({"message": f"Error registering sale: {str(e)}"}), 500
+
+    if result['status'] == 'error':
+        return jsonify({"message": result['message']}), 400
+    if result['status'] == 'duplicate':
+        return jsonify({"message": "Sale already registered", "sale_id": result['sale_id']})
+
+    return jsonify({
+        "message": "Sale registered successfully",
+        "sale_id": result['sale_id'],
+        "items_count": result['items_count'],
+        "total_value": result['total_value']
+    }), 201
+
+def _commit_sales_group(sales):
+    """Group-commit batch handler: register the coalesced sales and commit once."""
+    entries = [({"chave_idempotencia": sale.get('chave_idempotencia')}, sale) for sale in sales]
+    try:
+        ingest_sales_chunk(entries)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    publish_sales_created(entries)
+    return [result for result, _ in entries]
+
+def _register_sales_chunk(chunk):
+    """Commit a /sales/batch chunk; when it fails, retry its sales one per transaction."""
+    try:
+        ingest_sales_chunk(chunk)
+        db.session.commit()
+        publish_sales_created(chunk)
+        return
+    except Exception as e:
+        db.session.rollback()
+        error = e
+    for result, _ in chunk:
+        # Drop what the failed attempt filled in (status, sale_id...)
+        key = result['chave_idempotencia']
+        result.clear()
+        result['chave_idempotencia'] = key
+        if len(chunk) == 1:
+            result.update(status='error', message=f"Error registering sale: {str(error)}")
+    if len(chunk) > 1:
+        for entry in chunk:
+            _register_sales_chunk([entry])
+
+def publish_sales_created(entries):
+    """Publish 'sale-created' for the sales of a committed chunk."""
+    for result, sale in entries:
+        if result.get('status') == 'created':
+            event_broker.publish('sale-created', {
+                "sale_id": result['sale_id'],
+                "total_value": result['total_value'],
+                "product_ids": sorted({prod_id for prod_id, _, _ in sale['items']})
+            })
+
+def _parse_items(items_data):
+    """
+    Validate the items of a sale: a non-empty list of objects {id_produto,
+    quantidade, valor_unitario}. Returns [(id_produto, quantidade, valor_unitario)];
+    raises ValueError with the client message.
+    """
+    if items_data is None or items_data == []:
+        raise ValueError("Items list cannot be empty")
+    if not isinstance(items_data, list):
+        raise ValueError("Invalid data: 'items' must be a list")
+
+    items = []
+    for item in items_data:
+        if not isinstance(item, dict):
+            raise ValueError("Invalid item: object expected")
+        prod_id = item.get('id_produto')
+        try:
+            prod_id = int(prod_id)
+        except (ValueError, TypeError):
+            raise ValueError(f"Product ID {prod_id} not found")
+        try:
+            qtd = float(item.get('quantidade', 0))
+            val_unit = float(item.get('valor_unitario', 0))
+        except (ValueError, TypeError):
+            raise ValueError(f"Invalid quantity or price for product {prod_id}")
+        if not math.isfinite(qtd) or not math.isfinite(val_unit):
+            raise ValueError(f"Invalid quantity or price for product {prod_id}")
+        if qtd <= 0:
+            raise ValueError(f"Quantity for product {prod_id} must be positive")
+        items.append((prod_id, qtd, val_unit))
+    return items
+
+def _parse_sale(sale, require_key=True):
+    """
+    Validate one sale payload without touching the database.
+    Returns (key, normalized_sale); raises ValueError with the client message.
+    """
+    if not isinstance(sale, dict):
+        raise ValueError("Invalid sale: object expected")
+
+    key = sale.get('chave_idempotencia')
+    if (require_key or key is not None) and (not key or not isinstance(key, str) or len(key) > 64):
+        raise ValueError("'chave_idempotencia' is required (string, max 64 chars)")
+
+    items = _parse_items(sale.get('items'))
+
+    data_venda = sale.get('data_venda')
+    if data_venda:
+        try:
+            data_venda = datetime.fromisoformat(data_venda)
+        except (ValueError, TypeError):
+            raise ValueError(f"Invalid data_venda '{data_venda}' (ISO 8601 expected)")
+        if data_venda.tzinfo is None:
+            data_venda = data_venda.replace(tzinfo=timezone.utc)
+    else:
+        data_venda = datetime.now(timezone.utc)
+
+    return key, {
+        'chave_idempotencia': key,
+        'id_forma_pagamento': sale.get('id_forma_pagamento'),
+        'data_venda': data_venda,
+        'items': items,
+    }
+
+def ingest_sales_chunk(entries):
+    """
+    Register a chunk of already-parsed sales in ONE transaction using set-based inserts.
+    entries: list of (result, sale) where result is the mutable per-sale result dict.
+    Sales whose key was already registered are marked 'duplicate' and skipped;
+    sales without a key (single /sales requests) are always registered.
+    Starts the transaction as a write (call it first); the caller commits or rolls back.
+    """
+    sqlite_backend.begin_write(db.session)
+    keys = [result['chave_idempotencia'] for result, _ in entries if result.get('chave_idempotencia')]
+
+    # 1. Skip keys registered by earlier requests
+    existing = dict(db.session.execute(
+        db.select(vendas_idempotencia_table.c.chave, vendas_idempotencia_table.c.id_venda)
+        .where(vendas_idempotencia_table.c.chave.in_(keys))
+    ).all()) if keys else {}
+
+    pending = []
+    for result, sale in entries:
+        if result.get('chave_idempotencia') in existing:
+            result.update(status='duplicate', sale_id=existing[result['chave_idempotencia']])
+        else:
+            pending.append((result, sale))
+    if not pending:
+        return
+
+    # 2. Lock referenced products (ordered by id to avoid deadlocks) and load payment methods
+    product_ids = sorted({prod_id for _, sale in pending for prod_id, _, _ in sale['items']})
+    products = {
+        row.id: {'quantidade': float(row.quantidade or 0), 'preco_custo': float(row.preco_custo or 0)}
+        for row in db.session.execute(
+            db.select(produtos_table.c.id, produtos_table.c.quantidade, produtos_table.c.preco_custo)
+            .where(produtos_table.c.id.in_(product_ids))
+            .order_by(produtos_table.c.id)
+            .with_for_update()
+        )
+    }
+    forma_ids = {sale['id_forma_pagamento'] for _, sale in pending if sale['id_forma_pagamento']}
+    formas = {
+        row.id: row for row in db.session.execute(
+            db.select(formas_pagamento_table.c.id, formas_pagamento_table.c.nome, formas_pagamento_table.c.ativo)
+            .where(formas_pagamento_table.c.id.in_(forma_ids))
+        )
+    } if forma_ids else {}
+
+    valid = []
+    for result, sale in pending:
+        forma_id = sale['id_forma_pagamento']
+        if forma_id:
+            forma = formas.get(forma_id)
+            if not forma:
+                result.update(status='error', message=f"Forma de pagamento ID {forma_id} não encontrada")
+                continue
+            if not forma.ativo:
+                result.update(status='error', message=f"Forma de pagamento '{forma.nome}' está inativa")
+                continue
+        missing = next((prod_id for prod_id, _, _ in sale['items'] if prod_id not in products), None)
+        if missing is not None:
+            result.update(status='error', message=f"Product ID {missing} not found")
+            continue
+        valid.append((result, sale))
+    if not valid:
+        return
+
+    # 3. Claim the keys. A concurrent request holding the same key wins; ours become duplicates.
+    now = datetime.now(timezone.utc)
+    keyed = [result for result, _ in valid if result.get('chave_idempotencia')]
+    claimed = set(db.session.scalars(
+        insert_ignoring_conflicts(vendas_idempotencia_table, db.engine.dialect.name, ['chave'])
+        .values([{'chave': result['chave_idempotencia'], 'data_registro': now} for result in keyed])
+        .returning(vendas_idempotencia_table.c.chave)
+    )) if keyed else set()
+    lost = [result for result in keyed if result['chave_idempotencia'] not in claimed]
+    if lost:
+        winners = dict(db.session.execute(
+            db.select(vendas_idempotencia_table.c.chave, vendas_idempotencia_table.c.id_venda)
+            .where(vendas_idempotencia_table.c.chave.in_([r['chave_idempotencia'] for r in lost]))
+        ).all())
+        for result in lost:
+            result.update(status='duplicate', sale_id=winners.get(result['chave_idempotencia']))
+        lost_ids = {id(result) for result in lost}
+        valid = [(result, sale) for result, sale in valid if id(result) not in lost_ids]
+        if not valid:
+            return
+
+    # 4. Sale headers (one multi-row INSERT, ids returned in parameter order)
+    for _, sale in valid:
+        sale['valor_total'] = sum(qtd * val_unit for _, qtd, val_unit in sale['items'])
+    sale_ids = db.session.scalars(
+        db.insert(vendas_table).returning(vendas_table.c.id, sort_by_parameter_order=True),
+        [{
+            'data_venda': sale['data_venda'],
+            'valor_total': sale['valor_total'],
+            'id_forma_pagamento': sale['id_forma_pagamento'] or None,
+        } for _, sale in valid]
+    ).all()
+
+    # 5. Items, Kardex and stock balances (running balance per product in arrival order)
+    item_rows = []
+    movement_rows = []
+    for (result, sale), sale_id in zip(valid, sale_ids):
+        for prod_id, qtd, val_unit in sale['items']:
+            product = products[prod_id]
+            old_qty = product['quantidade']
+            new_qty = old_qty - qtd
+            product['quantidade'] = new_qty
+            item_rows.append({
+                'id_venda': sale_id,
+                'id_produto': prod_id,
+                'quantidade': qtd,
+                'preco_custo': product['preco_custo'],
+                'valor_unitario': val_unit,
+                'valor_total': qtd * val_unit,
+                'data_venda': sale['data_venda'],
+            })
+            movement_rows.append({
+                'id_produto': prod_id,
+                'tipo': 'VENDA',
+                'quantidade_anterior': old_qty,
+                'quantidade_movimentada': -qtd,
+                'quantidade_nova': new_qty,
+                'data_movimentacao': sale['data_venda'],
+                'id_venda': sale_id,
+                'observacao': f"Venda #{sale_id}",
+            })
+        result.update(status='created', sale_id=sale_id, items_count=len(sale['items']), total_value=sale['valor_total'])
+
+    db.session.execute(db.insert(itens_venda_table), item_rows)
+    db.session.execute(db.insert(movimentacoes_table), movement_rows)
+
+    touched = {row['id_produto'] for row in item_rows}
+    invalidate_cache('sales', 'stock', *(f"product:{prod_id}" for prod_id in touched))
+    db.session.execute(
+        db.update(produtos_table).where(produtos_table.c.id == bindparam('b_id')).values(quantidade=bindparam('b_qty')),
+        [{'b_id': prod_id, 'b_qty': products[prod_id]['quantidade']} for prod_id in touched]
+    )
+    keyed_results = [result for result, _ in valid if result.get('chave_idempotencia')]
+    if keyed_results:
+        db.session.execute(
+            db.update(vendas_idempotencia_table)
+            .where(vendas_idempotencia_table.c.chave == bindparam('b_chave'))
+            .values(id_venda=bindparam('b_id_venda')),
+            [{'b_chave': result['chave_idempotencia'], 'b_id_venda': result['sale_id']} for result in keyed_results]
+        )
+
+@bp.route('/sales/batch', methods=['POST'])
+def create_sales_batch():
+    """
+    Register many sales at once (offline terminals flushing their queue).
+    Body:
+        sales: List of objects {chave_idempotencia, items, id_forma_pagamento (optional), data_venda (optional, ISO 8601)}
+    Sales are processed in chunked transactions; if a chunk fails, its sales are
+    retried one per transaction, so only the failing sale reports an error. Keys
+    already registered are reported as 'duplicate' with the original sale_id, so
+    retries are safe. Returns per-sale results in input order.
+    """
+    data = request.json
+    if not isinstance(data, dict) or not isinstance(data.get('sales'), list):
+        return jsonify({"message": "Invalid data: 'sales' list is required"}), 400
+
+    sales_data = data['sales']
+    if len(sales_data) > current_app.config['SALES_BATCH_MAX']:
+        return jsonify({"message": f"Too many sales in one batch (max {current_app.config['SALES_BATCH_MAX']})"}), 400
+
+    results = []
+    entries = []
+    seen_keys = {}
+    for sale in sales_data:
+        try:
+            key, parsed = _parse_sale(sale)
+        except ValueError as ve:
+            key = sale.get('chave_idempotencia') if isinstance(sale, dict) else None
+            results.append({"chave_idempotencia": key, "status": "error", "message": str(ve)})
+            continue
+
+        result = {"chave_idempotencia": key}
+        results.append(result)
+        if key in seen_keys:
+            # Same key twice in one request: resolved after the first one is stored
+            result['duplicate_of'] = seen_keys[key]
+            continue
+        seen_keys[key] = result
+        entries.append((result, parsed))
+
+    chunk_size = max(1, int(current_app.config['SALES_BATCH_CHUNK_SIZE']))
+    for start in range(0, len(entries), chunk_size):
+        _register_sales_chunk(entries[start:start + chunk_size])
+
+    for result in results:
+        first = result.pop('duplicate_of', None)
+        if first is None:
+            continue
+        if first['status'] == 'error':
+            result.update(status='error', message=first['message'])
+        else:
+            result.update(status='duplicate', sale_id=first.get('sale_id'))
+
+    summary = {status: sum(1 for r in results if r['status'] == status) for status in ('created', 'duplicate', 'error')}
+    return jsonify({
+        "message": "Sales batch processed",
+        "count": len(results),
+        **summary,
+        "results": results
+    })
+
 # --- Payment Method Routes ---
 
-@app.route('/payment-methods', methods=['GET'])
+@bp.route('/payment-methods', methods=['GET'])
 def get_payment_methods():
     """
     Get all payment methods.
@@ -672,16 +1673,13 @@ def get_payment_methods():
     """
     try:
         active_only = request.args.get('active_only', 'false').lower() == 'true'
-        query = FormaPagamento.query
-        if active_only:
-            query = query.filter_by(ativo=True)
-        # Order by atalho so shortcuts are in consistent order, then name
-        methods = query.order_by(FormaPagamento.atalho, FormaPagamento.nome).all()
-        return jsonify([m.to_dict() for m in methods])
+        methods = cached_rows(('payment-methods', active_only), ('payment-methods',),
+                              ACTIVE_PAYMENT_METHODS_STMT if active_only else PAYMENT_METHODS_STMT)
+        return jsonify(methods)
     except Exception as e:
         return jsonify({"message": f"Error retrieving payment methods: {str(e)}"}), 500
 
-@app.route('/payment-methods', methods=['POST'])
+@bp.route('/payment-methods', methods=['POST'])
 def save_payment_method():
     """
     Create or update a payment method.
@@ -704,6 +1702,7 @@ def save_payment_method():
         return jsonify({"message": "Atalho deve ser uma única letra"}), 400
 
     try:
+        sqlite_backend.begin_write(db.session)
         # Check uniqueness of shortcut
         existing = FormaPagamento.query.filter(FormaPagamento.atalho == atalho).first()
         if existing and (method_id is None or existing.id != method_id):
@@ -724,24 +1723,27 @@ def save_payment_method():
             db.session.add(method)
             message = "Forma de pagamento cadastrada"
 
+        invalidate_cache('payment-methods')
         db.session.commit()
         return jsonify({"message": message, "data": method.to_dict()})
     except Exception as e:
         db.session.rollback()
         return jsonify({"message": f"Error saving payment method: {str(e)}"}), 500
 
-@app.route('/payment-methods/<int:id>', methods=['DELETE'])
+@bp.route('/payment-methods/<int:id>', methods=['DELETE'])
 def delete_payment_method(id):
     """
     Delete payment method. If sales are linked, perform soft-delete instead.
     """
     try:
+        sqlite_backend.begin_write(db.session)
         method = db.session.get(FormaPagamento, id)
         if not method:
             return jsonify({"message": "Forma de pagamento não encontrada"}), 404
 
         # Check if there are sales referencing it
         has_sales = Venda.query.filter_by(id_forma_pagamento=id).first() is not None
+        invalidate_cache('payment-methods')
         if has_sales:
             method.ativo = False
             db.session.commit()
@@ -762,29 +1764,341 @@ def delete_payment_method(id):
 
 # --- Report Routes ---
 
-@app.route('/reports/sales-by-payment', methods=['GET'])
-def get_reports_sales_by_payment():
+def report_period():
     """
-    Get Sales Report grouped by Payment Method.
+    Period of a report from the start_date / end_date query params (YYYY-MM-DD).
+    Defaults: start of the current month up to the end of today (UTC).
+    """
+    start_date_str = request.args.get('start_date')
+    end_date_str = request.args.get('end_date')
+
+    if start_date_str:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
+    else:
+        # Default to start of current month
+        start_date = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    if end_date_str:
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').replace(hour=23, minute=59, second=59, microsecond=999999, tzinfo=timezone.utc)
+    else:
+        # Default to end of today
+        end_date = datetime.now(timezone.utc).replace(hour=23, minute=59, second=59, microsecond=999999)
+
+    return start_date, end_date
+
+_rollup_refresher_lock = threading.Lock()
+
+@bp.before_app_request
+def ensure_rollup_refresher():
+    """
+    Start the thread that folds new sales into vendas_resumo_hora every
+    REPORT_ROLLUP_REFRESH_SECONDS (once per process; 0 leaves it to
+    `server_cli.py maintenance rollup`). Reports never refresh the rollup
+    themselves: they stay exact by reading the sales above the watermark raw.
+    """
+    app = current_app._get_current_object()
+    if 'estok_rollup_refresher' in app.extensions:
+        return
+    if not app.config['REPORT_ROLLUP_ENABLED'] or not app.config['REPORT_ROLLUP_REFRESH_SECONDS']:
+        app.extensions['estok_rollup_refresher'] = None
+        return
+    with _rollup_refresher_lock:
+        if 'estok_rollup_refresher' not in app.extensions:
+            thread = threading.Thread(target=_refresh_rollup_forever, args=(app,),
+                                      name='estok-rollup-refresh', daemon=True)
+            app.extensions['estok_rollup_refresher'] = thread
+            thread.start()
+
+def _refresh_rollup_forever(app):
+    while True:
+        success, message = db_tools.refresh_rollup(app)
+        if not success:
+            app.logger.error(message)
+        time.sleep(app.config['REPORT_ROLLUP_REFRESH_SECONDS'])
+
+@bp.route('/reports/aggregate', methods=['GET'])
+@reads_from_replica
+def get_reports_aggregate():
+    """
+    Generic time-bucketed sales report, compiled to a single SQL query (report_engine.py).
     Query Params:
         start_date: YYYY-MM-DD
         end_date: YYYY-MM-DD
+        metrics: revenue,profit,quantity,tickets (default: all)
+        bucket: hour | day | week | month | none (default: day)
+        group_by: payment_method,product,weekday (optional)
     """
     try:
-        start_date_str = request.args.get('start_date')
-        end_date_str = request.args.get('end_date')
+        spec = report_engine.parse_spec(request.args)
+        start_date, end_date = report_period()
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
 
-        if start_date_str:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
-        else:
-            # Default to start of current month
-            start_date = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    try:
+        use_rollup = current_app.config['REPORT_ROLLUP_ENABLED']
+        tables = report_engine.ReportTables(
+            vendas=vendas_table,
+            itens=itens_venda_table,
+            formas=formas_pagamento_table,
+            produtos=produtos_table,
+            resumo=vendas_resumo_table if use_rollup else None,
+            controle=vendas_resumo_controle_table if use_rollup else None,
+        )
+        results = fetch_rows(report_engine.build_query(
+            spec, tables, start_date, end_date, partitioned=current_app.config['PARTITIONED_SALES']
+        ))
 
-        if end_date_str:
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').replace(hour=23, minute=59, second=59, microsecond=999999, tzinfo=timezone.utc)
-        else:
-            # Default to end of today
-            end_date = datetime.now(timezone.utc).replace(hour=23, minute=59, second=59, microsecond=999999)
+        return jsonify({
+            "start_date": start_date.strftime('%Y-%m-%d'),
+            "end_date": end_date.strftime('%Y-%m-%d'),
+            **spec,
+            "source": "rollup" if use_rollup else "raw",
+            "count": len(results),
+            "data": results
+        })
+
+    except Exception as e:
+        return jsonify({"message": f"Error loading aggregate report: {str(e)}"}), 500
+
+PROFITABILITY_SORTS = ('revenue', 'cost', 'profit', 'margin', 'quantity', 'description')
+
+@bp.route('/reports/product-profitability', methods=['GET'])
+@reads_from_replica
+def get_reports_product_profitability():
+    """
+    Per-product revenue, cost, profit and margin for a period, with ABC classification.
+    Query Params:
+        start_date: YYYY-MM-DD
+        end_date: YYYY-MM-DD
+        abc_by: revenue | profit (default: revenue)
+        sort_by: revenue | cost | profit | margin | quantity | description (default: revenue)
+        order: asc | desc (default: desc)
+        page: int (default 1)
+        per_page: int (default 50, max 500)
+    ABC: products ranked by abc_by; class A holds the first 80% of the total,
+    B up to 95% and C the rest (a product is classed by the share before it).
+    """
+    try:
+        start_date, end_date = report_period()
+        abc_by = request.args.get('abc_by', 'revenue')
+        sort_by = request.args.get('sort_by', 'revenue')
+        order = request.args.get('order', 'desc')
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', 50)), 1), 500)
+        if abc_by not in ('revenue', 'profit') or sort_by not in PROFITABILITY_SORTS or order not in ('asc', 'desc'):
+            raise ValueError("Invalid abc_by, sort_by or order")
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    try:
+        # One pass over itens_venda of the period: the copied data_venda and the
+        # cost snapshot are on the item, so no join to vendas is needed and the
+        # covering index index_itens_venda_data_venda answers it alone.
+        itens = itens_venda_table
+        per_product = db.select(
+            itens.c.id_produto,
+            func.sum(itens.c.quantidade).label('quantidade'),
+            func.sum(itens.c.valor_total).label('receita'),
+            func.sum(func.coalesce(itens.c.preco_custo, 0) * itens.c.quantidade).label('custo'),
+        ).where(
+            itens.c.data_venda >= start_date,
+            itens.c.data_venda <= end_date
+        ).group_by(itens.c.id_produto).cte('por_produto')
+
+        lucro = per_product.c.receita - per_product.c.custo
+        basis = per_product.c.receita if abc_by == 'revenue' else lucro
+        # Products that lose money carry no share of the ABC curve
+        share_basis = case((basis > 0, basis), else_=0)
+        total = func.sum(share_basis).over()
+        cumulative = func.sum(share_basis).over(
+            order_by=(share_basis.desc(), per_product.c.id_produto),
+            rows=(None, 0)
+        )
+        ranked = db.select(
+            per_product,
+            lucro.label('lucro'),
+            case((per_product.c.receita > 0, lucro * 100 / per_product.c.receita), else_=0).label('margem'),
+            case((total > 0, share_basis * 100 / total), else_=0).label('participacao'),
+            case((total > 0, cumulative * 100 / total), else_=0).label('participacao_acumulada'),
+            case((total > 0, (cumulative - share_basis) * 100 / total), else_=100).label('participacao_anterior'),
+            func.sum(per_product.c.receita).over().label('total_receita'),
+            func.sum(per_product.c.custo).over().label('total_custo'),
+            func.count().over().label('total_produtos'),
+        ).cte('classificados')
+
+        sort_columns = {
+            'revenue': ranked.c.receita,
+            'cost': ranked.c.custo,
+            'profit': ranked.c.lucro,
+            'margin': ranked.c.margem,
+            'quantity': ranked.c.quantidade,
+            'description': produtos_table.c.descricao,
+        }
+        sort_column = sort_columns[sort_by]
+        query = db.select(
+            ranked.c.id_produto,
+            produtos_table.c.descricao,
+            ranked.c.quantidade,
+            ranked.c.receita,
+            ranked.c.custo,
+            ranked.c.lucro,
+            func.round(ranked.c.margem, 2).label('margem'),
+            func.round(ranked.c.participacao, 2).label('participacao'),
+            func.round(ranked.c.participacao_acumulada, 2).label('participacao_acumulada'),
+            case(
+                (ranked.c.participacao_anterior < 80, 'A'),
+                (ranked.c.participacao_anterior < 95, 'B'),
+                else_='C'
+            ).label('classe'),
+            ranked.c.total_receita,
+            ranked.c.total_custo,
+            ranked.c.total_produtos,
+        ).select_from(ranked).outerjoin(
+            produtos_table, ranked.c.id_produto == produtos_table.c.id
+        ).order_by(
+            sort_column.desc() if order == 'desc' else sort_column.asc(),
+            ranked.c.id_produto
+        ).limit(per_page).offset((page - 1) * per_page)
+
+        rows = fetch_rows(query)
+        # Period totals come with every row (window functions), so no second query
+        first = rows[0] if rows else {}
+        total_receita = float(first.get('total_receita') or 0)
+        total_custo = float(first.get('total_custo') or 0)
+        data = [
+            {key: value for key, value in row.items() if not key.startswith('total_')}
+            for row in rows
+        ]
+
+        return jsonify({
+            "start_date": start_date.strftime('%Y-%m-%d'),
+            "end_date": end_date.strftime('%Y-%m-%d'),
+            "abc_by": abc_by,
+            "sort_by": sort_by,
+            "order": order,
+            "page": page,
+            "per_page": per_page,
+            "total_count": int(first.get('total_produtos') or 0),
+            "totals": {
+                "receita": total_receita,
+                "custo": total_custo,
+                "lucro": total_receita - total_custo
+            },
+            "data": data
+        })
+
+    except Exception as e:
+        return jsonify({"message": f"Error loading product profitability report: {str(e)}"}), 500
+
+def parse_as_of(value):
+    """Timestamp of an "as of" query param: YYYY-MM-DD (end of that day) or ISO 8601; default now (UTC)."""
+    if not value:
+        return datetime.now(timezone.utc)
+    if len(value) == 10:
+        as_of = datetime.strptime(value, '%Y-%m-%d').replace(hour=23, minute=59, second=59, microsecond=999999)
+    else:
+        as_of = datetime.fromisoformat(value)
+    return as_of if as_of.tzinfo else as_of.replace(tzinfo=timezone.utc)
+
+def stock_balance_at(as_of):
+    """
+    Stock of each product at `as_of`, rebuilt from the Kardex (movimentacoes_estoque):
+    the quantidade_nova of the last movement up to as_of; without one, the
+    quantidade_anterior of the first movement after it; without any movement, the
+    current quantity. Each branch is a top-1 lookup on index_movimentacoes_produto_data,
+    so the cost grows with the number of products, not with years of movements.
+    """
+    movs = movimentacoes_table
+    last_before = db.select(movs.c.quantidade_nova).where(
+        movs.c.id_produto == produtos_table.c.id,
+        movs.c.data_movimentacao <= as_of
+    ).order_by(movs.c.data_movimentacao.desc(), movs.c.id.desc()).limit(1).scalar_subquery()
+    first_after = db.select(movs.c.quantidade_anterior).where(
+        movs.c.id_produto == produtos_table.c.id,
+        movs.c.data_movimentacao > as_of
+    ).order_by(movs.c.data_movimentacao.asc(), movs.c.id.asc()).limit(1).scalar_subquery()
+    return func.coalesce(last_before, first_after, produtos_table.c.quantidade, 0)
+
+@bp.route('/reports/inventory-valuation', methods=['GET'])
+@reads_from_replica
+def get_reports_inventory_valuation():
+    """
+    Inventory value "as of" a past date (month-end closing), rebuilt from the Kardex.
+    Query Params:
+        at: YYYY-MM-DD (end of that day) or ISO 8601 timestamp (default: now)
+        active_only: bool (optional, defaults to false; products may have been deactivated since)
+        details: bool (optional) - include per-product balances, paginated
+        page: int (default 1)
+        per_page: int (default 100, max 1000)
+    Values use the products' current cost and sale prices.
+    """
+    try:
+        as_of = parse_as_of(request.args.get('at'))
+        active_only = request.args.get('active_only', 'false').lower() == 'true'
+        details = request.args.get('details', 'false').lower() == 'true'
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', 100)), 1), 1000)
+    except ValueError as e:
+        return jsonify({"message": f"Invalid parameter: {str(e)}"}), 400
+
+    try:
+        # Products registered after the date did not exist yet
+        balances = db.select(
+            produtos_table.c.id.label('id_produto'),
+            produtos_table.c.descricao,
+            stock_balance_at(as_of).label('quantidade'),
+            func.coalesce(produtos_table.c.preco_custo, 0).label('preco_custo'),
+            func.coalesce(produtos_table.c.preco_venda, 0).label('preco_venda'),
+        ).where(
+            or_(produtos_table.c.data_cadastro == None, produtos_table.c.data_cadastro <= as_of)
+        )
+        if active_only:
+            balances = balances.where(produtos_table.c.ativo == True)
+        balances = balances.subquery('saldos')
+
+        totals = db.session.execute(
+            db.select(
+                func.coalesce(func.sum(balances.c.quantidade * balances.c.preco_custo), 0),
+                func.coalesce(func.sum(balances.c.quantidade * balances.c.preco_venda), 0),
+                func.coalesce(func.sum(balances.c.quantidade), 0),
+                func.count(),
+            )
+        ).one()
+
+        result = {
+            "at": as_of.isoformat(),
+            "total_cost_value": float(totals[0]),
+            "total_sale_potential": float(totals[1]),
+            "total_items": float(totals[2]),
+            "products_count": int(totals[3]),
+        }
+        if details:
+            result["page"] = page
+            result["per_page"] = per_page
+            result["data"] = fetch_rows(
+                db.select(
+                    balances,
+                    (balances.c.quantidade * balances.c.preco_custo).label('valor_custo'),
+                    (balances.c.quantidade * balances.c.preco_venda).label('valor_venda'),
+                ).order_by(balances.c.descricao, balances.c.id_produto)
+                .limit(per_page).offset((page - 1) * per_page)
+            )
+        return jsonify(result)
+
+    except Exception as e:
+        return jsonify({"message": f"Error loading inventory valuation: {str(e)}"}), 500
+
+@bp.route('/reports/sales-by-payment', methods=['GET'])
+@reads_from_replica
+def get_reports_sales_by_payment():
+    """
+    Get Sales Report grouped by Payment Method.
+    Query Params:
+        start_date: YYYY-MM-DD
+        end_date: YYYY-MM-DD
+    """
+    try:
+        start_date, end_date = report_period()
 
         # 1. Total sales faturamento in this period
         total_faturamento = db.session.query(func.sum(Venda.valor_total)).filter(
@@ -840,7 +2154,8 @@ def get_reports_sales_by_payment():
     except Exception as e:
         return jsonify({"message": f"Error loading sales-by-payment report: {str(e)}"}), 500
 
-@app.route('/reports/sales-details', methods=['GET'])
+@bp.route('/reports/sales-details', methods=['GET'])
+@reads_from_replica
 def get_reports_sales_details():
     """
     Get detailed Sales List.
@@ -850,48 +2165,39 @@ def get_reports_sales_details():
         id_forma_pagamento: int (optional, filter by payment method ID)
     """
     try:
-        start_date_str = request.args.get('start_date')
-        end_date_str = request.args.get('end_date')
+        start_date, end_date = report_period()
         id_forma_pagamento_str = request.args.get('id_forma_pagamento')
 
-        if start_date_str:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
-        else:
-            start_date = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-        if end_date_str:
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').replace(hour=23, minute=59, second=59, microsecond=999999, tzinfo=timezone.utc)
-        else:
-            end_date = datetime.now(timezone.utc).replace(hour=23, minute=59, second=59, microsecond=999999)
-
-        query = Venda.query.filter(
-            Venda.data_venda >= start_date,
-            Venda.data_venda <= end_date
+        # Item quantity per sale as a correlated subquery (one round-trip, no lazy loads)
+        items_count = db.select(
+            func.coalesce(func.sum(itens_venda_table.c.quantidade), 0)
+        ).where(sale_items_join(start_date, end_date)).scalar_subquery()
+
+        query = db.select(
+            vendas_table.c.id,
+            vendas_table.c.data_venda,
+            func.coalesce(vendas_table.c.valor_total, 0).label('valor_total'),
+            vendas_table.c.id_forma_pagamento,
+            func.coalesce(formas_pagamento_table.c.nome, 'Sem Forma de Pagamento').label('forma_pagamento_nome'),
+            items_count.label('items_count')
+        ).select_from(vendas_table).outerjoin(
+            formas_pagamento_table, vendas_table.c.id_forma_pagamento == formas_pagamento_table.c.id
+        ).where(
+            vendas_table.c.data_venda >= start_date,
+            vendas_table.c.data_venda <= end_date
         )
 
         if id_forma_pagamento_str is not None:
             if id_forma_pagamento_str.lower() in ('null', '-1', ''):
-                query = query.filter(Venda.id_forma_pagamento == None)
+                query = query.where(vendas_table.c.id_forma_pagamento == None)
             else:
                 try:
                     fp_id = int(id_forma_pagamento_str)
-                    query = query.filter(Venda.id_forma_pagamento == fp_id)
+                    query = query.where(vendas_table.c.id_forma_pagamento == fp_id)
                 except ValueError:
                     pass
 
-        sales = query.order_by(desc(Venda.data_venda)).all()
-
-        results = []
-        for s in sales:
-            items_count = sum(float(item.quantidade) for item in s.items)
-            results.append({
-                "id": s.id,
-                "data_venda": s.data_venda.isoformat() if s.data_venda else None,
-                "valor_total": float(s.valor_total) if s.valor_total is not None else 0.0,
-                "id_forma_pagamento": s.id_forma_pagamento,
-                "forma_pagamento_nome": s.forma_pagamento.nome if s.forma_pagamento else "Sem Forma de Pagamento",
-                "items_count": items_count
-            })
+        results = fetch_rows(query.order_by(desc(vendas_table.c.data_venda)))
 
         return jsonify({
             "start_date": start_date.strftime('%Y-%m-%d'),
@@ -903,9 +2209,496 @@ def get_reports_sales_details():
     except Exception as e:
         return jsonify({"message": f"Error loading sales-details report: {str(e)}"}), 500
 
-@app.route('/')
+@bp.route('/reports/reorder-suggestions', methods=['GET'])
+@cached_view('products', 'stock', 'sales')
+@reads_from_replica
+def get_reports_reorder_suggestions():
+    """
+    Purchase suggestions for the whole active catalog (reorder_engine.py).
+    Query Params (defaults: REORDER_* config):
+        history_days: int - complete days of sales history (7-730)
+        smoothing: float - weight of the most recent day in the demand average (0.01-1)
+        lead_time_days: float - days between ordering and receiving
+        review_days: float - days until the next purchase review
+        service_level: float - chance of not running out before the goods arrive (0.5-0.999)
+        limit: int (default 100, max 10000) - most urgent suggestions returned
+    """
+    import reorder_engine  # loaded by create_app; not a module import, so `import main` does not load NumPy
+
+    try:
+        params = reorder_suggestions.parse_params(request.args)
+        limit = min(max(int(request.args.get('limit', 100)), 1), 10000)
+    except ValueError as e:
+        return jsonify({"message": f"Invalid parameter: {str(e)}"}), 400
+
+    try:
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        start = today - timedelta(days=params['history_days'])
+        # Every registered sale, also an offline one dated in the past, gets a newer id
+        last_sale_id = db.session.execute(db.select(func.max(vendas_table.c.id))).scalar()
+
+        def load_model():
+            rows = db.session.execute(reorder_engine.history_query(
+                vendas_table, itens_venda_table, sale_items_join(start, today), start, today
+            )).all()
+            return reorder_engine.build_model(
+                rows, int(start.timestamp()) // 86400, params['history_days'], params['smoothing']
+            )
+
+        model = reorder_suggestions.model(
+            (params['history_days'], params['smoothing'], today, last_sale_id), load_model
+        )
+        products = db.session.execute(
+            db.select(
+                produtos_table.c.id,
+                produtos_table.c.descricao,
+                cast(func.coalesce(produtos_table.c.quantidade, 0), Float),
+            ).where(produtos_table.c.ativo == True).order_by(produtos_table.c.id)
+        ).all()
+        total, suggestions = reorder_engine.suggest(model, products, params, limit)
+
+        return jsonify({
+            **params,
+            "products_count": len(products),
+            "reorder_count": total,
+            "count": len(suggestions),
+            "data": suggestions
+        })
+
+    except Exception as e:
+        return jsonify({"message": f"Error loading reorder suggestions: {str(e)}"}), 500
+
+# --- Report Job Routes ---
+
+# Reports that can run as background jobs: name -> endpoint (GET /reports/<name>)
+REPORT_JOB_ENDPOINTS = {
+    'sales-by-payment': 'estok.get_reports_sales_by_payment',
+    'sales-details': 'estok.get_reports_sales_details',
+    'aggregate': 'estok.get_reports_aggregate',
+    'product-profitability': 'estok.get_reports_product_profitability',
+    'inventory-valuation': 'estok.get_reports_inventory_valuation',
+    'reorder-suggestions': 'estok.get_reports_reorder_suggestions',
+}
+
+@bp.route('/reports/jobs', methods=['POST'])
+def create_report_job():
+    """
+    Run a report in the background (for long periods that would outlast client timeouts).
+    Body:
+        report: sales-by-payment | sales-details | aggregate | product-profitability | inventory-valuation
+        params: object with the report's query params (e.g. start_date, end_date)
+        refresh: bool (optional) - recompute even if a stored result exists
+    Returns 202 with the job; poll GET /reports/jobs/<id>. An identical request
+    (same report and params) returns the existing job and its stored result.
+    """
+    data = request.json
+    if not data or data.get('report') not in REPORT_JOB_ENDPOINTS:
+        return jsonify({"message": f"'report' must be one of: {', '.join(REPORT_JOB_ENDPOINTS)}"}), 400
+    params = data.get('params') or {}
+    if not isinstance(params, dict) or any(isinstance(value, (dict, list)) for value in params.values()):
+        return jsonify({"message": "'params' must be an object of query parameters"}), 400
+
+    report = data['report']
+    params = {key: str(value).lower() if isinstance(value, bool) else str(value)
+              for key, value in params.items() if value is not None}
+    job, created = report_jobs.submit(report, REPORT_JOB_ENDPOINTS[report], f"/reports/{report}", params,
+                                      refresh=bool(data.get('refresh')))
+    if job is None:
+        response = jsonify({"message": "Too many report jobs pending, please retry shortly"})
+        response.status_code = 503
+        response.headers['Retry-After'] = '10'
+        return response
+
+    response = jsonify(dict(job.describe(), reused=not created))
+    response.status_code = 202
+    response.headers['Location'] = f"/reports/jobs/{job.id}"
+    return response
+
+@bp.route('/reports/jobs/<job_id>', methods=['GET'])
+def get_report_job(job_id):
+    """
+    Status of a report job: queued, running, done (with `result`) or failed (with `error`).
+    Finished jobs expire after REPORT_JOBS_TTL seconds (404 afterwards).
+    """
+    job = report_jobs.get(job_id)
+    if job is None:
+        return jsonify({"message": "Report job not found or expired"}), 404
+    return Response(job.to_json(), mimetype='application/json')
+
+# --- Event Routes ---
+
+@bp.route('/events', methods=['GET'])
+def stream_events():
+    """
+    Server-Sent Events stream of data changes, published as they commit:
+        sale-created: {sale_id, total_value, product_ids}
+        stock-moved: {id_produto, tipo, quantidade}
+        product-updated: {id_produto}
+        resync: events were missed, reload everything
+    Clients refresh their screens on events instead of polling.
+    Each open stream holds a server thread (its own under server_cli serve, not a
+    worker); EVENTS_MAX_SUBSCRIBERS caps them (503 with Retry-After beyond).
+    """
+    # The stream outlives the app context, so keep the broker itself, not the proxy
+    broker = event_broker._get_current_object()
+    if broker.subscriber_count >= current_app.config['EVENTS_MAX_SUBSCRIBERS']:
+        response = jsonify({"message": "Too many event subscribers"})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+
+    subscription = broker.subscribe(request.headers.get('Last-Event-ID'))
+    response = Response(
+        broker.stream(subscription, heartbeat=current_app.config['EVENTS_HEARTBEAT']),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Also release the subscription if the stream is closed before it starts
+    response.call_on_close(lambda: broker.unsubscribe(subscription))
+    return response
+
+# --- Health Routes ---
+
+def pool_stats(engine):
+    """Connection pool counters (QueuePool; other pools only report their status line)."""
+    pool = engine.pool
+    stats = {'status': pool.status()}
+    for name in ('size', 'checkedout', 'checkedin', 'overflow'):
+        counter = getattr(pool, name, None)
+        if callable(counter):
+            stats[name] = counter()
+    return stats
+
+@bp.route('/health', methods=['GET'])
+def health():
+    """
+    Liveness/readiness probe: database round trip (connection checkout + SELECT 1),
+    pool usage, replicas, /events subscribers and uptime.
+    Answers 503 when the primary database does not respond.
+    """
+    database = {'ok': True, 'error': None}
+    start = time.perf_counter()
+    try:
+        with db.engine.connect() as conn:
+            database['checkout_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            conn.execute(text('SELECT 1'))
+        database['round_trip_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    except Exception as e:
+        database.update(ok=False, error=str(e))
+
+    replicas = replica_router.status()
+    if not database['ok']:
+        status = 'error'
+    elif any(not replica['healthy'] for replica in replicas):
+        status = 'degraded'
+    else:
+        status = 'ok'
+
+    started_at = current_app.extensions['estok_started_at']
+    return jsonify({
+        'status': status,
+        'database': database,
+        'pool': pool_stats(db.engine),
+        'replicas': replicas,
+        'event_subscribers': event_broker.subscriber_count,
+        'cache': result_cache.stats() if current_app.config['CACHE_ENABLED'] else None,
+        'admission': admission.stats() if current_app.config['ADMISSION_ENABLED'] else None,
+        'report_jobs': report_jobs.stats(),
+        'started_at': datetime.fromtimestamp(started_at, timezone.utc).isoformat(),
+        'uptime_seconds': round(time.time() - started_at, 1),
+    }), 200 if database['ok'] else 503
+
+# --- Admin Routes ---
+
+@bp.route('/admin/profiling', methods=['GET'])
+@admin_required
+def admin_get_profiling():
+    """Profiler settings and the saved profiles (newest first)."""
+    return jsonify(dict(profiler.stats(), profiles=profiler.list_profiles()))
+
+@bp.route('/admin/profiling', methods=['PUT'])
+@admin_required
+def admin_update_profiling():
+    """
+    Switch request profiling.
+    Body: enabled (bool, optional), sample_rate (0..1, optional)
+    """
+    data = request.json or {}
+    if 'sample_rate' in data:
+        try:
+            sample_rate = float(data['sample_rate'])
+        except (TypeError, ValueError):
+            sample_rate = -1
+        if not 0 <= sample_rate <= 1:
+            return jsonify({"message": "'sample_rate' must be between 0 and 1"}), 400
+        profiler.sample_rate = sample_rate
+    if 'enabled' in data:
+        profiler.enabled = bool(data['enabled'])
+    current_app.logger.info(f"Request profiling {'enabled' if profiler.enabled else 'disabled'} "
+                            f"(sample rate {profiler.sample_rate})")
+    return jsonify(profiler.stats())
+
+@bp.route('/admin/profiling/<name>', methods=['GET'])
+@admin_required
+def admin_download_profile(name):
+    """
+    Download a saved profile (.prof, for snakeviz / pstats).
+    Query Params:
+        format: 'text' for a pstats summary instead of the file
+        sort: pstats sort key for the summary (default: cumulative)
+        limit: functions listed in the summary (default: 50)
+    """
+    path = profiler.path_for(name)
+    if path is None:
+        return jsonify({"message": "Profile not found"}), 404
+    if request.args.get('format') != 'text':
+        return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=name)
+
+    output = io.StringIO()
+    try:
+        stats = pstats.Stats(path, stream=output)
+        stats.sort_stats(request.args.get('sort', 'cumulative')).print_stats(request.args.get('limit', 50, type=int))
+    except KeyError:
+        return jsonify({"message": f"Invalid sort key: {request.args.get('sort')}"}), 400
+    return Response(output.getvalue(), mimetype='text/plain')
+
+@bp.route('/admin/memory', methods=['GET'])
+@admin_required
+def admin_get_memory():
+    """
+    Memory report: RSS now / peak / history, traced allocation, peak allocation and
+    response size per heavy route, in-process caches and saved snapshots.
+    Query Params:
+        history: RSS history points returned (default: 60; 0 for none)
+    """
+    report = memory_tracker.stats(history_points=request.args.get('history', 60, type=int))
+    compression_cache = current_app.extensions.get('compression_cache')
+    report['components'] = {
+        'result_cache_entries': result_cache.stats()['entries'],
+        'compression_cache_kb': round(compression_cache.size / 1024, 1) if compression_cache else None,
+        'report_jobs_kb': round(report_jobs.stats()['stored_bytes'] / 1024, 1),
+        'reorder_models_kb': reorder_suggestions.stats()['model_kb'],
+        'event_subscribers': event_broker.subscriber_count,
+    }
+    return jsonify(report)
+
+@bp.route('/admin/memory', methods=['PUT'])
+@admin_required
+def admin_update_memory():
+    """
+    Switch allocation tracing (tracemalloc).
+    Body: tracing (bool), frames (int, optional: stack depth kept per allocation, default 1)
+    """
+    data = request.json or {}
+    if 'tracing' not in data:
+        return jsonify({"message": "'tracing' is required"}), 400
+    if data['tracing']:
+        try:
+            frames = int(data.get('frames', 1))
+        except (TypeError, ValueError):
+            return jsonify({"message": "'frames' must be an integer"}), 400
+        memory_tracker.start_tracing(frames)
+    else:
+        memory_tracker.stop_tracing()
+    return jsonify({'tracing': memory_tracker.tracing})
+
+@bp.route('/admin/memory/snapshots', methods=['POST'])
+@admin_required
+def admin_take_memory_snapshot():
+    """Snapshot the traced allocations. Returns its id and largest allocation sites."""
+    try:
+        snapshot_id = memory_tracker.take_snapshot()
+    except RuntimeError as e:
+        return jsonify({"message": f"{e}: enable it with PUT /admin/memory"}), 409
+    return jsonify({'id': snapshot_id, 'top': memory_tracker.top(snapshot_id, limit=25)}), 201
+
+@bp.route('/admin/memory/snapshots/<int:snapshot_id>', methods=['GET'])
+@admin_required
+def admin_get_memory_snapshot(snapshot_id):
+    """
+    Largest allocation sites of a snapshot, or its growth since another one.
+    Query Params:
+        compare_to: id of an earlier snapshot (returns the diff)
+        group_by: 'lineno' (default), 'filename' or 'traceback'
+        limit: sites returned (default: 25)
+    """
+    group_by = request.args.get('group_by', 'lineno')
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        return jsonify({"message": "'group_by' must be lineno, filename or traceback"}), 400
+    limit = request.args.get('limit', 25, type=int)
+    base_id = request.args.get('compare_to', type=int)
+    try:
+        if base_id is None:
+            return jsonify({'id': snapshot_id, 'top': memory_tracker.top(snapshot_id, limit, group_by)})
+        return jsonify({'id': snapshot_id, 'compare_to': base_id,
+                        'diff': memory_tracker.diff(snapshot_id, base_id, limit, group_by)})
+    except KeyError as e:
+        return jsonify({"message": f"Snapshot {e.args[0]} not found"}), 404
+
+@bp.route('/')
 def hello():
     return "Hello from Estok API!"
 
+# --- App Factory ---
+
+def create_app(config=None):
+    """
+    Build the Flask app. Settings come from db_config.json, then the ESTOK_*
+    environment (.env), then `config` (dict). Nothing connects to the database
+    until it is first used.
+    """
+    from dotenv import load_dotenv
+    from fast_json import FastJSONProvider
+    from write_pipeline import GroupCommitWriter
+    from db_routing import ReplicaRouter
+    from event_broker import EventBroker
+    from cache import SharedCache
+    from admission import AdmissionController
+    from report_jobs import ReportJobs
+    from profiling import RequestProfiler
+    from memory_tracker import MemoryTracker
+    from reorder_engine import ReorderEngine
+
+    load_dotenv()
+
+    app = Flask(__name__)
+    app.extensions['estok_started_at'] = time.time()  # reported by /health (servers reset it when they start)
+    app.json = FastJSONProvider(app)
+    # Load DB URI from config file
+    app.config['SQLALCHEMY_DATABASE_URI'] = config_manager.get_db_uri()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    #     "connect_args": {"client_encoding": "utf8"}
+    # }
+    # Server tunables (e.g. ESTOK_COMPRESS_LEVEL=9) can be set via environment / .env
+    app.config.setdefault('SALES_BATCH_CHUNK_SIZE', 100)  # sales per transaction in /sales/batch
+    app.config.setdefault('SALES_BATCH_MAX', 5000)        # sales accepted per request
+    app.config.setdefault('PRODUCTS_BATCH_MAX', 1000)     # updates accepted per PATCH /products/batch
+    app.config.setdefault('GROUP_COMMIT_ENABLED', False)   # coalesce concurrent POST /sales into shared commits
+    app.config.setdefault('GROUP_COMMIT_WINDOW_MS', 5)
+    app.config.setdefault('GROUP_COMMIT_MAX_BATCH', 50)
+    app.config.setdefault('GROUP_COMMIT_TIMEOUT', 30)     # seconds a request waits for its commit
+    app.config.setdefault('PARTITIONED_SALES', False)      # set after running partition_tool.py migrate
+    app.config.setdefault('PARTITION_MONTHS_AHEAD', 3)
+    app.config.setdefault('EVENTS_BUFFER_SIZE', 64)        # pending events kept per /events subscriber
+    app.config.setdefault('EVENTS_HEARTBEAT', 15)          # seconds between keep-alive comments
+    app.config.setdefault('EVENTS_MAX_SUBSCRIBERS', 256)   # one server thread each (not a worker)
+    app.config.setdefault('REPORT_ROLLUP_ENABLED', False)  # /reports/aggregate reads vendas_resumo_hora
+    app.config.setdefault('REPORT_ROLLUP_REFRESH_SECONDS', 300)  # background refresh interval; 0: only via server_cli maintenance
+    app.config.setdefault('SEARCH_MODE', 'ilike')          # default /products search: 'ilike' or 'similar' (pg_trgm + unaccent)
+    app.config.setdefault('CACHE_ENABLED', False)          # result cache for searches, payment methods and dashboards
+    app.config.setdefault('CACHE_TTL', 300)                # seconds; entries are also evicted on every related write
+    app.config.setdefault('CACHE_MAX_ENTRIES', 2048)
+    # Admission lanes (see Admission Control); e.g. ESTOK_ADMISSION_LANES__heavy__limit=4
+    app.config.setdefault('ADMISSION_ENABLED', False)
+    app.config.setdefault('ADMISSION_LANES', {
+        # limit: concurrent requests, queue: requests allowed to wait, timeout: max wait (s)
+        # Sized for serve --workers 16: every lane's limit + queue (12) fits in
+        # the workers, so checkout's 7 are really reserved; idle connections give
+        # their worker up to waiting requests and /events uses none
+        'checkout': {'limit': 6, 'queue': 1, 'timeout': 10, 'retry_after': 1},
+        'heavy': {'limit': 2, 'queue': 0, 'timeout': 5, 'retry_after': 10},
+        'default': {'limit': 2, 'queue': 1, 'timeout': 5, 'retry_after': 2},
+    })
+    app.config.setdefault('ADMISSION_ROUTES', {
+        'checkout': ['estok.get_products', 'estok.create_sale', 'estok.get_payment_methods'],
+        'heavy': ['estok.get_all_products', 'estok.get_reports_*', 'estok.create_sales_batch'],
+    })
+    app.config.setdefault('ADMISSION_EXEMPT', ['estok.stream_events', 'estok.health', 'estok.hello', 'estok.admin_*'])
+    app.config.setdefault('REPORT_JOBS_WORKERS', 2)       # reports computed at the same time by /reports/jobs
+    app.config.setdefault('REPORT_JOBS_TTL', 300)         # seconds a finished result is kept (and reused)
+    app.config.setdefault('REPORT_JOBS_MAX', 64)          # stored jobs
+    app.config.setdefault('REPORT_JOBS_MAX_BYTES', 64 * 1024 * 1024)
+    app.config.setdefault('WARMUP_ENABLED', False)         # warm the pool, statements and caches before serving (db_tools.warm_up)
+    app.config.setdefault('WARMUP_CONNECTIONS', 0)         # connections opened by the warm-up (0 = the pool size)
+    app.config.setdefault('WARMUP_TABLES', ['produtos', 'formas_pagamento'])
+    app.config.setdefault('ADMIN_TOKEN', '')               # enables /admin/* (X-Admin-Token header)
+    app.config.setdefault('PROFILING_ENABLED', False)      # profile sampled requests (see Request Profiling)
+    app.config.setdefault('PROFILING_SAMPLE_RATE', 0.01)
+    app.config.setdefault('PROFILING_DIR', '')             # default: 'profiles' next to the log files
+    app.config.setdefault('PROFILING_MAX_FILES', 200)
+    app.config.setdefault('MEMORY_SAMPLE_SECONDS', 60)     # RSS sampling interval
+    app.config.setdefault('MEMORY_HISTORY', 1440)          # RSS samples kept (24 h at 60 s)
+    app.config.setdefault('MEMORY_TRACING', False)         # start tracemalloc with the app (slower; for leak hunting)
+    app.config.setdefault('MEMORY_TRACKED_ENDPOINTS', [
+        'estok.get_all_products', 'estok.get_reports_*', 'estok.get_dashboard_*', 'estok.create_sales_batch',
+    ])
+    # Purchase suggestions (see reorder_engine.py); each can be overridden per request
+    app.config.setdefault('REORDER_HISTORY_DAYS', 90)
+    app.config.setdefault('REORDER_SMOOTHING', 0.1)       # weight of the latest day in the demand average
+    app.config.setdefault('REORDER_LEAD_TIME_DAYS', 7)
+    app.config.setdefault('REORDER_REVIEW_DAYS', 7)
+    app.config.setdefault('REORDER_SERVICE_LEVEL', 0.95)
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT', 30)       # seconds a write waits for the database lock
+    app.config.setdefault('SQLITE_SYNCHRONOUS', 'NORMAL')  # FULL: also survive power loss right after a commit
+    app.config.setdefault('SQLITE_BEGIN', 'BEGIN')         # reads: deferred, never wait for the write lock
+    app.config.setdefault('SQLITE_WRITE_BEGIN', 'BEGIN IMMEDIATE')  # writes take the lock up front (begin_write)
+    app.config.setdefault('SQLITE_CACHE_MB', 64)           # page cache per connection
+    app.config.setdefault('SQLITE_MMAP_MB', 256)
+    app.config.from_prefixed_env('ESTOK')
+    if config:
+        app.config.update(config)
+
+    sqlite_backend.init_app(app)  # before db.init_app, which creates the engine
+    db.init_app(app)
+    if sqlite_backend.is_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        with app.app_context():
+            sqlite_backend.configure_engine(db.engine, app.config)
+    compression.init_app(app)
+
+    replica_uris, replica_max_lag = config_manager.get_replica_settings()
+    app.extensions['estok_replica_router'] = ReplicaRouter(replica_uris, max_lag=replica_max_lag)
+    # Change events for /events (published after each commit)
+    app.extensions['estok_event_broker'] = EventBroker(buffer_size=app.config['EVENTS_BUFFER_SIZE'])
+    # Result cache, invalidated across workers with LISTEN/NOTIFY (see Result Cache)
+    app.extensions['estok_cache'] = SharedCache(
+        max_entries=app.config['CACHE_MAX_ENTRIES'], ttl=app.config['CACHE_TTL']
+    )
+    app.extensions['estok_admission'] = AdmissionController(
+        app.config['ADMISSION_LANES'], app.config['ADMISSION_ROUTES'], app.config['ADMISSION_EXEMPT']
+    )
+    app.extensions['estok_report_jobs'] = ReportJobs(
+        app,
+        workers=app.config['REPORT_JOBS_WORKERS'],
+        max_jobs=app.config['REPORT_JOBS_MAX'],
+        max_bytes=app.config['REPORT_JOBS_MAX_BYTES'],
+        ttl=app.config['REPORT_JOBS_TTL']
+    )
+    app.extensions['estok_profiler'] = RequestProfiler(
+        app.config['PROFILING_DIR'] or os.path.join(config_manager.get_log_dir(), 'profiles'),
+        enabled=app.config['PROFILING_ENABLED'],
+        sample_rate=app.config['PROFILING_SAMPLE_RATE'],
+        max_files=app.config['PROFILING_MAX_FILES']
+    )
+    app.extensions['estok_memory'] = MemoryTracker(
+        app.config['MEMORY_TRACKED_ENDPOINTS'],
+        interval=app.config['MEMORY_SAMPLE_SECONDS'],
+        history=app.config['MEMORY_HISTORY']
+    )
+    if app.config['MEMORY_TRACING']:
+        app.extensions['estok_memory'].start_tracing()
+    app.extensions['estok_reorder'] = ReorderEngine(app.config)
+    app.extensions['estok_sales_writer'] = GroupCommitWriter(
+        app,
+        _commit_sales_group,
+        window_ms=app.config['GROUP_COMMIT_WINDOW_MS'],
+        max_batch=app.config['GROUP_COMMIT_MAX_BATCH']
+    )
+
+    app.register_blueprint(bp)
+    return app
+
+_default_app_lock = threading.Lock()
+
+def __getattr__(name):
+    """Backward compatibility: `from main import app` builds a default app on first use."""
+    global app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _default_app_lock:
+        if 'app' not in globals():
+            app = create_app()
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,263 @@
+import gc
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from datetime import datetime, timezone
+from fnmatch import fnmatchcase
+
+logger = logging.getLogger('estok.memory')
+
+# Frames from these files are left out of snapshots (they are the measurement itself)
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def current_rss():
+    """Resident set size of this process in bytes (None if it cannot be read)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    if sys.platform.startswith('linux'):
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            return None
+    if os.name == 'nt':
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        get_info = ctypes.windll.psapi.GetProcessMemoryInfo
+        get_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+        if get_info(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+    return None
+
+
+class RouteMemory:
+    """Allocation peaks and response sizes measured for one endpoint."""
+
+    def __init__(self):
+        self.count = 0
+        self.last_peak = 0
+        self.max_peak = 0
+        self.total_peak = 0
+        self.max_response_bytes = 0
+
+    def record(self, peak, response_bytes):
+        self.count += 1
+        self.last_peak = peak
+        self.max_peak = max(self.max_peak, peak)
+        self.total_peak += peak
+        if response_bytes:
+            self.max_response_bytes = max(self.max_response_bytes, response_bytes)
+
+    def stats(self):
+        return {
+            'count': self.count,
+            'last_peak_kb': round(self.last_peak / 1024, 1),
+            'max_peak_kb': round(self.max_peak / 1024, 1),
+            'avg_peak_kb': round(self.total_peak / self.count / 1024, 1) if self.count else 0.0,
+            'max_response_kb': round(self.max_response_bytes / 1024, 1),
+        }
+
+
+class MemoryTracker:
+    """
+    Process memory over time, for a server that runs for weeks:
+
+    - RSS is sampled every `interval` seconds into a ring of `history` points
+      (started on the first request);
+    - while allocation tracing (tracemalloc) is on, requests to the `endpoints`
+      patterns (the heavy routes) record their peak Python allocation. Python only
+      keeps one process-wide peak, so one request is measured at a time and the
+      figure includes whatever other threads allocated meanwhile;
+    - snapshots of the traced allocations (up to `max_snapshots`, oldest dropped)
+      can be listed by line and diffed, to pin growth to code.
+
+    Tracing slows allocation-heavy code down noticeably: it is off by default
+    and meant to be switched on while investigating.
+    """
+
+    def __init__(self, endpoints=(), interval=60, history=1440, max_snapshots=5):
+        self.endpoints = list(endpoints)
+        self.interval = interval
+        self.samples = deque(maxlen=history)  # (unix time, rss bytes)
+        self.max_snapshots = max_snapshots
+        self.routes = {}
+        self._snapshots = {}  # id -> (taken_at, snapshot, traced bytes)
+        self._snapshot_ids = itertools.count(1)
+        self._tracked = {}
+        self._measuring = threading.Lock()
+        self._baseline = 0
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    # --- RSS ---
+
+    def ensure_sampling(self):
+        if self._sampler is not None:
+            return
+        with self._lock:
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_forever, name='memory-sampler', daemon=True)
+                self._sampler.start()
+
+    def _sample_forever(self):
+        while True:
+            self.sample()
+            time.sleep(self.interval)
+
+    def sample(self):
+        rss = current_rss()
+        if rss is not None:
+            self.samples.append((time.time(), rss))
+        return rss
+
+    # --- Tracing ---
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def start_tracing(self, frames=1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, int(frames)))
+            logger.info(f"Allocation tracing started ({frames} frame(s))")
+
+    def stop_tracing(self):
+        """Stop tracing; saved snapshots are dropped (they belong to the trace)."""
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info("Allocation tracing stopped")
+        with self._lock:
+            self._snapshots.clear()
+
+    def tracks(self, endpoint):
+        try:
+            return self._tracked[endpoint]
+        except KeyError:
+            tracked = any(fnmatchcase(endpoint or '', pattern) for pattern in self.endpoints)
+            self._tracked[endpoint] = tracked
+            return tracked
+
+    def begin_request(self):
+        """Start measuring a request's peak allocation; False if another request is being measured."""
+        if not tracemalloc.is_tracing() or not self._measuring.acquire(blocking=False):
+            return False
+        tracemalloc.reset_peak()
+        self._baseline = tracemalloc.get_traced_memory()[0]
+        return True
+
+    def end_request(self, endpoint, response_bytes=None):
+        try:
+            if tracemalloc.is_tracing():
+                peak = max(0, tracemalloc.get_traced_memory()[1] - self._baseline)
+                with self._lock:
+                    self.routes.setdefault(endpoint, RouteMemory()).record(peak, response_bytes)
+        finally:
+            self._measuring.release()
+
+    # --- Snapshots ---
+
+    def take_snapshot(self):
+        """Snapshot the traced allocations; returns its id (tracing must be on)."""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("Allocation tracing is off")
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        size = sum(trace.size for trace in snapshot.traces)
+        with self._lock:
+            snapshot_id = next(self._snapshot_ids)
+            self._snapshots[snapshot_id] = (datetime.now(timezone.utc), snapshot, size)
+            while len(self._snapshots) > self.max_snapshots:
+                del self._snapshots[min(self._snapshots)]
+        return snapshot_id
+
+    def snapshots(self):
+        with self._lock:
+            items = sorted(self._snapshots.items())
+        return [{'id': snapshot_id, 'taken_at': taken_at, 'traced_mb': _mb(size)}
+                for snapshot_id, (taken_at, snapshot, size) in items]
+
+    def _snapshot(self, snapshot_id):
+        with self._lock:
+            entry = self._snapshots.get(snapshot_id)
+        if entry is None:
+            raise KeyError(snapshot_id)
+        return entry[1]
+
+    def top(self, snapshot_id, limit=25, group_by='lineno'):
+        """Largest allocation sites of a snapshot."""
+        stats = self._snapshot(snapshot_id).statistics(group_by)
+        return [{'where': _where(stat.traceback), 'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+                for stat in stats[:limit]]
+
+    def diff(self, snapshot_id, base_id, limit=25, group_by='lineno'):
+        """Allocation sites that grew the most from snapshot `base_id` to `snapshot_id`."""
+        stats = self._snapshot(snapshot_id).compare_to(self._snapshot(base_id), group_by)
+        return [{'where': _where(stat.traceback), 'size_diff_kb': round(stat.size_diff / 1024, 1),
+                 'size_kb': round(stat.size / 1024, 1), 'count_diff': stat.count_diff}
+                for stat in stats[:limit]]
+
+    # --- Report ---
+
+    def summary(self):
+        """RSS now and at its peak, and the traced allocation (cheap: for frequent polling)."""
+        rss = self.samples[-1][1] if self.samples else current_rss()
+        peak = max((value for _, value in list(self.samples)), default=rss)
+        traced = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else None
+        return {
+            'rss_mb': _mb(rss),
+            'rss_peak_mb': _mb(peak),
+            'tracing': traced is not None,
+            'traced_mb': _mb(traced[0]) if traced else None,
+            'traced_peak_mb': _mb(traced[1]) if traced else None,
+        }
+
+    def route_stats(self):
+        with self._lock:
+            return {endpoint: route.stats() for endpoint, route in self.routes.items()}
+
+    def stats(self, history_points=None):
+        """Full report; `history_points` limits the RSS history to the latest points."""
+        history = list(self.samples)
+        if history_points is not None:
+            history = history[-history_points:] if history_points > 0 else []
+        report = self.summary()
+        report.update(
+            history=[{'at': datetime.fromtimestamp(at, timezone.utc), 'rss_mb': _mb(value)} for at, value in history],
+            gc_objects=len(gc.get_objects()),
+            routes=self.route_stats(),
+            snapshots=self.snapshots(),
+        )
+        return report
+
+
+def _mb(value):
+    return round(value / (1024 * 1024), 1) if value is not None else None
+
+
+def _where(traceback):
+    """'file:line' of each frame (innermost first); just 'file' when grouped by filename."""
+    return ' <- '.join(f"{frame.filename}:{frame.lineno}" if frame.lineno else frame.filename
+                       for frame in traceback)
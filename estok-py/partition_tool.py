@@ -0,0 +1,351 @@
+"""
+Monthly partitioning tool for the sales history tables.
+
+Usage:
+    python partition_tool.py migrate [--months-ahead 3] [--drop-legacy]
+    python partition_tool.py ensure [--months-ahead 3]
+    python partition_tool.py detach --before YYYY-MM [--drop]
+    python partition_tool.py status
+
+`migrate` converts vendas, itens_venda and movimentacoes_estoque into tables
+partitioned by month on data_venda / data_movimentacao, copying the existing
+rows in a single transaction. The old heap tables are kept as *_legado unless
+--drop-legacy is given. After migrating, set ESTOK_PARTITIONED_SALES=true so
+the API adds the partition key to its joins and keeps future months created.
+"""
+import argparse
+import re
+import sys
+from datetime import date
+
+import psycopg2
+
+import config_manager
+
+# table -> (partition key column, CREATE TABLE body)
+PARTITIONED_TABLES = {
+    'vendas': ('data_venda', """
+        id INTEGER NOT NULL DEFAULT nextval('public.vendas_id_seq'),
+        data_venda TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        valor_total NUMERIC(10,2),
+        id_forma_pagamento INTEGER REFERENCES public.formas_pagamento(id),
+        PRIMARY KEY (id, data_venda)
+    """),
+    'itens_venda': ('data_venda', """
+        id INTEGER NOT NULL DEFAULT nextval('public.itens_venda_id_seq'),
+        id_venda INTEGER,
+        id_produto INTEGER REFERENCES public.produtos(id),
+        quantidade NUMERIC(10,3),
+        preco_custo NUMERIC(10,2),
+        valor_unitario NUMERIC(10,2),
+        valor_total NUMERIC(10,2),
+        data_venda TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        PRIMARY KEY (id, data_venda)
+    """),
+    'movimentacoes_estoque': ('data_movimentacao', """
+        id INTEGER NOT NULL DEFAULT nextval('public.movimentacoes_estoque_id_seq'),
+        id_produto INTEGER REFERENCES public.produtos(id),
+        tipo VARCHAR(20),
+        quantidade_anterior NUMERIC(10,3),
+        quantidade_movimentada NUMERIC(10,3),
+        quantidade_nova NUMERIC(10,3),
+        data_movimentacao TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        id_venda INTEGER,
+        observacao TEXT,
+        PRIMARY KEY (id, data_movimentacao)
+    """),
+}
+
+COPY_SQL = {
+    'vendas': """
+        INSERT INTO public.vendas (id, data_venda, valor_total, id_forma_pagamento)
+        SELECT id, COALESCE(data_venda, '1970-01-01'), valor_total, id_forma_pagamento
+        FROM public.vendas_legado
+    """,
+    'itens_venda': """
+        INSERT INTO public.itens_venda (id, id_venda, id_produto, quantidade, preco_custo, valor_unitario, valor_total, data_venda)
+        SELECT i.id, i.id_venda, i.id_produto, i.quantidade, i.preco_custo, i.valor_unitario, i.valor_total,
+               COALESCE(i.data_venda, v.data_venda, '1970-01-01')
+        FROM public.itens_venda_legado i
+        LEFT JOIN public.vendas_legado v ON v.id = i.id_venda
+    """,
+    'movimentacoes_estoque': """
+        INSERT INTO public.movimentacoes_estoque (id, id_produto, tipo, quantidade_anterior, quantidade_movimentada,
+                                                  quantidade_nova, data_movimentacao, id_venda, observacao)
+        SELECT id, id_produto, tipo, quantidade_anterior, quantidade_movimentada,
+               quantidade_nova, COALESCE(data_movimentacao, '1970-01-01'), id_venda, observacao
+        FROM public.movimentacoes_estoque_legado
+    """,
+}
+
+INDEX_SQL = [
+    "CREATE INDEX IF NOT EXISTS index_vendas_data_venda ON public.vendas (data_venda)",
+    "CREATE INDEX IF NOT EXISTS index_itens_venda_id_venda ON public.itens_venda (id_venda)",
+    "CREATE INDEX IF NOT EXISTS index_movimentacoes_produto_data ON public.movimentacoes_estoque (id_produto, data_movimentacao, id) INCLUDE (quantidade_anterior, quantidade_nova)",
+    "CREATE INDEX IF NOT EXISTS index_itens_venda_data_venda ON public.itens_venda (data_venda) INCLUDE (id_produto, quantidade, valor_total, preco_custo)",
+]
+
+# Server-side helpers, also called by the API (ESTOK_PARTITIONED_SALES) to keep future months created
+PARTITION_FUNCTIONS_SQL = """
+CREATE OR REPLACE FUNCTION public.estok_criar_particao_mensal(tabela text, mes date)
+RETURNS boolean LANGUAGE plpgsql AS $$
+DECLARE
+    inicio date := date_trunc('month', mes)::date;
+    fim date := (date_trunc('month', mes) + interval '1 month')::date;
+    nome text := format('%s_p%s', tabela, to_char(inicio, 'YYYY_MM'));
+BEGIN
+    IF to_regclass('public.' || nome) IS NOT NULL THEN
+        RETURN false;
+    END IF;
+    EXECUTE format('CREATE TABLE public.%I PARTITION OF public.%I FOR VALUES FROM (%L) TO (%L)',
+                   nome, tabela, inicio, fim);
+    RETURN true;
+END $$;
+
+CREATE OR REPLACE FUNCTION public.estok_garantir_particoes(meses_adiante integer DEFAULT 3)
+RETURNS integer LANGUAGE plpgsql AS $$
+DECLARE
+    tabela text;
+    m integer;
+    criadas integer := 0;
+BEGIN
+    FOREACH tabela IN ARRAY ARRAY['vendas', 'itens_venda', 'movimentacoes_estoque'] LOOP
+        IF EXISTS (
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public' AND c.relname = tabela
+        ) THEN
+            FOR m IN 0..meses_adiante LOOP
+                IF public.estok_criar_particao_mensal(tabela, (date_trunc('month', now()) + make_interval(months => m))::date) THEN
+                    criadas := criadas + 1;
+                END IF;
+            END LOOP;
+        END IF;
+    END LOOP;
+    RETURN criadas;
+END $$;
+"""
+
+PARTITION_NAME = re.compile(r'^(?P<table>\w+)_p(?P<year>\d{4})_(?P<month>\d{2})$')
+
+
+def connect():
+    return psycopg2.connect(config_manager.get_db_uri())
+
+
+def is_partitioned(cur, table):
+    cur.execute("""
+        SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relname = %s
+    """, (table,))
+    row = cur.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def month_range(first, last):
+    """Yield the first day of each month from first to last (inclusive)."""
+    current = date(first.year, first.month, 1)
+    while current <= last:
+        yield current
+        current = date(current.year + current.month // 12, current.month % 12 + 1, 1)
+
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _rename_legacy(cur, table):
+    legacy = f"{table}_legado"
+    cur.execute(f"ALTER TABLE public.{table} RENAME TO {legacy}")
+    cur.execute(f"ALTER TABLE public.{legacy} ALTER COLUMN id DROP DEFAULT")
+    cur.execute(f"ALTER SEQUENCE public.{table}_id_seq OWNED BY NONE")
+    # Free index/constraint names (e.g. vendas_pkey) for the new partitioned table
+    cur.execute("SELECT indexname FROM pg_indexes WHERE schemaname = 'public' AND tablename = %s", (legacy,))
+    for (index_name,) in cur.fetchall():
+        cur.execute(f'ALTER INDEX public."{index_name}" RENAME TO "{index_name[:55]}_legado"')
+    # Foreign keys pointing at the old table cannot follow it into a partitioned table
+    cur.execute("""
+        SELECT conrelid::regclass::text, conname FROM pg_constraint
+        WHERE contype = 'f' AND confrelid = %s::regclass
+    """, (f"public.{legacy}",))
+    for owner, constraint in cur.fetchall():
+        cur.execute(f'ALTER TABLE {owner} DROP CONSTRAINT "{constraint}"')
+
+
+def migrate(months_ahead, drop_legacy):
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        cur.execute(PARTITION_FUNCTIONS_SQL)
+
+        pending = [t for t in PARTITIONED_TABLES if not is_partitioned(cur, t)]
+        if not pending:
+            print("All tables are already partitioned.")
+            conn.commit()
+            return
+
+        cur.execute("ALTER TABLE public.itens_venda ADD COLUMN IF NOT EXISTS data_venda TIMESTAMP WITHOUT TIME ZONE")
+        for table in pending:
+            print(f"Renaming {table} -> {table}_legado...")
+            _rename_legacy(cur, table)
+
+        today = date.today()
+        for table in pending:
+            key, body = PARTITIONED_TABLES[table]
+            print(f"Creating partitioned table {table} (by month on {key})...")
+            cur.execute(f"CREATE TABLE public.{table} ({body}) PARTITION BY RANGE ({key})")
+            cur.execute(f"ALTER SEQUENCE public.{table}_id_seq OWNED BY public.{table}.id")
+            cur.execute(f"CREATE TABLE public.{table}_default PARTITION OF public.{table} DEFAULT")
+
+            cur.execute(f"SELECT min({key}) FROM public.{table}_legado WHERE {key} > '1970-01-01'")
+            oldest = cur.fetchone()[0]
+            first = oldest.date() if oldest else today
+            for month in month_range(first, add_months(today, months_ahead)):
+                cur.execute("SELECT public.estok_criar_particao_mensal(%s, %s)", (table, month))
+
+        for table in pending:
+            print(f"Copying rows into {table}...")
+            cur.execute(COPY_SQL[table])
+            print(f"  {cur.rowcount} rows.")
+
+        for statement in INDEX_SQL:
+            cur.execute(statement)
+
+        if drop_legacy:
+            for table in pending:
+                cur.execute(f"DROP TABLE public.{table}_legado")
+
+        conn.commit()
+        print("Migration committed.")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    # Refresh planner statistics for the new tables
+    conn = connect()
+    conn.autocommit = True
+    try:
+        cur = conn.cursor()
+        for table in PARTITIONED_TABLES:
+            cur.execute(f"ANALYZE public.{table}")
+    finally:
+        conn.close()
+    print("Done. Set ESTOK_PARTITIONED_SALES=true for the API to use partition pruning.")
+
+
+def ensure(months_ahead):
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        cur.execute(PARTITION_FUNCTIONS_SQL)
+        cur.execute("SELECT public.estok_garantir_particoes(%s)", (months_ahead,))
+        created = cur.fetchone()[0]
+        conn.commit()
+        print(f"{created} partition(s) created.")
+    finally:
+        conn.close()
+
+
+def list_partitions(cur, table):
+    """Return [(name, first_day_of_month)] for the monthly partitions of table."""
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+        ORDER BY c.relname
+    """, (f"public.{table}",))
+    partitions = []
+    for (name,) in cur.fetchall():
+        match = PARTITION_NAME.match(name)
+        if match and match.group('table') == table:
+            partitions.append((name, date(int(match.group('year')), int(match.group('month')), 1)))
+    return partitions
+
+
+def detach(before, drop):
+    """Detach (and optionally drop) monthly partitions older than `before` (first day of a month)."""
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        for table in PARTITIONED_TABLES:
+            if not is_partitioned(cur, table):
+                continue
+            for name, month in list_partitions(cur, table):
+                if month >= before:
+                    continue
+                cur.execute(f"ALTER TABLE public.{table} DETACH PARTITION public.{name}")
+                if drop:
+                    cur.execute(f"DROP TABLE public.{name}")
+                print(f"{'Dropped' if drop else 'Detached'} {name}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def status():
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        for table in PARTITIONED_TABLES:
+            if not is_partitioned(cur, table):
+                print(f"{table}: not partitioned")
+                continue
+            cur.execute("""
+                SELECT c.relname, c.reltuples::bigint FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = %s::regclass ORDER BY c.relname
+            """, (f"public.{table}",))
+            print(f"{table}:")
+            for name, rows in cur.fetchall():
+                print(f"  {name}: ~{max(rows, 0)} rows")
+    finally:
+        conn.close()
+
+
+def parse_month(value):
+    try:
+        year, month = value.split('-')
+        return date(int(year), int(month), 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected YYYY-MM")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estok monthly partitioning tool")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('migrate', help="convert sales/kardex tables to monthly partitions")
+    p.add_argument('--months-ahead', type=int, default=3)
+    p.add_argument('--drop-legacy', action='store_true')
+
+    p = sub.add_parser('ensure', help="create partitions for the coming months")
+    p.add_argument('--months-ahead', type=int, default=3)
+
+    p = sub.add_parser('detach', help="detach partitions older than a month")
+    p.add_argument('--before', type=parse_month, required=True)
+    p.add_argument('--drop', action='store_true')
+
+    sub.add_parser('status', help="list partitions")
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == 'migrate':
+            migrate(args.months_ahead, args.drop_legacy)
+        elif args.command == 'ensure':
+            ensure(args.months_ahead)
+        elif args.command == 'detach':
+            detach(args.before, args.drop)
+        else:
+            status()
+    except Exception as e:
+        print(f"ERROR: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,262 @@
+import logging
+import queue
+import select
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import StreamRequestHandler
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from server_logging import ACCESS_LOGGER
+
+
+class AccessLogRequestHandler(WSGIRequestHandler):
+    """Werkzeug request handler that writes access lines as structured 'estok.access' records."""
+
+    _access_logger = logging.getLogger(ACCESS_LOGGER)
+
+    def parse_request(self):
+        # Called once the request line arrived (idle keep-alive time is not counted)
+        self._started = time.perf_counter()
+        return super().parse_request()
+
+    def log_request(self, code='-', size='-'):
+        # Called when the status line is sent: duration is the time to first byte
+        started = getattr(self, '_started', None)
+        path, _, query = getattr(self, 'path', '').partition('?')
+        status = int(code) if isinstance(code, int) else None  # also HTTPStatus (send_error)
+        self._access_logger.info('%s %s %s', getattr(self, 'command', '-'), path, status or code, extra={
+            'client': self.address_string(),
+            'method': getattr(self, 'command', None),
+            'path': path,
+            'query': query or None,
+            'status': status,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 2) if started else None,
+        })
+
+
+class PooledRequestHandler(AccessLogRequestHandler):
+    detached = False
+
+    def setup(self):
+        # A connection holds its worker while idle, so it must time out
+        self.timeout = self.server.keep_alive_timeout
+        super().setup()
+
+    def handle_one_request(self):
+        if not self._wait_for_request():
+            self.close_connection = True
+            return
+        super().handle_one_request()
+        if self.server.draining:
+            self.close_connection = True
+
+    def _wait_for_request(self):
+        """
+        Wait for the next request line on this connection (a keep-alive one, or
+        one opened ahead of its request), up to keep_alive_timeout. Returns
+        False (close it) as soon as the server is draining or another
+        connection waits for the worker, so an idle client never keeps a
+        worker from a waiting one. (Pipelined requests are not expected: the
+        clients wait for each response.)
+        """
+        deadline = time.monotonic() + self.server.keep_alive_timeout
+        while True:
+            remaining = max(deadline - time.monotonic(), 0)
+            readable, _, _ = select.select([self.connection], [], [], min(remaining, self.server.idle_poll_interval))
+            if readable:
+                return True
+            if self.server.draining or time.monotonic() >= deadline or self.server.claim_idle_worker():
+                return False
+
+    def run_wsgi(self):
+        if self.path.partition('?')[0] not in self.server.stream_paths:
+            return super().run_wsgi()
+        # A long-lived response (e.g. /events) gets a thread of its own and the
+        # worker goes back to the pool; the connection closes when it ends
+        self.detached = True
+        self.close_connection = True
+        self.server.detach(self.request)
+        threading.Thread(target=self._run_stream, name='estok-stream', daemon=True).start()
+
+    def _run_stream(self):
+        try:
+            super().run_wsgi()
+        except (ConnectionError, TimeoutError):
+            pass
+        except Exception:
+            self.server.handle_error(self.request, self.client_address)
+        finally:
+            StreamRequestHandler.finish(self)
+            self.server.stream_finished(self.request)
+
+    def finish(self):
+        if not self.detached:  # a detached stream finishes on its own thread
+            super().finish()
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    Werkzeug WSGI server that handles connections on a fixed pool of worker
+    threads instead of one new thread per connection (make_server(threaded=True)).
+
+    The pool bounds concurrency, so it can be sized together with the database
+    connection pool. At most `max_pending` accepted connections (default:
+    `workers`) wait for a free worker; beyond that the accept thread hands the
+    connection to a rejecting thread, which answers 503 with Retry-After and
+    closes it, so an overload never queues unbounded work, takes a worker to be
+    refused, or slows down accepting. An idle connection (not sending its
+    request yet, or keep-alive) keeps its worker only while no other connection
+    is waiting for one; it is closed otherwise. drain() stops accepting and lets
+    the in-flight requests finish, for graceful shutdowns.
+
+    Requests for `stream_paths` (long-lived responses such as /events) are
+    handed to a thread of their own once their request line is read, so an
+    open stream does not hold a worker; the application caps how many it
+    accepts, and they end when the application closes them.
+    """
+
+    multithread = True
+    request_queue_size = 128
+    idle_poll_interval = 0.1  # how soon an idle connection notices others waiting
+    overload_body = b'{"message": "Server busy, please retry shortly"}'
+    overload_response = (b'HTTP/1.1 503 Service Unavailable\r\n'
+                         b'Content-Type: application/json\r\n'
+                         b'Retry-After: 1\r\n'
+                         b'Connection: close\r\n'
+                         b'Content-Length: %d\r\n\r\n' % len(overload_body)) + overload_body
+
+    def __init__(self, host, port, app, workers=16, keep_alive_timeout=15, max_pending=None,
+                 stream_paths=(), handler=PooledRequestHandler, **kwargs):
+        super().__init__(host, port, app, handler=handler, **kwargs)
+        self.workers = workers
+        self.max_pending = workers if max_pending is None else max_pending
+        self.keep_alive_timeout = keep_alive_timeout
+        self.stream_paths = frozenset(stream_paths)
+        self.draining = False
+        self.rejected = 0
+        self.queued = 0  # accepted connections waiting for a worker
+        self.streams = 0  # open detached streams
+        self._rejected_at = None
+        self._yielding = 0  # idle workers closing to make room for queued connections
+        self._detached = set()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='estok-worker')
+        self._slots = threading.Semaphore(workers + self.max_pending)
+        self._in_flight = 0
+        self._idle = threading.Condition()
+        self._rejections = queue.Queue(maxsize=self.request_queue_size)
+        threading.Thread(target=self._answer_rejections, name='estok-reject', daemon=True).start()
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def claim_idle_worker(self):
+        """
+        Asked by idle connections: True if this one should give its
+        worker up, once per connection waiting for a worker (or to any of them
+        while connections were refused in the last second).
+        """
+        with self._idle:
+            if self.queued > self._yielding:
+                self._yielding += 1
+                return True
+        rejected_at = self._rejected_at
+        return rejected_at is not None and time.monotonic() - rejected_at < 1
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            self._reject(request)
+            return
+        with self._idle:
+            self._in_flight += 1
+            self.queued += 1
+        future = self._executor.submit(self._process, request, client_address)
+        # Connections still queued when drain() gives up are cancelled: close them
+        future.add_done_callback(lambda f: f.cancelled() and self._cancelled(request))
+
+    def _cancelled(self, request):
+        with self._idle:
+            self.queued -= 1
+            self._yielding = min(self._yielding, self.queued)
+        self._release(request)
+
+    def _reject(self, request):
+        # Runs on the accept thread: only hand the connection over (or drop it
+        # if the rejecting thread is that far behind)
+        self.rejected += 1
+        self._rejected_at = time.monotonic()
+        try:
+            self._rejections.put_nowait(request)
+        except queue.Full:
+            self.shutdown_request(request)
+
+    def _answer_rejections(self):
+        while True:
+            request = self._rejections.get()
+            if request is None:
+                return
+            self._answer_overload(request)
+
+    def _answer_overload(self, request):
+        try:
+            request.settimeout(0.05)
+            request.sendall(self.overload_response)
+            # Read the request head if it already arrived: closing with unread
+            # data makes the client see a reset instead of the 503
+            request.recv(65536)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def _process(self, request, client_address):
+        with self._idle:
+            self.queued -= 1
+            self._yielding = min(self._yielding, self.queued)
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self._release(request)
+
+    def detach(self, request):
+        """Called by the worker handing `request` to a stream thread: its connection stays open."""
+        with self._idle:
+            self._detached.add(request)
+            self.streams += 1
+
+    def stream_finished(self, request):
+        self.shutdown_request(request)
+        with self._idle:
+            self.streams -= 1
+
+    def _release(self, request):
+        with self._idle:
+            detached = request in self._detached
+            self._detached.discard(request)
+        if not detached:
+            self.shutdown_request(request)
+        self._slots.release()
+        with self._idle:
+            self._in_flight -= 1
+            self._idle.notify_all()
+
+    def drain(self, timeout=30):
+        """
+        Stop accepting connections and wait up to `timeout` seconds for the
+        requests in progress. Returns True if all of them finished; otherwise
+        the connections still waiting for a worker are closed unanswered.
+        Call from a thread other than the one running serve_forever.
+        """
+        self.draining = True
+        self.shutdown()
+        with self._idle:
+            drained = self._idle.wait_for(lambda: self._in_flight == 0, timeout)
+        self._executor.shutdown(wait=drained, cancel_futures=True)
+        return drained
+
+    def server_close(self):
+        self._rejections.put(None)
+        super().server_close()
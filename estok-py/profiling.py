@@ -0,0 +1,107 @@
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+# Request header that forces profiling of one request (its value must be the admin token)
+PROFILE_HEADER = 'X-Estok-Profile'
+
+_NAME_RE = re.compile(r'^[\w.-]+\.prof$')
+
+
+class RequestProfiler:
+    """
+    Runs selected requests under cProfile and saves one .prof file per request:
+        <UTC timestamp>_<endpoint>_<duration ms>ms.prof
+    A request is profiled when it carries PROFILE_HEADER (forced), or when the
+    profiler is enabled and the request is sampled (`sample_rate`, 0..1). Only
+    one request is profiled at a time (cProfile cannot run twice in one process
+    on Python 3.12+); requests arriving meanwhile simply run unprofiled. The
+    directory is kept to the newest `max_files` profiles.
+
+    When disabled, the request hook costs one attribute and one header lookup.
+    """
+
+    def __init__(self, directory, enabled=False, sample_rate=0.0, max_files=200):
+        self.directory = directory
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+        self.saved = 0
+        self._busy = threading.Lock()
+
+    def start(self, forced=False):
+        """Return a running cProfile.Profile for this request, or None."""
+        if not forced and not (self.enabled and random.random() < self.sample_rate):
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # another profiler (e.g. a debugger) is active
+            self._busy.release()
+            return None
+        profile.started_at = time.perf_counter()
+        return profile
+
+    def finish(self, profile, endpoint):
+        """Stop `profile` and save it; returns the file name."""
+        try:
+            profile.disable()
+        finally:
+            self._busy.release()
+        duration_ms = (time.perf_counter() - profile.started_at) * 1000
+        timestamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+        route = re.sub(r'[^\w.-]', '_', endpoint or 'unknown')
+        name = f"{timestamp}_{route}_{duration_ms:.0f}ms.prof"
+        os.makedirs(self.directory, exist_ok=True)
+        profile.dump_stats(os.path.join(self.directory, name))
+        self.saved += 1
+        self._trim()
+        return name
+
+    def _trim(self):
+        for entry in self.list_profiles()[self.max_files:]:
+            try:
+                os.remove(os.path.join(self.directory, entry['name']))
+            except OSError:
+                pass
+
+    def list_profiles(self):
+        """Saved profiles, newest first."""
+        try:
+            names = [name for name in os.listdir(self.directory) if _NAME_RE.match(name)]
+        except OSError:
+            return []
+        profiles = []
+        for name in sorted(names, reverse=True):
+            stamp, _, rest = name[:-len('.prof')].partition('_')
+            endpoint, _, duration = rest.rpartition('_')
+            try:
+                size = os.path.getsize(os.path.join(self.directory, name))
+                created_at = datetime.strptime(stamp, '%Y%m%dT%H%M%S%fZ').replace(tzinfo=timezone.utc)
+                duration_ms = float(duration[:-len('ms')])
+            except (OSError, ValueError):
+                continue
+            profiles.append({'name': name, 'endpoint': endpoint, 'duration_ms': duration_ms,
+                             'created_at': created_at, 'size': size})
+        return profiles
+
+    def path_for(self, name):
+        """Path of a saved profile, or None (names are validated: no path traversal)."""
+        if not _NAME_RE.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'directory': self.directory,
+            'saved': self.saved,
+        }
@@ -0,0 +1,193 @@
+"""
+Purchase (reorder) suggestions for the whole catalog at once.
+
+The daily sales of every product over the history window are loaded with one
+query as (product, day, quantity) triples and scattered into a products x days
+NumPy matrix; every statistic below is then a vector operation over all SKUs:
+
+- demand: exponentially weighted mean of the daily sales (`smoothing` is the
+  weight of the most recent day; older days decay by 1 - smoothing per day);
+- std: exponentially weighted standard deviation of the daily sales;
+- safety stock: z(service_level) * std * sqrt(lead_time_days + review_days);
+- reorder point: demand * lead_time_days + safety stock;
+- order-up-to level: demand * (lead_time_days + review_days) + safety stock.
+
+A product is suggested when its stock is at or below the reorder point, for
+the quantity that brings it back to the order-up-to level (rounded up).
+
+The window is the `history_days` complete days before today (UTC), so the
+demand statistics only change when the day turns or sales are registered; they
+are cached per window and newest sale id (see ReorderEngine.model). Stock is
+always read fresh.
+"""
+import math
+import threading
+from collections import OrderedDict, namedtuple
+from itertools import chain
+from statistics import NormalDist
+
+import numpy as np
+from sqlalchemy import Float, cast, func, select
+
+from sql_compat import epoch_day
+
+# Query param: (config key with the default, type, minimum, maximum)
+PARAMETERS = {
+    'history_days': ('REORDER_HISTORY_DAYS', int, 7, 730),
+    'smoothing': ('REORDER_SMOOTHING', float, 0.01, 1.0),
+    'lead_time_days': ('REORDER_LEAD_TIME_DAYS', float, 0.0, 365.0),
+    'review_days': ('REORDER_REVIEW_DAYS', float, 0.0, 365.0),
+    'service_level': ('REORDER_SERVICE_LEVEL', float, 0.5, 0.999),
+}
+
+# Demand statistics of the products sold in the window, aligned on `ids` (sorted)
+DemandModel = namedtuple('DemandModel', 'ids demand std')
+
+
+class ReorderError(ValueError):
+    """Invalid suggestion parameters (answered with 400)."""
+
+
+def history_query(vendas, itens, onclause, start, end):
+    """Quantity sold per (product, UTC day number) with start <= data_venda < end."""
+    day = epoch_day(vendas.c.data_venda)
+    return (
+        select(itens.c.id_produto, day.label('day'), cast(func.sum(itens.c.quantidade), Float).label('quantidade'))
+        .select_from(itens.join(vendas, onclause))
+        .where(vendas.c.data_venda >= start, vendas.c.data_venda < end)
+        .group_by(itens.c.id_produto, day)
+    )
+
+
+def build_model(rows, first_day, days, smoothing):
+    """
+    DemandModel from history_query rows; `first_day` is the day number of the
+    window's first day and `days` its length.
+    """
+    # fromiter over the flattened rows is about twice as fast as np.array(rows)
+    history = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=3 * len(rows)).reshape(-1, 3)
+    offsets = history[:, 1].astype(np.int64) - first_day
+    history = history[(offsets >= 0) & (offsets < days)]
+    offsets = offsets[(offsets >= 0) & (offsets < days)]
+
+    ids, rows_index = np.unique(history[:, 0].astype(np.int64), return_inverse=True)
+    sales = np.zeros((len(ids), days), dtype=np.float32)
+    sales[rows_index, offsets] = history[:, 2]  # one row per (product, day): no accumulation needed
+
+    # Weight of each day, newest last, normalized so the weighted mean is unbiased
+    weights = (1.0 - smoothing) ** np.arange(days - 1, -1, -1, dtype=np.float64)
+    weights = (weights / weights.sum()).astype(np.float32)
+    demand = (sales @ weights).astype(np.float64)
+    variance = np.maximum((np.square(sales) @ weights).astype(np.float64) - np.square(demand), 0.0)
+    return DemandModel(ids, demand, np.sqrt(variance))
+
+
+def suggest(model, products, params, limit):
+    """
+    Suggestions for `products` ((id, descricao, quantidade) rows, sorted by id).
+    Returns (number of products to reorder, the `limit` most urgent as dicts),
+    most urgent first (fewest days of stock left).
+    """
+    if not products:
+        return 0, []
+    ids, names, stock = zip(*products)
+    ids = np.fromiter(ids, dtype=np.int64, count=len(ids))
+    stock = np.fromiter(stock, dtype=np.float64, count=len(ids))
+
+    # Demand of each product (0 when it did not sell in the window)
+    demand = np.zeros(len(ids))
+    std = np.zeros(len(ids))
+    if len(model.ids):
+        positions = np.minimum(np.searchsorted(model.ids, ids), len(model.ids) - 1)
+        sold = model.ids[positions] == ids
+        demand[sold] = model.demand[positions[sold]]
+        std[sold] = model.std[positions[sold]]
+
+    lead_time = params['lead_time_days']
+    protection = lead_time + params['review_days']
+    z = NormalDist().inv_cdf(params['service_level'])
+    safety_stock = z * std * math.sqrt(protection)
+    reorder_point = demand * lead_time + safety_stock
+    order_up_to = demand * protection + safety_stock
+    quantity = np.ceil(order_up_to - stock)
+
+    reorder = (demand > 0) & (stock <= reorder_point) & (quantity > 0)
+    days_supply = np.divide(np.maximum(stock, 0.0), demand, out=np.zeros(len(ids)), where=demand > 0)
+
+    selected = np.flatnonzero(reorder)
+    selected = selected[np.argsort(days_supply[selected], kind='stable')][:limit]
+    columns = {
+        'id': ids[selected].tolist(),
+        'current_stock': stock[selected].tolist(),
+        'daily_demand': np.round(demand[selected], 3).tolist(),
+        'demand_std': np.round(std[selected], 3).tolist(),
+        'safety_stock': np.round(safety_stock[selected], 3).tolist(),
+        'reorder_point': np.round(reorder_point[selected], 3).tolist(),
+        'order_up_to': np.round(order_up_to[selected], 3).tolist(),
+        'suggested_quantity': quantity[selected].tolist(),
+        'days_supply': np.round(days_supply[selected], 2).tolist(),
+    }
+    data = [{'id': columns['id'][i], 'name': names[index],
+             **{name: values[i] for name, values in columns.items() if name != 'id'}}
+            for i, index in enumerate(selected.tolist())]
+    return int(reorder.sum()), data
+
+
+class ReorderEngine:
+    """
+    Suggestion parameters (defaults from the REORDER_* config) and the cache of
+    demand models: one per (window, newest sale id), the `max_models` most
+    recent kept. A model is rebuilt on the first request after a sale (or a
+    batch of offline sales) is registered, or when the day turns.
+    """
+
+    def __init__(self, config, max_models=4):
+        self.defaults = {name: kind(config[key]) for name, (key, kind, _, _) in PARAMETERS.items()}
+        self.max_models = max_models
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        # Counters for monitoring
+        self.hits = 0
+        self.builds = 0
+
+    def parse_params(self, args):
+        params = {}
+        for name, (_, kind, minimum, maximum) in PARAMETERS.items():
+            value = args.get(name)
+            if value is None or value == '':
+                params[name] = self.defaults[name]
+                continue
+            try:
+                value = kind(value)
+            except ValueError:
+                raise ReorderError(f"Invalid {name}: {args.get(name)}")
+            if not minimum <= value <= maximum:
+                raise ReorderError(f"{name} must be between {minimum} and {maximum}")
+            params[name] = value
+        return params
+
+    def model(self, key, load):
+        """The cached DemandModel for `key`, or the one built by `load()`."""
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return model
+        # Built outside the lock: a concurrent request for another window is not held up
+        model = load()
+        with self._lock:
+            self._models[key] = model
+            self.builds += 1
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+        return model
+
+    def stats(self):
+        with self._lock:
+            return {
+                'models': len(self._models),
+                'model_kb': round(sum(sum(array.nbytes for array in model) for model in self._models.values()) / 1024, 1),
+                'hits': self.hits,
+                'builds': self.builds,
+            }
@@ -0,0 +1,188 @@
+from collections import namedtuple
+
+from sqlalchemy import and_, select, func, union_all, null
+
+from sql_compat import date_trunc, iso_weekday
+
+METRICS = ('revenue', 'profit', 'quantity', 'tickets')
+BUCKETS = ('hour', 'day', 'week', 'month', 'none')
+DIMENSIONS = ('payment_method', 'product', 'weekday')
+
+# Metrics that need itens_venda (revenue comes from the items then, so it matches
+# the per-product split; vendas.valor_total is the sum of its items).
+ITEM_METRICS = ('profit', 'quantity')
+
+# vendas, itens_venda, formas_pagamento, produtos as Core tables; resumo / controle are
+# vendas_resumo_hora and vendas_resumo_controle (None when the rollup is not used).
+ReportTables = namedtuple('ReportTables', 'vendas itens formas produtos resumo controle')
+
+
+class ReportError(ValueError):
+    """Invalid report specification (answered with 400)."""
+
+
+def _split(value):
+    return [part.strip() for part in (value or '').split(',') if part.strip()]
+
+
+def parse_spec(args):
+    """
+    Read the report specification from query args:
+        metrics: comma list of revenue, profit, quantity, tickets (default: all)
+        bucket: hour, day, week, month or none (default: day)
+        group_by: comma list of payment_method, product, weekday (optional)
+    """
+    metrics = _split(args.get('metrics')) or list(METRICS)
+    group_by = _split(args.get('group_by'))
+    bucket = args.get('bucket', 'day')
+
+    unknown = [m for m in metrics if m not in METRICS]
+    if unknown:
+        raise ReportError(f"Unknown metrics: {', '.join(unknown)} (use {', '.join(METRICS)})")
+    unknown = [d for d in group_by if d not in DIMENSIONS]
+    if unknown:
+        raise ReportError(f"Unknown group_by: {', '.join(unknown)} (use {', '.join(DIMENSIONS)})")
+    if bucket not in BUCKETS:
+        raise ReportError(f"Unknown bucket: {bucket} (use {', '.join(BUCKETS)})")
+
+    # Keep the canonical order so equal reports compile to the same (cached) SQL
+    return {
+        'metrics': [m for m in METRICS if m in metrics],
+        'bucket': bucket,
+        'group_by': [d for d in DIMENSIONS if d in group_by],
+    }
+
+
+def _raw_facts(spec, tables, start_date, end_date, after_id=None, partitioned=False):
+    """
+    Sales aggregated per (hour, payment method[, product]) straight from vendas/itens_venda.
+    A sale falls into exactly one hour, so per-hour distinct ticket counts add up correctly.
+    With partitioned tables itens_venda is joined on the partition key and filtered on
+    the period too, so only the period's itens_venda partitions are scanned.
+    """
+    vendas, itens = tables.vendas, tables.itens
+    by_product = 'product' in spec['group_by']
+    hora = date_trunc('hour', vendas.c.data_venda)
+
+    if by_product or any(m in spec['metrics'] for m in ITEM_METRICS):
+        onclause = itens.c.id_venda == vendas.c.id
+        if partitioned:
+            onclause = and_(
+                onclause,
+                itens.c.data_venda == vendas.c.data_venda,
+                itens.c.data_venda >= start_date,
+                itens.c.data_venda <= end_date
+            )
+        source = vendas.join(itens, onclause)
+        revenue = func.sum(itens.c.valor_total)
+        # Same formula as the dashboard: (price - cost) * qty
+        profit = func.sum((itens.c.valor_unitario - itens.c.preco_custo) * itens.c.quantidade)
+        quantity = func.sum(itens.c.quantidade)
+        tickets = func.count(vendas.c.id.distinct())
+    else:
+        source = vendas
+        revenue = func.sum(vendas.c.valor_total)
+        profit = quantity = null()
+        tickets = func.count(vendas.c.id)
+
+    product = itens.c.id_produto if by_product else null()
+    query = select(
+        hora.label('hora'),
+        vendas.c.id_forma_pagamento.label('id_forma_pagamento'),
+        product.label('id_produto'),
+        revenue.label('receita'),
+        profit.label('lucro'),
+        quantity.label('quantidade'),
+        tickets.label('vendas'),
+    ).select_from(source).where(
+        vendas.c.data_venda >= start_date,
+        vendas.c.data_venda <= end_date
+    )
+    if after_id is not None:
+        query = query.where(vendas.c.id > after_id)
+    group = [hora, vendas.c.id_forma_pagamento] + ([itens.c.id_produto] if by_product else [])
+    return query.group_by(*group)
+
+
+def _rollup_facts(spec, tables, start_date, end_date):
+    """
+    Rows of vendas_resumo_hora. Rows with id_produto NULL hold the totals of each
+    (hour, payment method), so reports not split by product never double-count tickets.
+    """
+    resumo = tables.resumo
+    if 'product' in spec['group_by']:
+        level = resumo.c.id_produto.isnot(None)
+    else:
+        level = resumo.c.id_produto.is_(None)
+    return select(
+        resumo.c.hora,
+        resumo.c.id_forma_pagamento,
+        resumo.c.id_produto,
+        resumo.c.receita,
+        resumo.c.lucro,
+        resumo.c.quantidade,
+        resumo.c.vendas,
+    ).where(
+        level,
+        # Report periods are whole days, so hour rows never straddle the limits
+        resumo.c.hora >= start_date,
+        resumo.c.hora <= end_date
+    )
+
+
+def build_query(spec, tables, start_date, end_date, partitioned=False):
+    """
+    Compile a report spec into ONE select.
+
+    With the rollup (tables.resumo set) the facts are the pre-aggregated hours
+    covering sales up to vendas_resumo_controle.ultimo_id_venda, plus the newer
+    sales aggregated from the raw tables, so the result is always current.
+    `partitioned` joins itens_venda on the partition key (PARTITIONED_SALES).
+    """
+    if tables.resumo is not None:
+        watermark = select(tables.controle.c.ultimo_id_venda).where(tables.controle.c.id == 1).scalar_subquery()
+        facts = union_all(
+            _rollup_facts(spec, tables, start_date, end_date),
+            _raw_facts(spec, tables, start_date, end_date, after_id=func.coalesce(watermark, 0), partitioned=partitioned)
+        ).subquery('fatos')
+    else:
+        facts = _raw_facts(spec, tables, start_date, end_date, partitioned=partitioned).subquery('fatos')
+
+    columns, group = [], []
+    if spec['bucket'] != 'none':
+        bucket = date_trunc(spec['bucket'], facts.c.hora)
+        columns.append(bucket.label('bucket'))
+        group.append(bucket)
+
+    source = facts
+    if 'payment_method' in spec['group_by']:
+        formas = tables.formas
+        source = source.outerjoin(formas, facts.c.id_forma_pagamento == formas.c.id)
+        columns += [
+            facts.c.id_forma_pagamento,
+            func.coalesce(formas.c.nome, 'Sem Forma de Pagamento').label('forma_pagamento_nome'),
+        ]
+        group += [facts.c.id_forma_pagamento, formas.c.nome]
+    if 'product' in spec['group_by']:
+        produtos = tables.produtos
+        source = source.outerjoin(produtos, facts.c.id_produto == produtos.c.id)
+        columns += [facts.c.id_produto, produtos.c.descricao.label('produto_descricao')]
+        group += [facts.c.id_produto, produtos.c.descricao]
+    if 'weekday' in spec['group_by']:
+        # ISO weekday: 1 = Monday ... 7 = Sunday (weeks also start on Monday)
+        weekday = iso_weekday(facts.c.hora)
+        columns.append(weekday.label('weekday'))
+        group.append(weekday)
+
+    aggregates = {
+        'revenue': func.coalesce(func.sum(facts.c.receita), 0),
+        'profit': func.coalesce(func.sum(facts.c.lucro), 0),
+        'quantity': func.coalesce(func.sum(facts.c.quantidade), 0),
+        'tickets': func.coalesce(func.sum(facts.c.vendas), 0),
+    }
+    columns += [aggregates[m].label(m) for m in spec['metrics']]
+
+    query = select(*columns).select_from(source)
+    if group:
+        query = query.group_by(*group).order_by(*group)
+    return query
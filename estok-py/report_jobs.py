@@ -0,0 +1,164 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from fast_json import dumps_bytes
+
+
+class ReportJob:
+    def __init__(self, report, endpoint, path, params):
+        self.id = uuid.uuid4().hex
+        self.report = report
+        self.endpoint = endpoint
+        self.path = path
+        self.params = params
+        self.status = 'queued'
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at = None
+        self.expires_at = None
+        self.duration_ms = None
+        self.error = None
+        self.body = None  # report JSON (bytes) once done
+
+    @property
+    def key(self):
+        return (self.report, tuple(sorted(self.params.items())))
+
+    def describe(self):
+        return {
+            'id': self.id,
+            'report': self.report,
+            'params': self.params,
+            'status': self.status,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'duration_ms': self.duration_ms,
+            'error': self.error,
+        }
+
+    def to_json(self):
+        """Job description with the report embedded as `result` (the stored bytes are spliced in, not re-encoded)."""
+        envelope = dumps_bytes(self.describe())
+        if self.body is None:
+            return envelope
+        return envelope[:-1] + b',"result":' + self.body + b'}'
+
+
+class ReportJobs:
+    """
+    Runs report routes in the background on a small worker pool.
+
+    A job calls the route's view inside a test request context, so a job
+    result is exactly what GET /reports/<report> would answer. Finished results
+    are kept for `ttl` seconds in a store bounded by `max_jobs` entries and
+    `max_bytes` of results (oldest evicted first); submitting the same report
+    and parameters again returns the existing job instead of recomputing.
+    """
+
+    def __init__(self, app, workers=2, max_jobs=64, max_bytes=64 * 1024 * 1024, ttl=300, max_pending=32):
+        self.app = app
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self._jobs = OrderedDict()  # id -> ReportJob, in submission order
+        self._by_key = {}
+        self._stored_bytes = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        # Counters for monitoring
+        self.reused = 0
+        self.computed = 0
+
+    def submit(self, report, endpoint, path, params, refresh=False):
+        """Return (job, created). Returns (None, False) when too many jobs are pending."""
+        job = ReportJob(report, endpoint, path, params)
+        with self._lock:
+            self._expire()
+            existing = self._jobs.get(self._by_key.get(job.key))
+            if existing is not None and not (refresh and existing.status == 'done'):
+                self.reused += 1
+                return existing, False
+            if sum(1 for j in self._jobs.values() if j.status in ('queued', 'running')) >= self.max_pending:
+                return None, False
+            # On refresh the previous job stays readable until it expires
+            self._jobs[job.id] = job
+            self._by_key[job.key] = job.id
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='report-job')
+        self._executor.submit(self._run, job)
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def _run(self, job):
+        job.status = 'running'
+        start = time.perf_counter()
+        try:
+            with self.app.test_request_context(job.path, query_string=job.params):
+                response = self.app.make_response(self.app.view_functions[job.endpoint]())
+            body = response.get_data()
+            if response.status_code == 200:
+                result = ('done', body, None)
+            else:
+                try:
+                    message = json.loads(body).get('message')
+                except (ValueError, AttributeError):
+                    message = None
+                result = ('failed', None, message or f"Report failed with HTTP {response.status_code}")
+        except Exception as e:
+            result = ('failed', None, str(e))
+
+        with self._lock:
+            job.status, job.body, job.error = result
+            job.finished_at = datetime.now(timezone.utc)
+            job.duration_ms = round((time.perf_counter() - start) * 1000, 2)
+            self.computed += 1
+            if job.status == 'done':
+                job.expires_at = time.monotonic() + self.ttl
+                self._stored_bytes += len(job.body)
+            else:
+                # Failures are reported once and not reused: a resubmission retries
+                job.expires_at = time.monotonic() + min(self.ttl, 60)
+                if self._by_key.get(job.key) == job.id:
+                    del self._by_key[job.key]
+            self._evict()
+
+    def _drop(self, job):
+        self._jobs.pop(job.id, None)
+        if self._by_key.get(job.key) == job.id:
+            del self._by_key[job.key]
+        if job.body is not None:
+            self._stored_bytes -= len(job.body)
+
+    def _expire(self):
+        now = time.monotonic()
+        for job in [j for j in self._jobs.values() if j.expires_at is not None and j.expires_at <= now]:
+            self._drop(job)
+
+    def _evict(self):
+        """Drop the oldest finished jobs while over max_jobs / max_bytes (pending jobs are kept)."""
+        for job in list(self._jobs.values()):
+            if len(self._jobs) <= self.max_jobs and self._stored_bytes <= self.max_bytes:
+                break
+            if job.finished_at is not None:
+                self._drop(job)
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+            return {
+                'jobs': len(statuses),
+                'pending': sum(1 for status in statuses if status in ('queued', 'running')),
+                'stored_bytes': self._stored_bytes,
+                'computed': self.computed,
+                'reused': self.reused,
+            }
@@ -0,0 +1,200 @@
+"""
+Headless entry point for running Estok as a service (systemd, NSSM, Docker),
+without the Tk Server Manager. Settings come from db_config.json / ESTOK_*
+like the GUI; the options below override them.
+
+Usage:
+    python server_cli.py serve [--host 0.0.0.0] [--port 5000] [--workers 16]
+                               [--pool-size N] [--max-overflow 10] [--pool-timeout 30]
+                               [--pool-recycle 1800] [--drain-timeout 30] [--warm-up]
+    python server_cli.py init-db [--schema PATH]
+    python server_cli.py test-connection
+    python server_cli.py maintenance {partitions,rollup,all} [--months-ahead N]
+
+SIGTERM / SIGINT (Ctrl+C, Ctrl+Break on Windows) stop accepting connections,
+close the /events streams and wait up to --drain-timeout seconds for the
+requests in progress before exiting.
+
+serve writes JSON-lines logs (estok.log, access.log) to --log-dir (default:
+the 'logs' folder next to the user db_config.json) and echoes them to stderr.
+"""
+import argparse
+import logging
+import signal
+import sys
+import threading
+
+import config_manager
+import db_tools
+import server_logging
+
+
+def log(message):
+    print(message, flush=True)
+
+
+def build_app(config=None):
+    from main import create_app
+    return create_app(config)
+
+
+def serve(args):
+    from pooled_server import PooledWSGIServer
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    listener = server_logging.setup_logging(args.log_dir or config_manager.get_log_dir(),
+                                            level=args.log_level, extra_handlers=[console])
+    try:
+        return run_server(args, PooledWSGIServer)
+    finally:
+        listener.stop()
+
+
+def run_server(args, server_class):
+    logger = logging.getLogger('estok.server')
+    pool_size = args.pool_size or args.workers
+    app = build_app({
+        'SQLALCHEMY_ENGINE_OPTIONS': {
+            'pool_size': pool_size,
+            'max_overflow': args.max_overflow,
+            'pool_timeout': args.pool_timeout,
+            'pool_recycle': args.pool_recycle,
+            'pool_pre_ping': True,
+        },
+    })
+    if args.warm_up or app.config['WARMUP_ENABLED']:
+        success, message = db_tools.warm_up(app, log=logger.info)
+        (logger.info if success else logger.warning)(message)
+
+    # Besides requests, workers are held by idle connections (opened ahead of
+    # their request, or keep-alive) until another connection waits for one,
+    # which needs room to wait: with no pending slots a request is refused
+    # first. /events streams run on threads of their own.
+    if args.max_pending == 0:
+        logger.warning("--max-pending 0: idle connections keep their worker until a request is refused "
+                       "with 503 (allow some pending connections so they give it up first)")
+
+    if app.config['ADMISSION_ENABLED']:
+        # Requests waiting in a lane queue hold a worker too. Checkout only keeps
+        # its reserve if the other lanes leave room for its limit + queue (idle
+        # connections give theirs up when a request waits, see above).
+        lanes = app.config['ADMISSION_LANES']
+        others = sum(lane['limit'] + lane['queue'] for name, lane in lanes.items() if name != 'checkout')
+        checkout = lanes['checkout']['limit'] + lanes['checkout']['queue'] if 'checkout' in lanes else 0
+        if others + checkout > args.workers:
+            logger.warning(f"The other admission lanes can hold {others} workers and checkout "
+                           f"{checkout}, more than the {args.workers} available: checkout has only "
+                           f"{max(args.workers - others, 0)} reserved (raise --workers or lower the lane limits)")
+
+    server = server_class(args.host, args.port, app, workers=args.workers,
+                          keep_alive_timeout=args.keep_alive, max_pending=args.max_pending,
+                          stream_paths=('/events',))
+
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        stop.set()
+
+    for name in ('SIGTERM', 'SIGINT', 'SIGBREAK'):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), request_stop)
+
+    thread = threading.Thread(target=server.serve_forever, name='estok-accept', daemon=True)
+    thread.start()
+    logger.info(f"Serving on http://{args.host}:{args.port} with {args.workers} workers "
+        f"(db pool {pool_size}+{args.max_overflow}; up to {app.config['EVENTS_MAX_SUBSCRIBERS']} /events "
+        f"streams on threads of their own)")
+
+    # Wake up periodically so signals are handled promptly on every platform
+    while not stop.wait(1):
+        if not thread.is_alive():
+            logger.error("Server stopped unexpectedly.")
+            return 1
+
+    logger.info(f"Shutting down: draining {server.in_flight} connection(s)...")
+    app.extensions['estok_event_broker'].close()
+    drained = server.drain(args.drain_timeout)
+    thread.join(5)
+    # Sales still queued for a group commit are written before the process exits
+    if not app.extensions['estok_sales_writer'].drain(args.drain_timeout):
+        logger.warning("Group-commit writer did not finish its queued sales.")
+        drained = False
+    with app.app_context():
+        from main import db
+        db.engine.dispose()
+    if drained:
+        logger.info("Server stopped.")
+        return 0
+    logger.warning(f"Server stopped; {server.in_flight} connection(s) did not finish within {args.drain_timeout}s.")
+    return 1
+
+
+def report(result):
+    success, message = result
+    log(message if success else f"ERROR: {message}")
+    return 0 if success else 1
+
+
+def init_db(args):
+    return report(db_tools.init_database(build_app(), args.schema, log=log))
+
+
+def test_connection(args):
+    return report(db_tools.test_connection(build_app()))
+
+
+def maintenance(args):
+    app = build_app()
+    status = 0
+    if args.job in ('partitions', 'all'):
+        status |= report(db_tools.ensure_partitions(app, args.months_ahead))
+    if args.job in ('rollup', 'all'):
+        status |= report(db_tools.refresh_rollup(app))
+    return status
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Estok server (headless).")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('serve', help="run the API server")
+    p.add_argument('--host', default='0.0.0.0', help="bind address")
+    p.add_argument('--port', type=int, default=5000)
+    p.add_argument('--workers', type=int, default=16, help="request worker threads")
+    p.add_argument('--max-pending', type=int,
+                   help="accepted connections that may wait for a worker; beyond that they get 503 (default: --workers)")
+    p.add_argument('--pool-size', type=int, help="database connections kept open (default: --workers)")
+    p.add_argument('--max-overflow', type=int, default=10, help="extra database connections under load")
+    p.add_argument('--pool-timeout', type=float, default=30, help="seconds to wait for a database connection")
+    p.add_argument('--pool-recycle', type=int, default=1800, help="reconnect database connections older than this (seconds)")
+    p.add_argument('--keep-alive', type=float, default=15,
+                   help="seconds an idle connection keeps its worker (given up sooner when others wait)")
+    p.add_argument('--drain-timeout', type=float, default=30, help="seconds to wait for requests on shutdown")
+    p.add_argument('--warm-up', action='store_true',
+                   help="open the pool, prepare hot statements and prewarm the catalog before serving "
+                        "(also ESTOK_WARMUP_ENABLED=true)")
+    p.add_argument('--log-dir', help="directory for estok.log / access.log")
+    p.add_argument('--log-level', default='INFO', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'))
+    p.set_defaults(func=serve)
+
+    p = commands.add_parser('init-db', help="create the 'estok' database if missing and apply schema.sql")
+    p.add_argument('--schema', help="path to schema.sql (default: ../estok-db/schema.sql)")
+    p.set_defaults(func=init_db)
+
+    p = commands.add_parser('test-connection', help="check the database connection")
+    p.set_defaults(func=test_connection)
+
+    p = commands.add_parser('maintenance', help="run periodic database jobs")
+    p.add_argument('job', choices=('partitions', 'rollup', 'all'),
+                   help="partitions: create the coming months' sales partitions; "
+                        "rollup: refresh the hourly sales rollup")
+    p.add_argument('--months-ahead', type=int, help="months of partitions to keep ahead (default: PARTITION_MONTHS_AHEAD)")
+    p.set_defaults(func=maintenance)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,116 @@
+"""
+Asynchronous, bounded logging for the server (GUI and CLI).
+
+Every logger writes into a queue (QueueHandler), so a request thread never
+waits on disk or on Tk; one listener thread hands the records to:
+    logs/estok.log    application records, JSON lines, rotated
+    logs/access.log   one JSON line per HTTP request (logger 'estok.access', written
+                      by pooled_server.AccessLogRequestHandler), rotated
+    extra handlers    e.g. the Server Manager ring buffer or the console
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from collections import deque
+from datetime import datetime, timezone
+
+ACCESS_LOGGER = 'estok.access'
+
+# LogRecord attributes; anything else on a record came from `extra=` and is logged as a field
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, extra fields, exc."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    Keeps only the last `capacity` formatted lines. A UI thread polls
+    take_new() and gets the lines added since the previous call, in one batch.
+    """
+
+    def __init__(self, capacity=1000, level=logging.NOTSET):
+        super().__init__(level)
+        self.lines = deque(maxlen=capacity)
+        self._pending = deque(maxlen=capacity)
+        self.setFormatter(logging.Formatter('%(asctime)s %(message)s', '%H:%M:%S'))
+
+    def emit(self, record):
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        with self.lock:
+            self.lines.append(line)
+            self._pending.append(line)
+
+    def take_new(self):
+        with self.lock:
+            lines = list(self._pending)
+            self._pending.clear()
+        return lines
+
+
+class _OnlyLogger(logging.Filter):
+    def __init__(self, name, exclude=False):
+        super().__init__(name)
+        self.exclude = exclude
+
+    def filter(self, record):
+        return super().filter(record) != self.exclude
+
+
+def setup_logging(log_dir, level=logging.INFO, max_bytes=5 * 1024 * 1024, backup_count=5, extra_handlers=()):
+    """
+    Route all logging through a queue to rotating JSON-lines files in `log_dir`
+    (plus `extra_handlers`). Returns the started QueueListener; call its stop()
+    on exit to flush the queue.
+    """
+    formatter = JsonLinesFormatter()
+
+    app_file = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, 'estok.log'), maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+    app_file.addFilter(_OnlyLogger(ACCESS_LOGGER, exclude=True))
+    access_file = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, 'access.log'), maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+    access_file.addFilter(_OnlyLogger(ACCESS_LOGGER))
+    for handler in (app_file, access_file):
+        handler.setFormatter(formatter)
+    try:
+        os.makedirs(log_dir, exist_ok=True)
+        handlers = [app_file, access_file, *extra_handlers]
+        error = None
+    except OSError as e:
+        handlers, error = list(extra_handlers), e
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+    listener.start()
+    if error is not None:
+        logging.getLogger('estok').warning("Log files disabled (%s): %s", log_dir, error)
+    return listener
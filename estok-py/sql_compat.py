@@ -0,0 +1,116 @@
+"""
+SQL constructs that compile to native SQL on each supported backend
+(PostgreSQL, and the embedded SQLite backend of sqlite_backend.py), so the
+prebuilt statements and report queries stay written once.
+
+SQLite stores DateTime columns as 'YYYY-MM-DD HH:MM:SS[.ffffff]' text, so
+date arithmetic there is done with strftime().
+"""
+from sqlalchemy import literal_column
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.types import Boolean, DateTime, Integer
+
+TRUNC_UNITS = ('hour', 'day', 'week', 'month')
+
+# pg_trgm.word_similarity_threshold default, used where the setting does not exist
+WORD_SIMILARITY_THRESHOLD = 0.6
+
+_SQLITE_TRUNC = {
+    'hour': "strftime('%Y-%m-%d %H:00:00', {})",
+    'day': "strftime('%Y-%m-%d 00:00:00', {})",
+    # Weeks start on Monday, like date_trunc: next Sunday ('weekday 0'), then back 6 days
+    'week': "strftime('%Y-%m-%d 00:00:00', {}, 'weekday 0', '-6 days')",
+    'month': "strftime('%Y-%m-01 00:00:00', {})",
+}
+
+
+class date_trunc(FunctionElement):
+    """date_trunc(unit, timestamp) for unit in TRUNC_UNITS."""
+    type = DateTime()
+    name = 'date_trunc'
+    inherit_cache = True
+
+    def __init__(self, unit, expr):
+        if unit not in TRUNC_UNITS:
+            raise ValueError(f"Unsupported date_trunc unit: {unit}")
+        # A literal column (not a bind parameter), so the unit is part of the statement cache key
+        super().__init__(literal_column(f"'{unit}'"), expr)
+
+
+@compiles(date_trunc)
+def _date_trunc(element, compiler, **kw):
+    return f"date_trunc({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(date_trunc, 'sqlite')
+def _date_trunc_sqlite(element, compiler, **kw):
+    unit, expr = element.clauses.clauses
+    return _SQLITE_TRUNC[unit.name.strip("'")].format(compiler.process(expr, **kw))
+
+
+class iso_weekday(FunctionElement):
+    """ISO day of the week: 1 = Monday ... 7 = Sunday."""
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(iso_weekday)
+def _iso_weekday(element, compiler, **kw):
+    return f"CAST(EXTRACT(isodow FROM {compiler.process(element.clauses, **kw)}) AS INTEGER)"
+
+
+@compiles(iso_weekday, 'sqlite')
+def _iso_weekday_sqlite(element, compiler, **kw):
+    # strftime('%w'): 0 = Sunday ... 6 = Saturday
+    return f"((CAST(strftime('%w', {compiler.process(element.clauses, **kw)}) AS INTEGER) + 6) % 7 + 1)"
+
+
+class epoch_day(FunctionElement):
+    """Whole UTC days since 1970-01-01 (day numbers, for per-day arrays)."""
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(epoch_day)
+def _epoch_day(element, compiler, **kw):
+    return f"CAST(floor(EXTRACT(epoch FROM {compiler.process(element.clauses, **kw)}) / 86400) AS INTEGER)"
+
+
+@compiles(epoch_day, 'sqlite')
+def _epoch_day_sqlite(element, compiler, **kw):
+    # Julian day 2440587.5 is 1970-01-01 00:00 UTC; CAST truncates, which floors for dates after 1970
+    # (floor() needs SQLite's optional math functions)
+    return f"CAST(julianday({compiler.process(element.clauses, **kw)}) - 2440587.5 AS INTEGER)"
+
+
+class word_similar(FunctionElement):
+    """
+    `term <% text` (pg_trgm): some word extent of text is similar to term, above
+    pg_trgm.word_similarity_threshold. On SQLite, the word_similarity() function
+    registered by sqlite_backend against WORD_SIMILARITY_THRESHOLD.
+    """
+    type = Boolean()
+    inherit_cache = True
+
+
+@compiles(word_similar)
+def _word_similar(element, compiler, **kw):
+    term, text = element.clauses.clauses
+    return compiler.process(term.op('<%')(text), **kw)
+
+
+@compiles(word_similar, 'sqlite')
+def _word_similar_sqlite(element, compiler, **kw):
+    term, text = element.clauses.clauses
+    return (f"(word_similarity({compiler.process(term, **kw)}, {compiler.process(text, **kw)}) "
+            f">= {WORD_SIMILARITY_THRESHOLD})")
+
+
+def insert_ignoring_conflicts(table, dialect_name, index_elements):
+    """INSERT ... ON CONFLICT (index_elements) DO NOTHING for PostgreSQL or SQLite."""
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert(table).on_conflict_do_nothing(index_elements=index_elements)
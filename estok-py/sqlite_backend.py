@@ -0,0 +1,168 @@
+"""
+Embedded SQLite backend for single-terminal stores: db_config.json
+"backend": "sqlite" (and optionally "sqlite_path"). No PostgreSQL to install
+and no socket round trip per query.
+
+Each connection runs in WAL mode (readers never block the single writer) with
+the PRAGMAS below, and gets Python versions of the PostgreSQL functions the
+queries use (estok_normalizar, word_similarity; see sql_compat.py for the
+constructs that compile differently). Transactions are real BEGIN ... COMMIT
+blocks, like on PostgreSQL: pysqlite's own transaction handling is turned off.
+Reads start with a deferred BEGIN (SQLITE_BEGIN) and so never wait for the
+lock; units of work that write call begin_write() and start with BEGIN
+IMMEDIATE (SQLITE_WRITE_BEGIN).
+
+PostgreSQL-only features (partitioning, the hourly report rollup, LISTEN/NOTIFY
+cache invalidation, read replicas) are off on this backend.
+"""
+import re
+import unicodedata
+
+from sqlalchemy import event
+
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous={synchronous}',  # NORMAL: in WAL mode only a power loss can drop the last commits
+    'PRAGMA foreign_keys=ON',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-{cache_kb}',     # negative = KiB
+    'PRAGMA mmap_size={mmap_bytes}',
+)
+
+# Indexes of schema.sql that create_all() does not know about (models declare none)
+INDEXES = (
+    'CREATE INDEX IF NOT EXISTS index_codigo_auxiliar ON produtos (codigo_auxiliar)',
+    'CREATE INDEX IF NOT EXISTS index_ean13 ON produtos (ean13)',
+    'CREATE INDEX IF NOT EXISTS index_produtos_descricao ON produtos (descricao)',
+    'CREATE INDEX IF NOT EXISTS index_vendas_data_venda ON vendas (data_venda)',
+    'CREATE INDEX IF NOT EXISTS index_itens_venda_id_venda ON itens_venda (id_venda)',
+    'CREATE INDEX IF NOT EXISTS index_itens_venda_id_produto ON itens_venda (id_produto)',
+    'CREATE INDEX IF NOT EXISTS index_movimentacoes_produto_data '
+    'ON movimentacoes_estoque (id_produto, data_movimentacao, id)',
+    'CREATE INDEX IF NOT EXISTS index_vendas_resumo_hora_hora ON vendas_resumo_hora (hora)',
+)
+
+# Same seeds as schema.sql
+SEEDS = (
+    "INSERT INTO formas_pagamento (nome, atalho, ativo) VALUES "
+    "('Dinheiro', 'D', 1), ('Cartão', 'C', 1), ('Pix', 'P', 1) ON CONFLICT (atalho) DO NOTHING",
+    "INSERT INTO vendas_resumo_controle (id, ultimo_id_venda) VALUES (1, 0) ON CONFLICT (id) DO NOTHING",
+)
+
+# Execution option of the connection of a write unit of work (see begin_write)
+WRITE_OPTION = 'estok_write'
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def is_sqlite(uri):
+    return uri.startswith('sqlite')
+
+
+def normalize(value):
+    """estok_normalizar(): lower(unaccent(value))."""
+    if value is None:
+        return None
+    decomposed = unicodedata.normalize('NFKD', value)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+
+def _trigrams(words):
+    grams = set()
+    for word in words:
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def word_similarity(term, text):
+    """
+    pg_trgm's word_similarity(): the share of the trigrams of `term` found in the
+    most similar run of consecutive words of `text` (0..1).
+    """
+    if not term or not text:
+        return 0.0
+    term_words = _WORD_RE.findall(term.lower())
+    wanted = _trigrams(term_words)
+    if not wanted:
+        return 0.0
+    words = _WORD_RE.findall(text.lower())
+    best = 0.0
+    for start in range(len(words)):
+        for end in range(start + 1, min(len(words), start + len(term_words)) + 1):
+            best = max(best, len(wanted & _trigrams(words[start:end])) / len(wanted))
+            if best == 1.0:
+                return best
+    return best
+
+
+def init_app(app):
+    """
+    SQLite engine options and settings; call before db.init_app(app) (which
+    creates the engine). Does nothing for other databases.
+    """
+    if not is_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        return
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    options['connect_args'] = {
+        'check_same_thread': False,  # pooled connections move between server threads
+        'timeout': app.config['SQLITE_BUSY_TIMEOUT'],  # seconds a writer waits for the lock
+        **options.get('connect_args', {}),
+    }
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    app.config['PARTITIONED_SALES'] = False
+    app.config['REPORT_ROLLUP_ENABLED'] = False
+
+
+def configure_engine(engine, config):
+    """Pragmas, functions and transaction handling for every connection of `engine`."""
+    pragmas = [pragma.format(synchronous=config['SQLITE_SYNCHRONOUS'],
+                             cache_kb=int(config['SQLITE_CACHE_MB']) * 1024,
+                             mmap_bytes=int(config['SQLITE_MMAP_MB']) * 1024 * 1024)
+               for pragma in PRAGMAS]
+
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        # Let SQLAlchemy emit BEGIN (see below) instead of pysqlite's implicit one,
+        # which only starts before INSERT/UPDATE/DELETE and leaves reads outside it
+        dbapi_connection.isolation_level = None
+        dbapi_connection.create_function('estok_normalizar', 1, normalize, deterministic=True)
+        dbapi_connection.create_function('word_similarity', 2, word_similarity, deterministic=True)
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+        if connection.get_execution_options().get(WRITE_OPTION):
+            connection.exec_driver_sql(config['SQLITE_WRITE_BEGIN'])
+        else:
+            connection.exec_driver_sql(config['SQLITE_BEGIN'])
+
+
+def begin_write(session):
+    """
+    Start the transaction of `session` as a write unit of work. On SQLite it
+    begins with SQLITE_WRITE_BEGIN (BEGIN IMMEDIATE), which waits up to
+    SQLITE_BUSY_TIMEOUT for the write lock: with a deferred BEGIN, a unit of work
+    that reads before it writes gets "database is locked" at once if another
+    connection is writing, since SQLite does not wait to promote a read to a
+    write. Call it before the first statement of the transaction; on other
+    databases it only opens the transaction.
+    """
+    session.connection(execution_options={WRITE_OPTION: True})
+
+
+def bootstrap(app, log=print):
+    """Schema for a SQLite database: tables from the models, schema.sql's indexes and seeds."""
+    from main import db
+
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as conn:
+            for statement in INDEXES + SEEDS:
+                conn.exec_driver_sql(statement)
+        path = db.engine.url.database
+    log(f"SQLite database ready at {path}")
+    return True, "Database Initialized (SQLite)."
@@ -0,0 +1,79 @@
+"""
+Startup-time measurement for the server (catches cold-start regressions).
+
+Each stage runs in a fresh interpreter, so module caches do not hide import cost:
+    import server_gui   what runs before the Tk window can appear
+    import main         routes and models
+    create_app          building the Flask app (config, extensions, blueprint)
+
+Usage:
+    python startup_time.py [--runs 5] [--budget SECONDS]
+With --budget, exits with status 1 when the GUI import (the time until the
+window shows) takes longer than SECONDS.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# (setup, measured statement) executed in a child interpreter
+STAGES = [
+    ('import server_gui', '', 'import server_gui'),
+    ('import main', '', 'import main'),
+    ('create_app', 'import main', 'main.create_app()'),
+]
+
+CHILD = """
+import sys, time
+sys.path.insert(0, {here!r})
+{setup}
+start = time.perf_counter()
+{stmt}
+print(time.perf_counter() - start)
+"""
+
+
+def measure(setup, stmt):
+    """Seconds taken by `stmt` in a new interpreter (None if it failed)."""
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD.format(here=HERE, setup=setup, stmt=stmt)],
+        cwd=HERE, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1:] or ['failed']
+    return float(result.stdout.strip().splitlines()[-1]), None
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Measure server startup time.")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, help="max seconds allowed for 'import server_gui'")
+    args = parser.parse_args()
+
+    medians = {}
+    for name, setup, stmt in STAGES:
+        samples, error = [], None
+        for _ in range(args.runs):
+            elapsed, error = measure(setup, stmt)
+            if elapsed is None:
+                break
+            samples.append(elapsed)
+        if not samples:
+            print(f"{name:<20} unavailable ({error[0]})")
+            continue
+        medians[name] = statistics.median(samples)
+        print(f"{name:<20} median {medians[name] * 1000:8.1f} ms   min {min(samples) * 1000:8.1f} ms")
+
+    if args.budget is not None:
+        gui = medians.get('import server_gui')
+        if gui is None or gui > args.budget:
+            print(f"FAILED: window startup exceeds the {args.budget:.3f}s budget")
+            sys.exit(1)
+        print(f"OK: window startup within the {args.budget:.3f}s budget")
+
+
+if __name__ == '__main__':
+    main_cli()
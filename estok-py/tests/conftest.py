@@ -0,0 +1,85 @@
+"""
+Fixtures for the API tests. They run on the embedded SQLite backend (a
+database file per test, WAL and the same connection setup as a store would
+use), so no PostgreSQL server is needed:
+
+    cd estok-py && python -m pytest -q
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+import sqlite_backend  # noqa: E402
+
+PRODUCTS = (
+    {'descricao': 'Coca Cola 2L', 'ean13': '7894900011517', 'codigo_auxiliar': 'COCA2', 'quantidade': 100,
+     'preco_custo': 6.0, 'preco_venda': 9.9},
+    {'descricao': 'Água Mineral 500ml', 'ean13': '7896000000011', 'codigo_auxiliar': 'AGUA', 'quantidade': 50,
+     'preco_custo': 1.0, 'preco_venda': 2.5},
+    {'descricao': 'Pão Francês', 'ean13': None, 'codigo_auxiliar': 'PAO', 'quantidade': 0,
+     'preco_custo': 0.5, 'preco_venda': 0.9},
+)
+
+# Report period covering the `sales` fixture
+PERIOD = {'start_date': '2024-05-01', 'end_date': '2024-06-30'}
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = main.create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'estok.db'}",
+        'TESTING': True,
+    })
+    success, message = sqlite_backend.bootstrap(app, log=lambda message: None)
+    assert success, message
+    yield app
+    with app.app_context():
+        main.db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def products(client):
+    """The PRODUCTS rows, created through the API (ids in the same order)."""
+    ids = []
+    for product in PRODUCTS:
+        response = client.post('/products', json=product)
+        assert response.status_code == 201, response.json
+        ids.append(response.json['id'])
+    return ids
+
+
+@pytest.fixture
+def payment_method(client):
+    """Id of the seeded 'Dinheiro' payment method."""
+    return next(method['id'] for method in client.get('/payment-methods').json if method['nome'] == 'Dinheiro')
+
+
+@pytest.fixture
+def sales(client, products):
+    """Three offline sales: Monday 2024-05-20 (cash), Tuesday 05-21 (card), Monday 06-03 (cash)."""
+    coca, agua, _ = products
+    response = client.post('/sales/batch', json={'sales': [
+        batch_sale('a', coca, 2, 10, '2024-05-20T14:30:00', 1),
+        batch_sale('b', agua, 4, 2.5, '2024-05-21T09:10:00', 2),
+        batch_sale('c', coca, 1, 10, '2024-06-03T10:00:00', 1),
+    ]})
+    assert response.json['created'] == 3, response.json
+    return products
+
+
+def batch_sale(key, product_id, quantity, price, when, payment_method=None):
+    return {'chave_idempotencia': key, 'id_forma_pagamento': payment_method, 'data_venda': when,
+            'items': [{'id_produto': product_id, 'quantidade': quantity, 'valor_unitario': price}]}
+
+
+def stock_of(client, product_id):
+    return next(row['quantidade'] for row in client.get('/products/all').json['data'] if row['id'] == product_id)
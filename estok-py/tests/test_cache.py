@@ -0,0 +1,264 @@
+import socket
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import cache
+import main
+from cache import SharedCache, TaggedCache
+from conftest import stock_of
+
+
+class Clock:
+    """Stands in for the time module in cache.py: monotonic() is set by the test."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, 'time', clock)
+    return clock
+
+
+def loader(value, calls):
+    def load():
+        calls.append(value)
+        return value
+    return load
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_hit_and_miss():
+    results, calls = TaggedCache(), []
+    assert results.get_or_load('a', {'products'}, loader(1, calls)) == 1
+    assert results.get_or_load('a', {'products'}, loader(2, calls)) == 1
+    assert calls == [1]
+    assert results.stats() == {'entries': 1, 'hits': 1, 'misses': 1, 'evictions': 0}
+
+
+def test_invalidate_during_a_fill_discards_the_value():
+    results, calls = TaggedCache(), []
+
+    def load():
+        calls.append('load')
+        results.invalidate({'products'})  # a write commits while the rows are read
+        return 'stale'
+
+    assert results.get_or_load('a', {'products'}, load) == 'stale'
+    assert results.get_or_load('a', {'products'}, loader('fresh', calls)) == 'fresh'
+    assert calls == ['load', 'fresh']
+
+
+def test_tag_invalidation():
+    results, calls = TaggedCache(), []
+    results.get_or_load('coca', {'products', 'product:1'}, loader('coca', calls))
+    results.get_or_load('agua', {'products', 'product:2'}, loader('agua', calls))
+    results.get_or_load('sales', {'sales'}, loader('sales', calls))
+
+    assert results.invalidate({'product:1'}) == 1
+    assert results.invalidate({'products'}) == 1
+    assert results.stats()['entries'] == 1
+    assert results.invalidate({cache.ALL}) == 1
+    assert results.stats()['entries'] == 0
+
+
+def test_callable_tags_can_refuse_a_value():
+    results, calls = TaggedCache(), []
+    tags = lambda value: None if value == 'error' else {'products'}
+    results.get_or_load('a', tags, loader('error', calls))
+    results.get_or_load('a', tags, loader('rows', calls))
+    results.get_or_load('a', tags, loader('other', calls))
+    assert calls == ['error', 'rows']
+
+
+def test_ttl_expiry(clock):
+    results, calls = TaggedCache(ttl=300), []
+    results.get_or_load('a', {'products'}, loader(1, calls))
+    clock.now += 299
+    assert results.get_or_load('a', {'products'}, loader(2, calls)) == 1
+    clock.now += 2
+    assert results.get_or_load('a', {'products'}, loader(3, calls)) == 3
+    assert results.get_or_load('b', {'products'}, loader(4, calls), ttl=0) == 4
+    assert results.get_or_load('b', {'products'}, loader(5, calls), ttl=0) == 5
+
+
+def test_least_recently_used_entries_are_evicted():
+    results, calls = TaggedCache(max_entries=2), []
+    results.get_or_load('a', {'x'}, loader('a', calls))
+    results.get_or_load('b', {'x'}, loader('b', calls))
+    results.get_or_load('a', {'x'}, loader('a2', calls))  # 'a' becomes the most recent
+    results.get_or_load('c', {'x'}, loader('c', calls))
+    assert results.get_or_load('a', {'x'}, loader('a3', calls)) == 'a'
+    assert results.get_or_load('b', {'x'}, loader('b2', calls)) == 'b2'
+
+
+class FakeDriverConnection:
+    """psycopg2 connection stand-in: select() waits on a socket, notifications are queued by the test."""
+
+    def __init__(self):
+        self.reader, self.writer = socket.socketpair()
+        self.notifies = []
+        self.executed = []
+        self.autocommit = False
+        self.lost = False
+        self.closed = False
+
+    def fileno(self):
+        return self.reader.fileno()
+
+    def rollback(self):
+        pass
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql):
+                connection.executed.append(sql)
+
+        return Cursor()
+
+    def poll(self):
+        self.reader.recv(1024)
+        if self.lost:
+            raise OSError('server closed the connection')
+
+    def send(self, payload):
+        self.notifies.append(SimpleNamespace(payload=payload))
+        self.writer.send(b'.')
+
+    def lose(self):
+        self.lost = True
+        self.writer.send(b'.')
+
+
+class FakeEngine:
+    """Engine whose raw_connection() calls fail or succeed in the given order."""
+
+    dialect = SimpleNamespace(name='postgresql', driver='psycopg2')
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+
+    def raw_connection(self):
+        if not self.outcomes:
+            raise OSError('database is down')
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        driver_connection = outcome
+        return SimpleNamespace(
+            driver_connection=driver_connection,
+            detach=lambda: None,
+            close=lambda: setattr(driver_connection, 'closed', True),
+        )
+
+
+def test_listener_applies_notifications_and_reconnects(clock):
+    first, second = FakeDriverConnection(), FakeDriverConnection()
+    engine = FakeEngine(OSError('connection refused'), first, second)
+    results, calls = SharedCache(), []
+
+    # Bypassed until LISTEN runs, since notifications could be missed
+    assert results.usable(engine) is False
+    wait_for(lambda: results.listening)
+    assert first.executed == [f'LISTEN {cache.CHANNEL}']
+    assert first.autocommit is True
+
+    results.get_or_load('coca', {'product:1'}, loader('coca', calls))
+    results.get_or_load('agua', {'product:2'}, loader('agua', calls))
+    first.send('{"origin": "%s", "tags": ["product:2"]}' % results.origin)  # our own: already evicted
+    first.send('{"origin": "other", "tags": ["product:1"]}')
+    wait_for(lambda: results.notifications == 1)
+    assert results.stats()['entries'] == 1
+    assert results.get_or_load('agua', {'product:2'}, loader('agua2', calls)) == 'agua'
+
+    # Connection lost: bypassed while reconnecting, then everything cached is dropped
+    first.lose()
+    wait_for(lambda: second.executed)
+    wait_for(lambda: results.listening)
+    assert first.closed
+    assert results.stats()['entries'] == 0
+    assert results.usable(engine) is True
+
+    results.get_or_load('agua', {'product:2'}, loader('agua3', calls))
+    second.send('not json')  # unreadable payloads evict everything
+    wait_for(lambda: results.notifications == 2)
+    assert results.stats()['entries'] == 0
+
+
+# --- cached_view / cached_rows through the API ---
+
+@pytest.fixture
+def cached(app):
+    app.config['CACHE_ENABLED'] = True
+    return app.extensions['estok_cache']
+
+
+class SameDatabaseReplica:
+    """Replica router stand-in whose 'replica' is the primary engine itself."""
+
+    enabled = True
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def choose(self):
+        return self.engine
+
+
+def test_writes_evict_cached_searches(cached, client, products):
+    coca = products[0]
+    assert stock_of(client, coca) == 100
+    assert stock_of(client, coca) == 100
+    assert cached.stats()['hits'] == 1
+    response = client.post('/estok/movement', json={'id_produto': coca, 'tipo': 'ENTRADA', 'quantidade': 20})
+    assert response.status_code in (200, 201), response.json
+    assert stock_of(client, coca) == 120
+
+
+def test_dashboard(cached, client, products):
+    coca = products[0]
+    assert client.get('/dashboard/summary').json['sales']['today'] == 0
+    assert client.post('/sales', json={'items': [{'id_produto': coca, 'quantidade': 2, 'valor_unitario': 10}]}).status_code == 201
+    summary = client.get('/dashboard/summary').json
+    assert summary['sales']['today'] == 20.0
+    assert summary['profit']['today'] == 8.0
+    assert client.get('/dashboard/top-products').json[0]['id'] == coca
+
+
+def test_responses_read_from_a_replica_are_not_cached(app, cached, client, products):
+    with app.app_context():
+        app.extensions['estok_replica_router'] = SameDatabaseReplica(main.db.engine)
+    client.get('/dashboard/summary')
+    client.get('/dashboard/summary')
+    assert cached.stats()['entries'] == 0
+    assert cached.stats()['hits'] == 0
+
+    app.extensions['estok_replica_router'].enabled = False
+    client.get('/dashboard/summary')
+    client.get('/dashboard/summary')
+    assert cached.stats()['entries'] == 1
+    assert cached.stats()['hits'] == 1
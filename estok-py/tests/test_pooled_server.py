@@ -0,0 +1,132 @@
+import http.client
+import socket
+import threading
+import time
+
+import pytest
+
+from pooled_server import PooledWSGIServer
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+class Application:
+    """WSGI app: /events streams until end_streams is set, anything else answers 'ok'."""
+
+    def __init__(self):
+        self.end_streams = threading.Event()
+
+    def __call__(self, environ, start_response):
+        if environ['PATH_INFO'] == '/events':
+            start_response('200 OK', [('Content-Type', 'text/event-stream')])
+            return self.stream()
+        start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', '2')])
+        return [b'ok']
+
+    def stream(self):
+        yield b': connected\n\n'
+        self.end_streams.wait(5)
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def serve(app, server_class=PooledWSGIServer, **options):
+        server = server_class('127.0.0.1', 0, app, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield serve
+    for server in servers:
+        server.drain(5)
+        server.server_close()
+
+
+def get(server, path, timeout=5):
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=timeout)
+    connection.request('GET', path)
+    return connection, connection.getresponse()
+
+
+def test_stream_does_not_hold_a_worker(serve):
+    app = Application()
+    server = serve(app, workers=1, max_pending=0, stream_paths=('/events',))
+    stream, events = get(server, '/events?last=1')
+    assert events.status == 200
+    assert events.readline() == b': connected\n'
+    wait_for(lambda: server.in_flight == 0)
+    assert server.streams == 1
+
+    # The only worker is free for other requests while the stream stays open
+    for _ in range(3):
+        connection, response = get(server, '/ping')
+        assert (response.status, response.read()) == (200, b'ok')
+        connection.close()
+        wait_for(lambda: server.in_flight == 0)
+
+    app.end_streams.set()
+    assert events.read() == b'\n'  # the rest of the first event, then the connection closes
+    wait_for(lambda: server.streams == 0)
+    stream.close()
+
+
+def test_other_paths_are_not_detached(serve):
+    app = Application()
+    app.end_streams.set()
+    server = serve(app, workers=1, max_pending=0)
+    connection, response = get(server, '/events')
+    assert response.status == 200
+    response.read()
+    assert server.streams == 0
+    connection.close()
+
+
+def test_idle_connection_gives_its_worker_to_a_waiting_one(serve):
+    server = serve(Application(), workers=1, max_pending=1, keep_alive_timeout=10)
+    idle = socket.create_connection(('127.0.0.1', server.server_port))  # sends nothing
+    wait_for(lambda: server.queued == 0)  # a worker waits on it
+
+    started = time.monotonic()
+    connection, response = get(server, '/ping')
+    assert (response.status, response.read()) == (200, b'ok')
+    assert time.monotonic() - started < 2  # not after the keep-alive timeout
+    assert idle.recv(1) == b''  # closed
+    connection.close()
+    idle.close()
+
+
+def test_idle_connection_is_kept_while_no_one_waits(serve):
+    server = serve(Application(), workers=2, max_pending=0, keep_alive_timeout=10)
+    idle = socket.create_connection(('127.0.0.1', server.server_port))
+    time.sleep(0.3)
+    idle.sendall(b'GET /ping HTTP/1.1\r\nHost: test\r\n\r\n')
+    assert idle.recv(4096).startswith(b'HTTP/1.1 200')
+    idle.close()
+
+
+class RecordingServer(PooledWSGIServer):
+    def _answer_overload(self, request):
+        self.answered_on = threading.current_thread().name
+        super()._answer_overload(request)
+
+
+def test_overload_is_answered_off_the_accept_thread(serve):
+    app = Application()
+    server = serve(app, RecordingServer, workers=1, max_pending=0)
+    stream, events = get(server, '/events')  # not a stream path here: holds the only worker
+    events.readline()
+    connection, response = get(server, '/ping')
+    assert response.status == 503
+    assert response.getheader('Retry-After') == '1'
+    assert server.rejected == 1
+    assert server.answered_on == 'estok-reject'
+    app.end_streams.set()
+    stream.close()
+    connection.close()
@@ -0,0 +1,71 @@
+import pytest
+
+
+def test_batch_update(client, products):
+    coca, agua, _ = products
+    response = client.patch('/products/batch', json={'updates': [
+        {'id': coca, 'preco_venda': 10.5},
+        {'id': agua, 'ativo': False},
+    ]})
+    assert response.status_code == 200, response.json
+    assert response.json['count'] == 2
+    listed = {row['id']: row for row in client.get('/products/all').json['data']}
+    assert listed[coca]['preco_venda'] == 10.5
+    assert agua not in listed
+
+
+def test_batch_update_is_all_or_nothing(client, products):
+    coca = products[0]
+    response = client.patch('/products/batch', json={'updates': [
+        {'id': coca, 'preco_venda': 1.0},
+        {'id': 9999, 'preco_venda': 1.0},
+    ]})
+    assert response.status_code == 404
+    assert response.json['missing'] == [9999]
+    assert client.get('/products', query_string={'q': 'COCA2'}).json['data'][0]['preco_venda'] == 9.9
+
+
+# Values as raw JSON: the test client would encode NaN / Infinity as null
+@pytest.mark.parametrize('field, value', [
+    ('nope', '1'),
+    ('preco_venda', '"abc"'),
+    ('quantidade', 'true'),
+    ('preco_venda', 'NaN'),
+    ('preco_custo', 'Infinity'),
+    ('preco_venda', '-1'),
+    ('quantidade', '-5'),
+])
+def test_batch_update_rejects_invalid_values(client, products, field, value):
+    body = '{"updates": [{"id": %d, "%s": %s}]}' % (products[0], field, value)
+    response = client.patch('/products/batch', data=body, content_type='application/json')
+    assert response.status_code == 400
+
+
+def test_reprice(client, products):
+    coca, agua, _ = products
+    response = client.post('/products/reprice', json={
+        'markup_pct': 50, 'round_to': 0.1, 'filter': {'ids': [coca, agua]}, 'dry_run': True
+    })
+    assert response.status_code == 200, response.json
+    assert response.json['dry_run'] is True
+    prices = {row['id']: row['novo_preco_venda'] for row in response.json['data']}
+    assert prices == {coca: 9.0, agua: 1.5}
+
+    response = client.post('/products/reprice', json={'markup_pct': 50, 'filter': {'ids': [coca]}})
+    assert response.status_code == 200, response.json
+    assert response.json['data'][0]['preco_venda'] == 9.0
+
+
+@pytest.mark.parametrize('body', [
+    '{"markup_pct": NaN}',
+    '{"markup_pct": 10, "round_to": Infinity}',
+    {'markup_pct': 10, 'round_to': 'NaN'},
+    {'markup_pct': 10, 'round_to': 0},
+    {'markup_pct': -150},
+])
+def test_reprice_rejects_invalid_numbers(client, products, body):
+    if isinstance(body, str):
+        response = client.post('/products/reprice', data=body, content_type='application/json')
+    else:
+        response = client.post('/products/reprice', json=body)
+    assert response.status_code == 400
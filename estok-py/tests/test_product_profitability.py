@@ -0,0 +1,9 @@
+from conftest import PERIOD
+
+
+def test_product_profitability(client, sales):
+    coca, agua, _ = sales
+    response = client.get('/reports/product-profitability', query_string=PERIOD)
+    assert response.status_code == 200
+    assert response.json['totals'] == {'receita': 40.0, 'custo': 22.0, 'lucro': 18.0}
+    assert [(row['id_produto'], row['classe']) for row in response.json['data']] == [(coca, 'A'), (agua, 'A')]
@@ -0,0 +1,19 @@
+from datetime import datetime, timedelta, timezone
+
+from conftest import batch_sale
+
+
+def test_reorder_suggestions(client, products):
+    coca = products[0]
+    today = datetime.now(timezone.utc).replace(hour=12, minute=0, second=0, microsecond=0)
+    response = client.post('/sales/batch', json={'sales': [
+        batch_sale(f"r{day}", coca, 15, 9.9, (today - timedelta(days=day)).isoformat()) for day in range(1, 11)
+    ]})
+    assert response.json['created'] == 10, response.json
+
+    response = client.get('/reports/reorder-suggestions')
+    assert response.status_code == 200, response.json
+    suggestion, = response.json['data']
+    assert suggestion['id'] == coca
+    assert suggestion['current_stock'] == -50
+    assert suggestion['suggested_quantity'] > 0
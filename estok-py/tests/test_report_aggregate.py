@@ -0,0 +1,37 @@
+from conftest import PERIOD
+
+
+def aggregate(client, **args):
+    response = client.get('/reports/aggregate', query_string={**PERIOD, **args})
+    assert response.status_code == 200, response.json
+    return response.json['data']
+
+
+def test_aggregate_by_month(client, sales):
+    assert aggregate(client, bucket='month') == [
+        {'bucket': '2024-05-01T00:00:00', 'revenue': 30.0, 'profit': 14.0, 'quantity': 6.0, 'tickets': 2},
+        {'bucket': '2024-06-01T00:00:00', 'revenue': 10.0, 'profit': 4.0, 'quantity': 1.0, 'tickets': 1},
+    ]
+
+
+def test_aggregate_by_week_weekday_and_payment_method(client, sales):
+    rows = aggregate(client, bucket='week', group_by='weekday,payment_method', metrics='revenue,tickets')
+    assert [(row['bucket'], row['weekday'], row['id_forma_pagamento'], row['revenue']) for row in rows] == [
+        ('2024-05-20T00:00:00', 1, 1, 20.0),
+        ('2024-05-20T00:00:00', 2, 2, 10.0),
+        ('2024-06-03T00:00:00', 1, 1, 10.0),
+    ]
+
+
+def test_aggregate_by_hour_and_product(client, sales):
+    coca, agua, _ = sales
+    rows = aggregate(client, bucket='hour', group_by='product', metrics='quantity')
+    assert [(row['bucket'], row['id_produto'], row['quantity']) for row in rows] == [
+        ('2024-05-20T14:00:00', coca, 2.0),
+        ('2024-05-21T09:00:00', agua, 4.0),
+        ('2024-06-03T10:00:00', coca, 1.0),
+    ]
+
+
+def test_aggregate_rejects_unknown_metrics(client):
+    assert client.get('/reports/aggregate', query_string={'metrics': 'nope'}).status_code == 400
@@ -0,0 +1,143 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask, jsonify, request
+
+import report_jobs
+from conftest import PERIOD
+from report_jobs import ReportJobs
+
+
+def wait_until_finished(poll, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = poll()
+        if job['status'] in ('done', 'failed'):
+            return job
+        assert time.monotonic() < deadline, f"job still {job['status']}"
+        time.sleep(0.01)
+
+
+# --- Through the API ---
+
+def poll_job(client, job_id):
+    response = client.get(f'/reports/jobs/{job_id}')
+    assert response.status_code == 200, response.json
+    return response.json
+
+
+def test_report_job_runs_the_report_route(client, sales):
+    response = client.post('/reports/jobs', json={'report': 'sales-by-payment', 'params': PERIOD})
+    assert response.status_code == 202, response.json
+    assert response.headers['Location'] == f"/reports/jobs/{response.json['id']}"
+    job = wait_until_finished(lambda: poll_job(client, response.json['id']))
+    assert job['status'] == 'done', job
+    assert job['result'] == client.get('/reports/sales-by-payment', query_string=PERIOD).json
+
+    again = client.post('/reports/jobs', json={'report': 'sales-by-payment', 'params': PERIOD})
+    assert again.json['id'] == job['id']
+    assert again.json['reused'] is True
+
+
+def test_failing_report_job_is_failed(client):
+    response = client.post('/reports/jobs', json={'report': 'aggregate', 'params': {'metrics': 'nope'}})
+    assert response.status_code == 202, response.json
+    job = wait_until_finished(lambda: poll_job(client, response.json['id']))
+    assert job['status'] == 'failed'
+    assert 'nope' in job['error']
+    assert 'result' not in job
+
+    # Failures are not reused: submitting again retries
+    again = client.post('/reports/jobs', json={'report': 'aggregate', 'params': {'metrics': 'nope'}})
+    assert again.json['id'] != job['id']
+
+
+def test_report_job_validation(client):
+    assert client.post('/reports/jobs', json={'report': 'nope'}).status_code == 400
+    assert client.post('/reports/jobs', json={'report': 'aggregate', 'params': [1]}).status_code == 400
+    assert client.get('/reports/jobs/unknown').status_code == 404
+
+
+# --- ReportJobs on its own ---
+
+@pytest.fixture
+def reports():
+    """An app with a report view echoing its query string, one that raises and one that blocks."""
+    app = Flask(__name__)
+    app.release = threading.Event()
+
+    @app.route('/reports/echo')
+    def echo():
+        return jsonify(dict(request.args))
+
+    @app.route('/reports/broken')
+    def broken():
+        raise RuntimeError('database is down')
+
+    @app.route('/reports/slow')
+    def slow():
+        app.release.wait(5)
+        return jsonify({})
+
+    return app
+
+
+def run(jobs, report, **params):
+    job, created = jobs.submit(report, report, f'/reports/{report}', params)
+    assert created
+    wait_until_finished(job.describe)
+    return job
+
+
+def test_job_runs_in_a_request_context(reports):
+    jobs = ReportJobs(reports)
+    job = run(jobs, 'echo', day='2024-05-20')
+    assert job.status == 'done'
+    assert job.body == b'{"day":"2024-05-20"}\n'
+    assert job.to_json().endswith(b',"result":{"day":"2024-05-20"}\n}')
+
+
+def test_exception_in_the_view_fails_the_job(reports):
+    jobs = ReportJobs(reports)
+    job = run(jobs, 'broken')
+    assert (job.status, job.error) == ('failed', 'database is down')
+    assert jobs.stats()['stored_bytes'] == 0
+
+
+def test_oldest_finished_jobs_are_evicted(reports):
+    jobs = ReportJobs(reports, max_jobs=2)
+    first, second, third = (run(jobs, 'echo', n=str(n)) for n in range(3))
+    assert jobs.get(first.id) is None
+    assert jobs.get(second.id) is second
+    assert jobs.get(third.id) is third
+    assert jobs.stats()['jobs'] == 2
+
+
+def test_stored_bytes_are_bounded(reports):
+    jobs = ReportJobs(reports, max_bytes=40)  # room for one ~30-byte result
+    first = run(jobs, 'echo', n='1' * 20)
+    second = run(jobs, 'echo', n='2' * 20)
+    assert jobs.get(first.id) is None
+    assert jobs.get(second.id) is second
+    assert jobs.stats()['stored_bytes'] == len(second.body)
+
+
+def test_pending_jobs_are_not_evicted(reports):
+    jobs = ReportJobs(reports, max_jobs=1)
+    slow, _ = jobs.submit('slow', 'slow', '/reports/slow', {})
+    done = run(jobs, 'echo', n='1')
+    assert jobs.get(slow.id) is slow
+    assert jobs.get(done.id) is None  # the only finished job goes first
+    reports.release.set()
+    wait_until_finished(slow.describe)
+
+
+def test_finished_jobs_expire(reports, monkeypatch):
+    jobs = ReportJobs(reports, ttl=300)
+    job = run(jobs, 'echo', n='1')
+    later = time.monotonic() + 301
+    monkeypatch.setattr(report_jobs, 'time', SimpleNamespace(monotonic=lambda: later, perf_counter=time.perf_counter))
+    assert jobs.get(job.id) is None
+    assert jobs.stats()['jobs'] == 0
@@ -0,0 +1,88 @@
+import pytest
+
+from conftest import stock_of
+
+
+def sale(product_id, quantity=1, price=9.9, **fields):
+    return {'items': [{'id_produto': product_id, 'quantidade': quantity, 'valor_unitario': price}], **fields}
+
+
+def test_sale_updates_stock(client, products, payment_method):
+    coca = products[0]
+    response = client.post('/sales', json=sale(coca, 3, id_forma_pagamento=payment_method))
+    assert response.status_code == 201, response.json
+    assert response.json['total_value'] == pytest.approx(29.7)
+    assert stock_of(client, coca) == 97
+
+
+def test_sale_validation(client, products):
+    assert client.post('/sales', json={'items': []}).status_code == 400
+    assert client.post('/sales', json=sale(products[0], 0)).status_code == 400
+    assert client.post('/sales', json=sale(9999)).status_code in (400, 404)
+    assert stock_of(client, products[0]) == 100
+
+
+def test_sales_batch_is_idempotent(client, products, payment_method):
+    coca, agua, _ = products
+    body = {'sales': [
+        {**sale(coca, 2), 'chave_idempotencia': 'pdv1-1', 'id_forma_pagamento': payment_method,
+         'data_venda': '2024-05-20T14:30:00'},
+        {**sale(agua, 1, 2.5), 'chave_idempotencia': 'pdv1-2'},
+    ]}
+    response = client.post('/sales/batch', json=body)
+    assert response.status_code == 200, response.json
+    assert [result['status'] for result in response.json['results']] == ['created', 'created']
+
+    response = client.post('/sales/batch', json=body)
+    assert [result['status'] for result in response.json['results']] == ['duplicate', 'duplicate']
+    assert stock_of(client, coca) == 98
+    assert stock_of(client, agua) == 49
+
+
+def test_sales_batch_isolates_bad_sales(client, products):
+    coca = products[0]
+    response = client.post('/sales/batch', json={'sales': [
+        {**sale(coca), 'chave_idempotencia': 'a'},
+        {**sale(9999), 'chave_idempotencia': 'b'},
+        {**sale(coca), 'chave_idempotencia': 'c'},
+    ]})
+    assert response.status_code == 200, response.json
+    assert [result['status'] for result in response.json['results']] == ['created', 'error', 'created']
+    assert stock_of(client, coca) == 98
+
+
+def test_sales_batch_rejects_malformed_bodies(client):
+    assert client.post('/sales/batch', json=[1]).status_code == 400
+    assert client.post('/sales/batch', json={'sales': 'x'}).status_code == 400
+
+
+@pytest.mark.parametrize('body', [
+    '[1]',
+    '{"items": "abc"}',
+    '{"items": [1]}',
+    '{"items": [{"id_produto": 1, "quantidade": NaN, "valor_unitario": 9.9}]}',
+    '{"items": [{"id_produto": 1, "quantidade": 1, "valor_unitario": Infinity}]}',
+])
+def test_sale_rejects_malformed_items(client, products, body):
+    # Raw JSON: the test client would encode NaN / Infinity as null
+    response = client.post('/sales', data=body, content_type='application/json')
+    assert response.status_code == 400, response.data
+    assert stock_of(client, products[0]) == 100
+
+
+def test_sales_batch_reports_malformed_sales_one_by_one(client, products):
+    coca = products[0]
+    body = ('{"sales": ['
+            '{"chave_idempotencia": "a", "items": [{"id_produto": %(coca)d, "quantidade": 1}]},'
+            '{"chave_idempotencia": "b", "items": [1]},'
+            '{"chave_idempotencia": "c", "items": "abc"},'
+            '"d",'
+            '{"chave_idempotencia": "e", "items": [{"id_produto": %(coca)d, "quantidade": NaN}]},'
+            '{"chave_idempotencia": "f", "items": [{"id_produto": %(coca)d, "quantidade": 2}]}'
+            ']}') % {'coca': coca}
+    response = client.post('/sales/batch', data=body, content_type='application/json')
+    assert response.status_code == 200, response.data
+    assert [result['status'] for result in response.json['results']] == [
+        'created', 'error', 'error', 'error', 'error', 'created'
+    ]
+    assert stock_of(client, coca) == 97
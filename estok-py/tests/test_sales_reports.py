@@ -0,0 +1,44 @@
+import time
+
+import pytest
+
+import main
+from conftest import PERIOD
+
+
+@pytest.fixture(params=[False, True], ids=['plain', 'partitioned'])
+def partitioned(request, app, monkeypatch):
+    """
+    Run with and without PARTITIONED_SALES: the partition-aware joins must give
+    the same rows (SQLite has no partitions; the partition check is skipped).
+    """
+    monkeypatch.setitem(app.config, 'PARTITIONED_SALES', request.param)
+    monkeypatch.setattr(main, '_partitions_checked_at', time.monotonic())
+    return request.param
+
+
+def test_sale_items_join_repeats_the_period_when_partitioned(app, partitioned):
+    with app.app_context():
+        condition = str(main.sale_items_join('2024-05-01', '2024-06-30'))
+    assert condition.count('itens_venda.data_venda') == (3 if partitioned else 0)
+
+
+def test_sales_by_payment(client, sales, partitioned):
+    response = client.get('/reports/sales-by-payment', query_string=PERIOD)
+    assert response.status_code == 200
+    assert response.json['total_faturamento'] == 40.0
+    assert {row['id']: row['total_vendas'] for row in response.json['data']} == {1: 30.0, 2: 10.0}
+
+
+def test_sales_details(client, sales, partitioned):
+    response = client.get('/reports/sales-details', query_string={**PERIOD, 'id_forma_pagamento': 1})
+    assert response.status_code == 200
+    assert [(row['data_venda'], row['items_count']) for row in response.json['data']] == [
+        ('2024-06-03T10:00:00', 1.0), ('2024-05-20T14:30:00', 2.0)
+    ]
+
+
+def test_aggregate_by_month(client, sales, partitioned):
+    response = client.get('/reports/aggregate', query_string={**PERIOD, 'bucket': 'month', 'metrics': 'revenue'})
+    assert response.status_code == 200, response.json
+    assert [row['revenue'] for row in response.json['data']] == [30.0, 10.0]
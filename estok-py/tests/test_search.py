@@ -0,0 +1,15 @@
+def search(client, term, **args):
+    return client.get('/products', query_string={'q': term, **args}).json['data']
+
+
+def test_search_by_barcode_code_and_description(client, products):
+    coca, agua, pao = products
+    assert [row['id'] for row in search(client, '7894900011517')] == [coca]
+    assert [row['id'] for row in search(client, 'PAO')][0] == pao
+    assert coca in [row['id'] for row in search(client, 'cola')]
+
+
+def test_similar_search_ignores_accents_and_typos(client, products):
+    coca, agua, pao = products
+    assert search(client, 'agua mineal', mode='similar')[0]['id'] == agua
+    assert search(client, 'coca kola', mode='similar')[0]['id'] == coca
@@ -0,0 +1,45 @@
+import logging
+from argparse import Namespace
+
+import pytest
+
+import server_cli
+
+
+class Started(Exception):
+    """Raised by the server stand-in: run_server has done its startup checks."""
+
+
+def start(host, port, app, **options):
+    raise Started(options)
+
+
+def run(app, monkeypatch, caplog, **args):
+    monkeypatch.setattr(server_cli, 'build_app', lambda config: app)
+    args = Namespace(**{**dict(host='127.0.0.1', port=0, workers=16, max_pending=None, pool_size=None,
+                               max_overflow=10, pool_timeout=30, pool_recycle=1800, keep_alive=15,
+                               warm_up=False), **args})
+    with caplog.at_level(logging.INFO, logger='estok.server'), pytest.raises(Started) as started:
+        server_cli.run_server(args, start)
+    warnings = [record.getMessage() for record in caplog.records if record.levelno == logging.WARNING]
+    return started.value.args[0], warnings
+
+
+def test_default_lanes_fit_the_default_workers(app, monkeypatch, caplog):
+    app.config['ADMISSION_ENABLED'] = True
+    options, warnings = run(app, monkeypatch, caplog)
+    assert warnings == []
+    assert options['stream_paths'] == ('/events',)
+
+
+def test_lanes_beyond_the_workers_are_reported(app, monkeypatch, caplog):
+    app.config['ADMISSION_ENABLED'] = True
+    _, warnings = run(app, monkeypatch, caplog, workers=8)
+    assert len(warnings) == 1
+    assert 'checkout has only 3 reserved' in warnings[0]
+
+
+def test_no_pending_slots_are_reported(app, monkeypatch, caplog):
+    _, warnings = run(app, monkeypatch, caplog, max_pending=0)
+    assert len(warnings) == 1
+    assert 'idle connections keep their worker' in warnings[0]
@@ -0,0 +1,123 @@
+"""
+Server manager logic, without a display: the Tk root and widgets are stand-ins
+that record what the manager does to them.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+server_gui = pytest.importorskip('server_gui')
+
+
+class FakeRoot:
+    """root.after() queues the call; run_pending() runs it as the Tk loop would."""
+
+    def __init__(self):
+        self.pending = []
+        self.ready = threading.Event()
+
+    def after(self, delay, callback, *args):
+        self.pending.append((callback, args))
+        self.ready.set()
+        return len(self.pending)
+
+    def after_cancel(self, job):
+        pass
+
+    def run_pending(self, timeout=5):
+        assert self.ready.wait(timeout)
+        while self.pending:
+            callback, args = self.pending.pop(0)
+            callback(*args)
+
+
+class FakeWidget:
+    def __init__(self):
+        self.options = {}
+
+    def config(self, **options):
+        self.options.update(options)
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    shown = []
+    monkeypatch.setattr(server_gui, 'messagebox', SimpleNamespace(
+        showinfo=lambda *args: None, showerror=lambda title, message: shown.append(message)
+    ))
+    manager = server_gui.ServerManagerApp.__new__(server_gui.ServerManagerApp)
+    manager.root = FakeRoot()
+    manager.executor = ThreadPoolExecutor(max_workers=1)
+    manager.errors_shown = shown
+    manager.app = None
+    manager.server_app = None
+    manager.server_running = False
+    manager.flask_server = None
+    manager.health_job = None
+    for widget in ('btn_start', 'btn_stop', 'btn_test_db', 'btn_init_db', 'btn_snapshot',
+                   'status_indicator', 'health_detail'):
+        setattr(manager, widget, FakeWidget())
+    yield manager
+    manager.executor.shutdown()
+
+
+def test_background_task_result(manager):
+    calls = []
+    manager.run_in_background(lambda: 42, lambda result, error: calls.append((result, error)))
+    manager.root.run_pending()
+    assert calls == [(42, None)]
+
+
+def test_background_task_error_reaches_on_done(manager):
+    calls = []
+
+    def task():
+        raise RuntimeError('database is down')
+
+    manager.run_in_background(task, lambda result, error: calls.append((result, str(error))))
+    manager.root.run_pending()
+    assert calls == [(None, 'database is down')]
+
+
+def test_failed_db_tool_reenables_the_buttons(manager):
+    def task():
+        raise RuntimeError('connection refused')
+
+    manager.set_db_tools_busy(True)
+    manager.run_in_background(task, manager.db_connection_tested)
+    manager.root.run_pending()
+    assert manager.btn_test_db.options['state'] == server_gui.tk.NORMAL
+    assert manager.btn_init_db.options['state'] == server_gui.tk.NORMAL
+    assert manager.errors_shown == ["Connection Failed:\nconnection refused"]
+
+
+def test_failed_warm_up_still_starts_the_server(manager, monkeypatch):
+    launched = []
+    monkeypatch.setattr(manager, 'launch_server', launched.append)
+    app = object()
+
+    def warm_up():
+        raise RuntimeError('database is down')
+
+    manager.run_in_background(warm_up, lambda result, error: manager.warm_up_finished(app, result, error))
+    manager.root.run_pending()
+    assert launched == [app]
+
+
+def test_shutdown_drains_the_app_that_was_started(manager):
+    drained, closed = [], []
+    started = SimpleNamespace(extensions={
+        'estok_sales_writer': SimpleNamespace(drain=lambda timeout: drained.append(timeout) or True),
+        'estok_event_broker': SimpleNamespace(close=lambda: closed.append(True)),
+    })
+    manager.server_app = started
+    manager.app = None  # rebuilt after a configuration save
+    manager.flask_server = SimpleNamespace(shutdown=lambda: None)
+    manager._shutdown_thread()
+    manager.root.run_pending()
+    assert drained == [30]
+    assert closed == [True]
+    assert manager.server_app is None
+    assert manager.status_indicator.options['text'] == 'STOPPED'
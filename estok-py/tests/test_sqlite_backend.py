@@ -0,0 +1,66 @@
+import threading
+
+import main
+from conftest import stock_of
+
+
+def test_create_app_on_sqlite_disables_postgresql_only_features(app):
+    assert app.config['PARTITIONED_SALES'] is False
+    assert app.config['REPORT_ROLLUP_ENABLED'] is False
+    with app.app_context():
+        assert main.db.engine.dialect.name == 'sqlite'
+
+
+def test_connections_use_wal_and_the_configured_begin(app):
+    assert app.config['SQLITE_BEGIN'] == 'BEGIN'
+    assert app.config['SQLITE_WRITE_BEGIN'] == 'BEGIN IMMEDIATE'
+    with app.app_context():
+        with main.db.engine.connect() as conn:
+            assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+            assert conn.exec_driver_sql('PRAGMA foreign_keys').scalar() == 1
+
+
+def test_seeded_payment_methods(client):
+    names = {method['nome'] for method in client.get('/payment-methods').json}
+    assert {'Dinheiro', 'Cartão', 'Pix'} <= names
+
+
+def sale(product_id, payment_method):
+    return {'items': [{'id_produto': product_id, 'quantidade': 1, 'valor_unitario': 9.9}],
+            'id_forma_pagamento': payment_method}
+
+
+def test_concurrent_sales(app, products, payment_method):
+    """
+    Parallel checkouts on one database file must all commit (no 'database is
+    locked'): a sale reads before it writes, which a deferred BEGIN cannot
+    upgrade to a write while another checkout holds the lock.
+    """
+    coca = products[0]
+    statuses = []
+
+    def checkout():
+        client = app.test_client()
+        for _ in range(5):
+            statuses.append(client.post('/sales', json=sale(coca, payment_method)).status_code)
+
+    threads = [threading.Thread(target=checkout) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert statuses == [201] * 40
+    assert stock_of(app.test_client(), coca) == 60
+
+
+def test_open_read_does_not_block_reads_or_checkouts(app, client, products, payment_method):
+    """Reads begin deferred: a long report (an open read transaction) holds no write lock."""
+    with app.app_context():
+        engine = main.db.engine
+    with engine.connect() as report:
+        report.exec_driver_sql('SELECT count(*) FROM vendas').scalar()
+        assert report.in_transaction()
+        assert client.get('/products/all').status_code == 200
+        assert client.post('/sales', json=sale(products[0], payment_method)).status_code == 201
+        assert client.post('/estok/movement', json={'id_produto': products[1], 'tipo': 'ENTRADA',
+                                                    'quantidade': 5}).status_code == 201
@@ -0,0 +1,153 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+from flask import Flask
+
+from conftest import stock_of
+from write_pipeline import GroupCommitWriter
+
+
+class Recorder:
+    """process_batch stand-in: records each batch and can block it or fail it."""
+
+    def __init__(self, fail=lambda items: False):
+        self.fail = fail
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        self.started.set()
+        self.release.wait(5)
+        if self.fail(items):
+            raise RuntimeError(f"failed: {items}")
+        return [f"ok {item}" for item in items]
+
+
+def writer_for(process_batch, window_ms=5):
+    return GroupCommitWriter(Flask(__name__), process_batch, window_ms=window_ms)
+
+
+def test_items_arriving_together_share_one_commit():
+    recorder = Recorder()
+    writer = writer_for(recorder, window_ms=200)
+    futures = [writer.submit(item) for item in 'abc']
+    assert [future.result(5) for future in futures] == ['ok a', 'ok b', 'ok c']
+    assert recorder.batches == [['a', 'b', 'c']]
+    assert (writer.batches, writer.items) == (1, 3)
+
+
+def test_cancelled_item_is_never_written():
+    recorder = Recorder()
+    recorder.release.clear()
+    writer = writer_for(recorder)
+    first = writer.submit('a')
+    assert recorder.started.wait(5)  # 'a' is being written: the next item stays queued
+    queued = writer.submit('b')
+    assert queued.cancel()
+    assert not first.cancel()  # already running
+    recorder.release.set()
+    assert writer.drain(5)
+    assert first.result() == 'ok a'
+    assert queued.cancelled()
+    assert recorder.batches == [['a']]
+
+
+def test_drain_waits_for_pending_items():
+    recorder = Recorder()
+    recorder.release.clear()
+    writer = writer_for(recorder)
+    future = writer.submit('a')
+    assert recorder.started.wait(5)
+    assert writer.drain(timeout=0.05) is False
+    assert not future.done()
+    recorder.release.set()
+    assert writer.drain(timeout=5) is True
+    assert future.result() == 'ok a'
+    assert writer.drain(timeout=0) is True
+
+
+def test_failed_batch_is_retried_item_by_item():
+    # A transient error (the first transaction fails): every item commits on its own retry
+    calls = []
+    recorder = Recorder(fail=lambda items: calls.append(items) or len(calls) == 1)
+    writer = writer_for(recorder, window_ms=200)
+    futures = [writer.submit(item) for item in 'abc']
+    assert [future.result(5) for future in futures] == ['ok a', 'ok b', 'ok c']
+    assert recorder.batches == [['a', 'b', 'c'], ['a'], ['b'], ['c']]
+
+
+def test_bad_item_fails_alone():
+    recorder = Recorder(fail=lambda items: 'bad' in items)
+    writer = writer_for(recorder, window_ms=200)
+    futures = [writer.submit(item) for item in ('a', 'bad', 'c')]
+    assert futures[0].result(5) == 'ok a'
+    with pytest.raises(RuntimeError):
+        futures[1].result(5)
+    assert futures[2].result(5) == 'ok c'
+    assert writer.drain(5)
+
+
+class StuckWriter:
+    """sales_writer stand-in whose items never finish: queued (cancellable) or already running."""
+
+    def __init__(self, running):
+        self.running = running
+        self.items = []
+
+    def submit(self, item):
+        self.items.append(item)
+        future = Future()
+        if self.running:
+            future.set_running_or_notify_cancel()
+        return future
+
+
+@pytest.fixture
+def group_commit(app):
+    app.config.update(GROUP_COMMIT_ENABLED=True, GROUP_COMMIT_TIMEOUT=5)
+    return app
+
+
+def sale(product_id, **fields):
+    return {'items': [{'id_produto': product_id, 'quantidade': 1, 'valor_unitario': 9.9}], **fields}
+
+
+def test_group_commit_sale(group_commit, client, products):
+    coca = products[0]
+    response = client.post('/sales', json=sale(coca, chave_idempotencia='pdv-1'))
+    assert response.status_code == 201, response.json
+    response = client.post('/sales', json=sale(coca, chave_idempotencia='pdv-1'))
+    assert response.status_code == 200
+    assert response.json['message'] == 'Sale already registered'
+    assert client.post('/sales', json=sale(9999)).status_code == 400
+    assert stock_of(client, coca) == 99
+    assert group_commit.extensions['estok_sales_writer'].drain(5)
+
+
+def test_group_commit_timeout_while_queued_is_503(group_commit, client, products):
+    group_commit.config['GROUP_COMMIT_TIMEOUT'] = 0.05
+    group_commit.extensions['estok_sales_writer'] = StuckWriter(running=False)
+    response = client.post('/sales', json=sale(products[0]))
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_group_commit_timeout_while_writing_is_504_with_a_key(group_commit, client, products):
+    group_commit.config['GROUP_COMMIT_TIMEOUT'] = 0.05
+    real_writer = group_commit.extensions['estok_sales_writer']
+    stuck = group_commit.extensions['estok_sales_writer'] = StuckWriter(running=True)
+    response = client.post('/sales', json=sale(products[0]))
+    assert response.status_code == 504
+    key = response.json['chave_idempotencia']
+    assert stuck.items[0]['chave_idempotencia'] == key
+
+    # Resending with the key registers the sale once
+    group_commit.extensions['estok_sales_writer'] = real_writer
+    group_commit.config['GROUP_COMMIT_TIMEOUT'] = 5
+    assert client.post('/sales', json=sale(products[0], chave_idempotencia=key)).status_code == 201
+    assert client.post('/sales', json=sale(products[0], chave_idempotencia=key)).status_code == 200
+    assert stock_of(client, products[0]) == 99
@@ -0,0 +1,117 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class GroupCommitWriter:
+    """
+    Single writer thread that coalesces concurrent write requests into one transaction.
+
+    Request threads call submit() and wait on the returned Future. The writer takes
+    everything that arrives within `window_ms` of the first pending item (up to
+    `max_batch` items) and hands it to `process_batch(items)`, which must write and
+    COMMIT, returning one result per item. Futures are resolved only after that commit,
+    so a request is never acknowledged before its data is durable.
+
+    If a coalesced batch fails, its items are retried one by one in separate
+    transactions, so one bad write cannot fail its neighbours.
+
+    A request that stops waiting can cancel() its Future: an item still queued is
+    then dropped, never written. drain() waits for everything submitted so far,
+    so a stopping server does not lose queued writes (the thread is a daemon).
+    """
+
+    def __init__(self, app, process_batch, window_ms=5, max_batch=50):
+        self.app = app
+        self.process_batch = process_batch
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, int(max_batch))
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition()
+        self._pending = 0  # submitted items not yet committed, failed or cancelled
+        # Counters for monitoring
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item):
+        """Queue an item for the next group commit. Returns a Future with its result."""
+        self._ensure_started()
+        future = Future()
+        with self._idle:
+            self._pending += 1
+        self._queue.put((item, future))
+        return future
+
+    def drain(self, timeout=None):
+        """Wait until every submitted item is committed, failed or cancelled. False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def _finished(self, count):
+        with self._idle:
+            self._pending -= count
+            if self._pending == 0:
+                self._idle.notify_all()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            collected = self._collect()
+            # From here on the items cannot be cancelled any more
+            batch = [entry for entry in collected if entry[1].set_running_or_notify_cancel()]
+            try:
+                self._write(batch)
+            finally:
+                self._finished(len(collected))
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            self._commit(batch)
+        except Exception:
+            if len(batch) == 1:
+                return
+            for entry in batch:
+                try:
+                    self._commit([entry])
+                except Exception:
+                    pass
+
+    def _commit(self, batch):
+        """Process and commit a batch; resolves futures, re-raises so the caller can retry."""
+        items = [item for item, _ in batch]
+        try:
+            with self.app.app_context():
+                results = self.process_batch(items)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+            raise
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)